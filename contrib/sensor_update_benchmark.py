@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+import os
+import sys
+import time
+import argparse
+
+# Micro benchmark for the sensor update path, without hardware. Run it from the TerrariumPI folder:
+#   python contrib/sensor_update_benchmark.py
+# It measures the time per sensor update when the device data is already in the sensor cache, so only the processing overhead is measured.
+# It only uses the sensor cache and update(), which every version has. Run it on different versions to compare.
+# Use --log-level INFO to include the cost of the 'Updated sensor' log lines.
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import terrariumLogging
+from terrariumSensor import terrariumSensorSource, terrariumSensorCache
+
+class BenchmarkSensor(terrariumSensorSource):
+  TYPE = 'benchmark'
+  VALID_SENSOR_TYPES = ['temperature','humidity']
+
+  def load_data(self):
+    return {'temperature' : 24.5, 'humidity' : 65.0}
+
+def run(sensors, rounds):
+  cache = terrariumSensorCache()
+  starttime = time.time()
+  for counter in range(rounds):
+    data = {'temperature' : 24.5 + (counter % 2) * 0.1, 'humidity' : 65.0}
+    for sensor in sensors:
+      # Fresh device data, like the first sensor of a device just read it
+      cache.set_sensor_data(sensor.get_sensor_cache_key(), data, 30)
+      sensor.update()
+      sensor.get_current()
+      sensor.get_alarm()
+
+  return time.time() - starttime
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='TerrariumPI sensor update micro benchmark')
+  parser.add_argument('--sensors', type=int, default=50, help='amount of sensors')
+  parser.add_argument('--rounds', type=int, default=200, help='amount of updates per sensor')
+  parser.add_argument('--unit', default='C', help='temperature indicator, like C or F')
+  parser.add_argument('--log-level', default='WARNING', help='log level of the sensor module')
+  arguments = parser.parse_args()
+
+  terrariumLogging.logging.getLogger('terrariumSensor').setLevel(arguments.log_level.upper())
+
+  indicator = lambda sensor_type: arguments.unit if 'temperature' == sensor_type else '%'
+  sensors = []
+  for counter in range(arguments.sensors):
+    sensor = BenchmarkSensor(None, 'temperature' if counter % 2 == 0 else 'humidity', 'benchmark{}'.format(counter), 'Benchmark {}'.format(counter), indicator)
+    sensor.set_alarm_min(20)
+    sensor.set_alarm_max(30)
+    sensors.append(sensor)
+
+  # Warm up
+  run(sensors, 5)
+  duration = run(sensors, arguments.rounds)
+  updates = arguments.sensors * arguments.rounds
+  print('{} updates of {} sensors in {:.3f} seconds: {:.2f} microseconds per update'.format(updates, arguments.sensors, duration, duration / updates * 1000000.0))
@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+import sys
+import json
+import random
+
+# This is just an example script for a long running script sensor. Use it as address 'worker:/path/to/sensor_worker.py'
+# TerrariumPI starts this script once and sends one JSON request per line, like {"id": 1, "type": "temperature"}
+# Every request is answered with one JSON line with the same id and a 'value', or an 'error' message.
+# Set up your hardware once here, before the loop....
+
+for line in iter(sys.stdin.readline, ''):
+  request = json.loads(line)
+  response = {'id' : request['id']}
+
+  if 'temperature' == request['type']:
+    # Call your code here....
+    response['value'] = round(random.uniform(20,30),2)
+  elif 'humidity' == request['type']:
+    # Call your code here....
+    response['value'] = round(random.uniform(50,80),2)
+  else:
+    response['error'] = 'Unsupported sensor type {}'.format(request['type'])
+
+  sys.stdout.write(json.dumps(response) + '\n')
+  sys.stdout.flush()
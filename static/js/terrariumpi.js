@@ -1964,7 +1964,10 @@ function update_sensor(data,) {
       try {
         if (field_value === '' || field_value === null) {
           var value = data[name];
-          if (!$.isArray(value)) {
+          if (value === null) {
+            // Optional fields without a value, like the sensor filter
+            value = '';
+          } else if (!$.isArray(value)) {
             // Cast explicit to string to fix dropdown options
             value += '';
           }
@@ -2,15 +2,129 @@
 import terrariumLogging
 logger = terrariumLogging.logging.getLogger(__name__)
 
+try:
+  import thread as _thread
+except ImportError as ex:
+  import _thread
+
+import threading
+
 from gpiozero import MCP3008
 from gevent import sleep
+from time import time
 
 from terrariumUtils import terrariumUtils
 from terrariumSensor import terrariumSensorSource
+from terrariumSensorFilter import terrariumRingBuffer
+
+class terrariumAnalogSampler(object):
+  # Reads one MCP3008 channel continuously in the background into a ring buffer. The latest samples are available without waiting
+  SAMPLE_INTERVAL = 0.2
+  BUFFER_SIZE = 50
+  # Stop sampling when the values are not used for X seconds
+  IDLE_TIMEOUT = 10 * 60
+
+  __samplers = {}
+  __samplers_lock = threading.Lock()
+
+  def __init__(self, channel, device = 0, sample_interval = None, buffer_size = None):
+    self.__channel = int(channel)
+    self.__device = int(device)
+    self.__sample_interval = terrariumAnalogSampler.SAMPLE_INTERVAL if sample_interval is None else float(sample_interval)
+    self.__buffer = terrariumRingBuffer(terrariumAnalogSampler.BUFFER_SIZE if buffer_size is None else buffer_size)
+    self.__sensor = None
+    self.__running = False
+    self.__generation = 0
+    self.__last_used = time()
+    self.__lock = threading.Lock()
+
+  @staticmethod
+  def get_sampler(channel, device = 0, sample_interval = None, buffer_size = None):
+    key = (int(channel),int(device))
+    with terrariumAnalogSampler.__samplers_lock:
+      if key not in terrariumAnalogSampler.__samplers:
+        terrariumAnalogSampler.__samplers[key] = terrariumAnalogSampler(channel,device,sample_interval,buffer_size)
+
+      return terrariumAnalogSampler.__samplers[key]
+
+  def sample(self):
+    with self.__lock:
+      if self.__sensor is None:
+        self.__sensor = MCP3008(channel=self.__channel, device=self.__device)
+
+      value = self.__sensor.value
+      if terrariumUtils.is_float(value):
+        self.__buffer.append(float(value))
+
+  def start(self):
+    if not self.__running:
+      self.__running = True
+      # A loop that is still sleeping after stop() sees the new generation and exits, so there is only one loop sampling
+      self.__generation += 1
+      _thread.start_new_thread(self.__sample_loop, (self.__generation,))
+
+  def stop(self):
+    self.__running = False
+
+  def __sample_loop(self, generation):
+    logger.debug('Start sampling MCP3008 channel {} on SPI device {} every {} seconds'.format(self.__channel,self.__device,self.__sample_interval))
+    while self.__running and generation == self.__generation and time() - self.__last_used < terrariumAnalogSampler.IDLE_TIMEOUT:
+      try:
+        self.sample()
+      except Exception as ex:
+        logger.warning('Error sampling MCP3008 channel {} on SPI device {}. Error message: {}'.format(self.__channel,self.__device,ex))
+        self.__close()
+        sleep(10)
+
+      sleep(self.__sample_interval)
+
+    if generation != self.__generation:
+      # Restarted, the new loop keeps using the sensor and the samples
+      return
+
+    self.__running = False
+    self.__close()
+    self.__buffer.clear()
+    logger.debug('Stopped sampling MCP3008 channel {} on SPI device {}'.format(self.__channel,self.__device))
+
+  def __close(self):
+    with self.__lock:
+      if self.__sensor is not None:
+        try:
+          self.__sensor.close()
+        except Exception as ex:
+          pass
+
+        self.__sensor = None
+
+  def get_values(self, minimal = 3):
+    self.__last_used = time()
+    self.start()
+    # Just started, take the first samples right away
+    for counter in range(minimal - len(self.__buffer)):
+      self.sample()
+
+    return self.__buffer.values()
+
+  @staticmethod
+  def trimmed_mean(values, trim = 0.1):
+    # Average without the lowest and highest X part of the values. At least the min and max values are excluded
+    values = sorted(values)
+    trim = max(1,int(len(values) * trim))
+    if len(values) <= trim * 2:
+      return terrariumRingBuffer.median(values)
+
+    values = values[trim:-trim]
+    return sum(values) / len(values)
 
 class terrariumAnalogSensor(terrariumSensorSource):
   TYPE = None
   VALID_SENSOR_TYPES = []
+  # Use 'median' for sensors with occasional spikes
+  AVERAGE = 'trimmed_mean'
+  # Sample rate and amount of samples. None is the terrariumAnalogSampler default
+  SAMPLE_INTERVAL = None
+  BUFFER_SIZE = None
 
   def load_data(self):
     data = None
@@ -18,21 +132,18 @@ class terrariumAnalogSensor(terrariumSensorSource):
     if self.get_address() is not None and len(self.get_address().split(',')) >= 1:
       address = self.get_address().split(',')
       data_pin = address[0]
-      device = 0 if len(address[0]) == 1 else address[1]
-
-      sensor = MCP3008(channel=int(data_pin), device=int(device))
-      values = []
-      for counter in range(5):
-        value = sensor.value
-        if terrariumUtils.is_float(value):
-          values.append(float(value))
-        sleep(0.2)
-
-      sensor = None
-      # sort values from low to high
-      values.sort()
-      # Calculate average. Exclude the min and max value. And therefore devide by 3
-      data = round((sum(values[1:-1]) / (len(values)-2)),5)
+      device = 0 if len(address) == 1 else address[1]
+
+      try:
+        values = terrariumAnalogSampler.get_sampler(data_pin,device,self.SAMPLE_INTERVAL,self.BUFFER_SIZE).get_values()
+        if len(values) > 0:
+          if 'median' == self.AVERAGE:
+            data = round(terrariumRingBuffer.median(values),5)
+          else:
+            data = round(terrariumAnalogSampler.trimmed_mean(values),5)
+
+      except Exception as ex:
+        logger.warning('Error getting new data from {} sensor \'{}\'. Error message: {}'.format(self.get_type(),self.get_name(),ex))
 
     return data
 
@@ -2,8 +2,17 @@
 import terrariumLogging
 logger = terrariumLogging.logging.getLogger(__name__)
 
+try:
+  import thread as _thread
+except ImportError as ex:
+  import _thread
+
+import threading
+from time import time
 from struct import unpack
-from bluepy.btle import Scanner, Peripheral
+from binascii import unhexlify
+from gevent import sleep
+from bluepy.btle import Scanner, Peripheral, DefaultDelegate
 
 try:
   from btlewrap.bluepy import BluepyBackend
@@ -12,10 +21,186 @@ except Exception as ex:
   pass
 
 from terrariumSensor import terrariumSensorSource, terrariumSensorCache
+from terrariumUtils import terrariumSingleton
+
+class terrariumBluetoothScanDelegate(DefaultDelegate):
+  def __init__(self, scanner):
+    DefaultDelegate.__init__(self)
+    self.__scanner = scanner
+
+  def handleDiscovery(self, device, is_new_device, is_new_data):
+    if is_new_data:
+      self.__scanner.process_advertisement(device)
+
+class terrariumBluetoothScanner(terrariumSingleton):
+  # One passive scanner for all Bluetooth sensors. Xiaomi devices broadcast their measurements in MiBeacon advertisements,
+  # which are decoded and put in the sensor cache as they come in. So the sensors do not have to connect every update
+  DEFAULT_ADAPTER = 0
+  SCANTIME = 10
+  # Retry time after the adapter failed
+  RETRY_TIMEOUT = 60
+  # Values from advertisements are used for X seconds
+  ADVERT_TIMEOUT = 5 * 60
+
+  SERVICE_DATA_16B = 22
+  MIBEACON_UUID = bytearray([0x95,0xfe])
+
+  def __init__(self):
+    self.__sensors = {}
+    self.__data = {}
+    self.__data_lock = threading.Lock()
+    self.__running = False
+    # Hold this lock for any other use of the Bluetooth adapter, like connecting to a device
+    self.lock = threading.RLock()
+    logger.debug('Initialized Bluetooth scanner')
+
+  def register(self, sensor):
+    with self.__data_lock:
+      address = sensor.get_address().lower()
+      if address not in self.__sensors:
+        self.__sensors[address] = {}
+
+      self.__sensors[address][sensor.get_sensor_type()] = sensor
+
+    if not self.__running:
+      self.__running = True
+      _thread.start_new_thread(self.__scan_loop, ())
+
+  def unregister(self, sensor):
+    with self.__data_lock:
+      address = sensor.get_address().lower()
+      if self.__sensors.get(address,{}).get(sensor.get_sensor_type()) is sensor:
+        del(self.__sensors[address][sensor.get_sensor_type()])
+        if len(self.__sensors[address]) == 0:
+          del(self.__sensors[address])
+
+      # The scan loop will stop when there are no sensors left
+      self.__running = self.__running and len(self.__sensors) > 0
+
+  def __scan_loop(self):
+    logger.info('Starting passive Bluetooth scanner on adapter hci{}'.format(terrariumBluetoothScanner.DEFAULT_ADAPTER))
+    scanner = Scanner(terrariumBluetoothScanner.DEFAULT_ADAPTER).withDelegate(terrariumBluetoothScanDelegate(self))
+    while self.__running:
+      try:
+        with self.lock:
+          scanner.clear()
+          scanner.start(passive=True)
+          scanner.process(terrariumBluetoothScanner.SCANTIME)
+          scanner.stop()
+
+        # Give waiting active connections a chance
+        sleep(0.1)
+
+      except Exception as ex:
+        logger.warning('Passive Bluetooth scanning failed. Retry in {} seconds. Error message: {}'.format(terrariumBluetoothScanner.RETRY_TIMEOUT,ex))
+        try:
+          scanner.stop()
+        except Exception as ex:
+          pass
+
+        sleep(terrariumBluetoothScanner.RETRY_TIMEOUT)
+
+    logger.info('Stopped passive Bluetooth scanner')
+
+  def scan(self, adapter, scantime):
+    # Active scan for discovering new devices. Advertisements seen during this scan are used as well
+    with self.lock:
+      return Scanner(adapter).withDelegate(terrariumBluetoothScanDelegate(self)).scan(scantime)
+
+  def process_advertisement(self, device):
+    service_data = device.getValueText(terrariumBluetoothScanner.SERVICE_DATA_16B)
+    if service_data is None:
+      return
+
+    try:
+      payload = bytearray(unhexlify(service_data))
+    except Exception as ex:
+      return
+
+    if payload[0:2] != terrariumBluetoothScanner.MIBEACON_UUID:
+      return
+
+    data = terrariumBluetoothScanner.parse_mibeacon(payload[2:])
+    if data:
+      logger.debug('Received Bluetooth advertisement from {}: {}'.format(device.addr,data))
+      self.update(device.addr,data)
+
+  @staticmethod
+  def parse_mibeacon(payload):
+    # Unencrypted MiBeacon: frame control (2), product id (2), frame counter (1), [mac (6)], [capability (1)], [object id (2), length (1), value]
+    if len(payload) < 5:
+      return None
+
+    frame_control = payload[0] | payload[1] << 8
+    if frame_control & 0x08 or not frame_control & 0x40:
+      # Encrypted or no measurement in this advertisement
+      return None
+
+    position = 5 + (6 if frame_control & 0x10 else 0) + (1 if frame_control & 0x20 else 0)
+    if len(payload) < position + 3:
+      return None
+
+    object_id = payload[position] | payload[position + 1] << 8
+    value = payload[position + 3:position + 3 + payload[position + 2]]
+    if len(value) < payload[position + 2]:
+      return None
+
+    value = bytes(value)
+    data = {}
+    if 0x1004 == object_id and len(value) == 2:
+      data['temperature'] = unpack('<h',value)[0] / 10.0
+    elif 0x1006 == object_id and len(value) == 2:
+      data['humidity'] = unpack('<H',value)[0] / 10.0
+    elif 0x1007 == object_id and len(value) == 3:
+      data['light'] = float(unpack('<I',value + b'\x00')[0])
+    elif 0x1008 == object_id and len(value) == 1:
+      data['moisture'] = float(unpack('<B',value)[0])
+    elif 0x1009 == object_id and len(value) == 2:
+      data['fertility'] = float(unpack('<H',value)[0])
+    elif 0x100A == object_id and len(value) == 1:
+      data['battery'] = float(unpack('<B',value)[0])
+    elif 0x100D == object_id and len(value) == 4:
+      data['temperature'], data['humidity'] = [item / 10.0 for item in unpack('<hH',value)]
+
+    return data
+
+  def update(self, address, data):
+    # Merge new values with the values of previous advertisements, and fill the sensor cache when all sensors of the device have a value
+    address = address.lower()
+    now = time()
+    with self.__data_lock:
+      if address not in self.__data:
+        self.__data[address] = {}
+
+      for field, value in data.items():
+        self.__data[address][field] = (value,now)
+
+      sensors = list(self.__sensors.get(address,{}).values())
+
+    device_data = self.get_device_data(address)
+    if device_data is not None:
+      for sensor in dict((sensor.get_sensor_cache_key(),sensor) for sensor in sensors).values():
+        sensor.set_device_data(device_data)
+
+  def get_device_data(self, address):
+    # Returns None when not all registered sensors of the device have a recent value
+    address = address.lower()
+    now = time()
+    with self.__data_lock:
+      if address not in self.__sensors:
+        return None
+
+      data = dict((field,value[0]) for field, value in self.__data.get(address,{}).items() if now - value[1] < terrariumBluetoothScanner.ADVERT_TIMEOUT)
+      if not all(sensor_type in data for sensor_type in self.__sensors[address]):
+        return None
+
+    return data
 
 class terrariumMiFloraSensor(terrariumSensorSource):
   TYPE = 'miflora'
   VALID_SENSOR_TYPES = ['temperature','light','moisture','fertility']
+  # Save the battery, stable plant values are read at most every 5 minutes
+  POLL_INTERVAL_MAX = 5 * 60
 
   __SCANTIME = 5
   __MIN_DB = -90
@@ -32,24 +217,30 @@ class terrariumMiFloraSensor(terrariumSensorSource):
       self.set_limit_max(1000)
 
     super(terrariumMiFloraSensor,self).__init__(sensor_id, sensor_type, address, name, callback_indicator)
+    terrariumBluetoothScanner().register(self)
 
   def load_data(self):
     data = None
 
     if self.get_address() is not None:
+      data = terrariumBluetoothScanner().get_device_data(self.get_address())
+      if data is not None:
+        return data
 
       try:
-        sensor = Peripheral(self.get_address())
-        #Read battery and firmware version attribute
-        data = unpack('<xB5s',sensor.readCharacteristic(terrariumMiFloraSensor.__MIFLORA_FIRMWARE_AND_BATTERY))
-        data = {'battery': data[0], 'firmware' : data[1]}
-
-        #Enable real-time data reading
-        sensor.writeCharacteristic(terrariumMiFloraSensor.__MIFLORA_REALTIME_DATA_TRIGGER, bytearray([0xa0, 0x1f]), True)
-        #Read plant data
-        data['temperature'], data['light'], data['moisture'], data['fertility'] = unpack('<hxIBHxxxxxx',sensor.readCharacteristic(terrariumMiFloraSensor.__MIFLORA_GET_DATA))
-        # Close connection...
-        sensor.disconnect()
+        # Not (all) values are advertised, connect to the device
+        with terrariumBluetoothScanner().lock:
+          sensor = Peripheral(self.get_address())
+          #Read battery and firmware version attribute
+          data = unpack('<xB5s',sensor.readCharacteristic(terrariumMiFloraSensor.__MIFLORA_FIRMWARE_AND_BATTERY))
+          data = {'battery': data[0], 'firmware' : data[1]}
+
+          #Enable real-time data reading
+          sensor.writeCharacteristic(terrariumMiFloraSensor.__MIFLORA_REALTIME_DATA_TRIGGER, bytearray([0xa0, 0x1f]), True)
+          #Read plant data
+          data['temperature'], data['light'], data['moisture'], data['fertility'] = unpack('<hxIBHxxxxxx',sensor.readCharacteristic(terrariumMiFloraSensor.__MIFLORA_GET_DATA))
+          # Close connection...
+          sensor.disconnect()
 
         # Clean up
         data['temperature'] = float(data['temperature']) / 10.0
@@ -59,6 +250,9 @@ class terrariumMiFloraSensor(terrariumSensorSource):
         data['battery']     = float(data['battery'])
         data['firmware']    = data['firmware'].decode('utf8')
 
+        # Keep the values that are not advertised
+        terrariumBluetoothScanner().update(self.get_address(),data)
+
       except Exception as ex:
         logger.warning('Error getting new data from {} sensor \'{}\'. Error message: {}'.format(self.get_type(),self.get_name(),ex))
 
@@ -85,6 +279,10 @@ class terrariumMiFloraSensor(terrariumSensorSource):
 
     return self.__battery
 
+  def stop(self):
+    terrariumBluetoothScanner().unregister(self)
+    super(terrariumMiFloraSensor,self).stop()
+
   @staticmethod
   def check_connection(address):
     try:
@@ -105,7 +303,7 @@ class terrariumMiFloraSensor(terrariumSensorSource):
     ok = False
     for counter in range(10):
       try:
-        for device in Scanner(counter).scan(terrariumMiFloraSensor.__SCANTIME):
+        for device in terrariumBluetoothScanner().scan(counter,terrariumMiFloraSensor.__SCANTIME):
           if device.rssi > terrariumMiFloraSensor.__MIN_DB and device.getValueText(9) is not None and device.getValueText(9).lower() in ['flower mate','flower care']:
             address = device.addr
             logger.info('Found MiFlora bluetooth device at address {}'.format(address))
@@ -129,6 +327,7 @@ class terrariumMiFloraSensor(terrariumSensorSource):
 class terrariumMiTempSensor(terrariumSensorSource):
   TYPE = 'mitemp'
   VALID_SENSOR_TYPES = ['temperature','humidity']
+  POLL_INTERVAL_MAX = 5 * 60
 
   __SCANTIME = 5
   __MIN_DB = -90
@@ -143,11 +342,16 @@ class terrariumMiTempSensor(terrariumSensorSource):
     self.__device = None
 
     super(terrariumMiTempSensor,self).__init__(sensor_id, sensor_type, address, name, callback_indicator)
+    terrariumBluetoothScanner().register(self)
 
   def load_data(self):
     data = None
 
     if self.get_address() is not None:
+      data = terrariumBluetoothScanner().get_device_data(self.get_address())
+      if data is not None:
+        return data
+
       if self.__device is None:
         try:
           self.__device = MiTempBtPoller(self.get_address(), BluepyBackend, 60, adapter=self.__adaptor)
@@ -158,11 +362,16 @@ class terrariumMiTempSensor(terrariumSensorSource):
         try:
           #sensor = MiTempBtPoller(self.get_address(), BluepyBackend, 60, adapter=self.__adaptor)
 
-          data = {}
-          data['temperature'] = self.__device.parameter_value(MI_TEMPERATURE)
-          data['humidity']    = self.__device.parameter_value(MI_HUMIDITY)
-          data['battery']     = self.__device.parameter_value(MI_BATTERY)
-          data['firmware']    = self.__device.firmware_version()
+          # Not (all) values are advertised, connect to the device
+          with terrariumBluetoothScanner().lock:
+            data = {}
+            data['temperature'] = self.__device.parameter_value(MI_TEMPERATURE)
+            data['humidity']    = self.__device.parameter_value(MI_HUMIDITY)
+            data['battery']     = self.__device.parameter_value(MI_BATTERY)
+            data['firmware']    = self.__device.firmware_version()
+
+          # Keep the values that are not advertised
+          terrariumBluetoothScanner().update(self.get_address(),data)
 
           #del(sensor)
 
@@ -192,6 +401,10 @@ class terrariumMiTempSensor(terrariumSensorSource):
 
     return self.__battery
 
+  def stop(self):
+    terrariumBluetoothScanner().unregister(self)
+    super(terrariumMiTempSensor,self).stop()
+
   @staticmethod
   def scan_sensors(callback = None):
     # Due to multiple bluetooth dongles, we are looping 10 times to see which devices can scan. Exit after first success
@@ -199,7 +412,7 @@ class terrariumMiTempSensor(terrariumSensorSource):
     ok = False
     for counter in range(10):
       try:
-        for device in Scanner(counter).scan(terrariumMiTempSensor.__SCANTIME):
+        for device in terrariumBluetoothScanner().scan(counter,terrariumMiTempSensor.__SCANTIME):
           ok = True
           if device.rssi > terrariumMiTempSensor.__MIN_DB and device.getValueText(9) is not None and device.getValueText(9).lower() in ['mj_ht_v1']:
             address = device.addr
@@ -8,12 +8,17 @@ import copy
 import os
 
 from terrariumUtils import terrariumUtils
+from terrariumMetrics import terrariumMetrics
 
 class terrariumCollector(object):
   DATABASE = 'history.db'
   # Store data every Xth minute. Except switches and doors
   STORE_MODULO = 1 * 60
 
+  METRIC_WRITE_BATCH = terrariumMetrics().histogram('terrariumpi_collector_write_batch_rows','Number of rows written per database transaction',['type'],[1,2,5,10,25,50,100])
+  METRIC_WRITE_DURATION = terrariumMetrics().histogram('terrariumpi_collector_write_duration_seconds','Duration of database write transactions in seconds',['type'])
+  METRIC_QUERY_DURATION = terrariumMetrics().histogram('terrariumpi_collector_history_query_duration_seconds','Duration of history queries in seconds',['type'])
+
   def __init__(self,versionid):
     logger.info('Setting up collector database %s' % (terrariumCollector.DATABASE,))
     self.__recovery = False
@@ -243,7 +248,7 @@ class terrariumCollector(object):
       return
 
     now = int(time.time())
-    rows = []
+    rows = 0
     if type not in ['switches','door']:
       now -= (now % terrariumCollector.STORE_MODULO)
 
@@ -254,14 +259,17 @@ class terrariumCollector(object):
         if type in ['humidity','moisture','temperature','distance','ph','conductivity','light','uva','uvb','uvi','fertility','co2','volume']:
           cur.execute('REPLACE INTO sensor_data (id, type, timestamp, current, limit_min, limit_max, alarm_min, alarm_max, alarm) VALUES (?,?,?,?,?,?,?,?,?)',
                       (id, type, now, newdata['current'], newdata['limit_min'], newdata['limit_max'], newdata['alarm_min'], newdata['alarm_max'], newdata['alarm']))
+          rows += cur.rowcount
 
         if type in ['weather']:
           cur.execute('REPLACE INTO weather_data (timestamp, wind_speed, temperature, pressure, wind_direction, weather, icon) VALUES (?,?,?,?,?,?,?)',
                       (now, newdata['wind_speed'], newdata['temperature'], newdata['pressure'], newdata['wind_direction'], newdata['weather'], newdata['icon']))
+          rows += cur.rowcount
 
         if type in ['system']:
           cur.execute('REPLACE INTO system_data (timestamp, load_load1, load_load5, load_load15, uptime, temperature, cores, memory_total, memory_used, memory_free, disk_total, disk_used, disk_free) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)',
                       (now, newdata['load']['load1'], newdata['load']['load5'], newdata['load']['load15'], newdata['uptime'], newdata['temperature'], newdata['cores'], newdata['memory']['total'], newdata['memory']['used'], newdata['memory']['free'],newdata['disk']['total'], newdata['disk']['used'], newdata['disk']['free']))
+          rows += cur.rowcount
 
         if type in ['switches']:
           if 'time' in newdata:
@@ -269,12 +277,17 @@ class terrariumCollector(object):
 
           cur.execute('REPLACE INTO switch_data (id, timestamp, state, power_wattage, water_flow) VALUES (?,?,?,?,?)',
                       (id, now, newdata['state'], newdata['current_power_wattage'], newdata['current_water_flow']))
+          rows += cur.rowcount
 
         if type in ['door']:
           cur.execute('REPLACE INTO door_data (id, timestamp, state) VALUES (?,?,?)',
                       (id, now, newdata))
+          rows += cur.rowcount
 
         db.commit()
+
+      terrariumCollector.METRIC_WRITE_BATCH.observe(rows,type)
+      terrariumCollector.METRIC_WRITE_DURATION.observe(time.time()-timer,type)
     except sqlite3.DatabaseError as ex:
       logger.error('TerrariumPI Collecter exception! %s', (ex,))
       if 'database disk image is malformed' == str(ex):
@@ -506,6 +519,7 @@ class terrariumCollector(object):
                   # Add extra point for nicer graphing of doors and power switches
                   history[row['type']][row['id']][field].append([row['timestamp2'] * 1000,row[field]])
 
+          terrariumCollector.METRIC_QUERY_DURATION.observe(time.time()-timer,logtype)
           logger.debug('Timing: history %s query: %s seconds' % (logtype,time.time()-timer))
       except sqlite3.DatabaseError as ex:
         logger.error('TerrariumPI Collecter exception! %s', (ex,))
@@ -606,6 +606,11 @@ class terrariumConfig(object):
   def get_port_number(self):
     config = self.get_system()
     return config['port']
+
+  def get_push_port(self):
+    '''Get the TCP port of the sensor push line protocol. 0 is disabled'''
+    config = self.get_system()
+    return int(config['push_port']) if 'push_port' in config and terrariumUtils.is_float(config['push_port']) else 0
   # End system functions
 
   def get_meross_cloud(self):
@@ -674,7 +679,7 @@ class terrariumConfig(object):
 
   # Sensor config functions
   def save_sensor(self,data):
-    return self.__update_config('sensor' + data['id'],data,['current','indicator','firmware','battery'])
+    return self.__update_config('sensor' + data['id'],data,['current','indicator','firmware','battery','health'])
 
   def save_sensors(self,data):
     update_ok = True
@@ -683,7 +688,12 @@ class terrariumConfig(object):
         self.__config.remove_section('sensor' + sensor['id'])
 
     for sensorid in data:
-      update_ok = update_ok and self.save_sensor(data[sensorid].get_data())
+      sensor_data = data[sensorid].get_data()
+      if 'push' == sensor_data['hardwaretype'] and data[sensorid].get_token() is not None:
+        # The token is not part of the sensor data, so it is never send to clients
+        sensor_data['token'] = data[sensorid].get_token()
+
+      update_ok = update_ok and self.save_sensor(sensor_data)
 
     if len(data) == 0:
       update_ok = update_ok and self.__save_config()
@@ -22,13 +22,18 @@ import subprocess
 import re
 import json
 import pyfiglet
+import copy
+import base64
 
 from hashlib import md5
-from gevent import sleep
+from gevent import sleep, spawn, joinall
 
 from terrariumConfig import terrariumConfig
 from terrariumWeather import terrariumWeather, terrariumWeatherSourceException
-from terrariumSensor import terrariumSensor
+from terrariumSensor import terrariumSensor, terrariumSensorCache, terrariumSensorDevice
+from terrariumI2CBus import terrariumI2CBusManager
+from terrariumSerialDevice import terrariumSerialDeviceManager
+from terrariumSensorPush import terrariumSensorPushServer
 from terrariumSwitch import terrariumPowerSwitch
 from terrariumDoor import terrariumDoor
 from terrariumWebcam import terrariumWebcam, terrariumWebcamSourceException
@@ -37,12 +42,28 @@ from terrariumCollector import terrariumCollector
 from terrariumEnvironment import terrariumEnvironment
 from terrariumNotification import terrariumNotification
 from terrariumCalendar import terrariumCalendar
+from terrariumSnapshot import terrariumSnapshot
 
-from terrariumUtils import terrariumUtils
+from terrariumUtils import terrariumUtils, terrariumCache
+from terrariumMetrics import terrariumMetrics
 
 class terrariumEngine(object):
 
   LOOP_TIMEOUT = 30
+  # Check for new versions once a day. Retry failures with an increasing delay, starting at 5 minutes
+  UPDATE_CHECK_TIMEOUT = 24 * 60 * 60
+  UPDATE_CHECK_RETRY = 5 * 60
+  # Hardware is loaded in stages. Parts within a stage are loaded at the same time and take turns after every device.
+  # Network I/O and the sensor hardware scans do not block the other parts
+  STARTUP_STAGES = [['weather','sensors','power_switches','doors'],
+                    ['environment'],
+                    ['webcams','audio']]
+
+  METRIC_LOOP_DURATION = terrariumMetrics().histogram('terrariumpi_engine_loop_duration_seconds','Duration of a single engine update loop in seconds',None,[1,2.5,5,10,15,20,25,30,45,60,120])
+  METRIC_WEBSOCKET_CLIENTS = terrariumMetrics().gauge('terrariumpi_websocket_clients','Number of connected websocket clients')
+  METRIC_WEBSOCKET_QUEUE_DEPTH = terrariumMetrics().gauge('terrariumpi_websocket_queue_depth','Deepest websocket client message queue')
+  METRIC_WEBSOCKET_DROPPED = terrariumMetrics().counter('terrariumpi_websocket_dropped_clients_total','Number of websocket clients dropped due to a full message queue')
+  METRIC_CACHE = terrariumMetrics().gauge('terrariumpi_cache','Cache entries, hits, misses, coalesced reads and evictions',['cache','stat'])
 
   def __init__(self):
     # Default system units
@@ -64,32 +85,42 @@ class terrariumEngine(object):
     # List of queues for websocket communication
     self.subscribed_queues = []
 
-    self.device = ''
-    regex = r"product: (?P<device>.*)"
-    hw=os.popen("lshw -c system 2>/dev/null")
-    for line in hw.readlines():
-      matches = re.search(regex, line)
-      if matches:
-        self.device = matches.group('device')
-        break
-    hw.close()
-
     # Default power usage for a PI
     self.pi_power_wattage = 5
 
+    # Hardware is loaded in the background after the engine is created. See __load_hardware
+    self.__startup = {'starttime' : time.time(), 'duration' : None, 'parts' : {}}
+    self.weather = None
+    self.sensors = {}
+    self.power_switches = {}
+    self.doors = {}
     self.environment = None
+    self.webcams = {}
+    self.__audio_player = None
+    self.__push_server = None
 
     # Load config
     logger.info('Loading terrariumPI config')
     self.config = terrariumConfig()
     logger.info('Done Loading terrariumPI config')
 
+    # Load the last known state for a warm start
+    self.__snapshot = terrariumSnapshot()
+    self.__snapshot_data = self.__snapshot.load()
+
     # Check for update
     self.current_version = self.config.get_system()['version']
     self.update_available = False
     self.update_last_check = datetime.datetime.fromtimestamp(0)
     self.update_version = None
-    self.__update_check()
+
+    # Cached system information from a previous run
+    system_info = self.__snapshot_data.get('system',{})
+    self.device = system_info.get('device','')
+    if system_info.get('update_version') is not None:
+      self.update_version = system_info['update_version']
+      self.update_available = int(self.update_version.replace('.','')) > int(self.current_version.replace('.',''))
+      self.update_last_check = datetime.datetime.fromtimestamp(system_info.get('update_last_check',0))
 
     # Notification engine
     self.notification = terrariumNotification()
@@ -132,56 +163,137 @@ class terrariumEngine(object):
     self.set_volume_indicator(self.config.get_volume_indicator())
     logger.info('Done loading terrariumPI PI volume indicator')
 
-    # Load Weather part
+    # Start the hardware loading in the background, so the webserver can start directly
+    self.__running = True
+    _thread.start_new_thread(self.__load_hardware, ())
+    _thread.start_new_thread(self.__system_info_loop, ())
+    _thread.start_new_thread(self.__log_tail, ())
+    logger.info('TerrariumPI engine is running. Loading hardware in the background')
+
+  def __update_check(self):
+    version_data = terrariumUtils.get_remote_data('https://api.github.com/repos/theyosh/TerrariumPI/releases/latest',json=True)
+    if version_data is None or 'tag_name' not in version_data:
+      return False
+
+    self.update_version = version_data['tag_name']
+    self.update_available = int(self.update_version.replace('.','')) > int(self.current_version.replace('.',''))
+    self.update_last_check = datetime.datetime.now()
+    return True
+
+  def __system_info_loop(self):
+    # Slow external lookups are done here, so the engine loop only reads the cached values
+    device_retry = update_retry = terrariumEngine.UPDATE_CHECK_RETRY
+    next_device_check = 0
+    next_update_check = time.mktime(self.update_last_check.timetuple()) + terrariumEngine.UPDATE_CHECK_TIMEOUT
+
+    while self.__running:
+      now = time.time()
+
+      if '' == self.device and now >= next_device_check:
+        if not self.__load_device_info():
+          logger.warning('Unable to get the device information. Will retry in {} seconds.'.format(device_retry))
+          next_device_check = now + device_retry
+          device_retry = min(device_retry * 2, terrariumEngine.UPDATE_CHECK_TIMEOUT)
+
+      if now >= next_update_check:
+        if self.__update_check():
+          next_update_check = now + terrariumEngine.UPDATE_CHECK_TIMEOUT
+          update_retry = terrariumEngine.UPDATE_CHECK_RETRY
+        else:
+          logger.warning('Unable to get the latest version information from Github. Will retry in {} seconds.'.format(update_retry))
+          next_update_check = now + update_retry
+          update_retry = min(update_retry * 2, terrariumEngine.UPDATE_CHECK_TIMEOUT)
+
+      sleep(terrariumEngine.LOOP_TIMEOUT)
+
+  # Private/internal functions
+  def __load_hardware(self):
+    logger.info('Start loading terrariumPI hardware')
+    for stage in terrariumEngine.STARTUP_STAGES:
+      for part in stage:
+        self.__startup['parts'][part] = {'state' : 'waiting', 'duration' : None, 'error' : None}
+
+    for stage in terrariumEngine.STARTUP_STAGES:
+      joinall([spawn(self.__load_hardware_part,part) for part in stage])
+
+    self.__startup['duration'] = time.time() - self.__startup['starttime']
+    self.get_startup_status(socket=True)
+    logger.info('Done loading terrariumPI hardware in %.3f seconds' % (self.__startup['duration'],))
+
+    if self.__running and self.config.get_push_port() > 0:
+      try:
+        self.__push_server = terrariumSensorPushServer(self.push_sensor_data,self.config.get_push_port(),self.config.get_hostname())
+        self.__push_server.start()
+      except Exception as ex:
+        logger.exception('Error starting sensor push server at port {}: {}'.format(self.config.get_push_port(),ex))
+        self.__push_server = None
+
+    if self.__running:
+      _thread.start_new_thread(self.__engine_loop, ())
+      _thread.start_new_thread(self.__webcam_loop, ())
+
+  def __load_hardware_part(self,part):
+    starttime = time.time()
+    self.__startup['parts'][part]['state'] = 'loading'
+
+    try:
+      if 'weather' == part:
+        self.__load_weather()
+      elif 'sensors' == part:
+        self.__load_sensors()
+      elif 'power_switches' == part:
+        self.__load_power_switches()
+      elif 'doors' == part:
+        self.__load_doors()
+      elif 'environment' == part:
+        self.__load_environment()
+      elif 'webcams' == part:
+        self.__load_webcams()
+      elif 'audio' == part:
+        self.__load_audio_player()
+
+      self.__startup['parts'][part]['state'] = 'ready'
+    except Exception as ex:
+      logger.exception('Error loading terrariumPI {}: {}'.format(part,ex))
+      self.__startup['parts'][part]['state'] = 'error'
+      self.__startup['parts'][part]['error'] = str(ex)
+
+    self.__startup['parts'][part]['duration'] = time.time() - starttime
+    self.get_startup_status(socket=True)
+
+  def __load_device_info(self):
+    regex = r"product: (?P<device>.*)"
+    hw=os.popen("lshw -c system 2>/dev/null")
+    for line in hw.readlines():
+      matches = re.search(regex, line)
+      if matches:
+        self.device = matches.group('device')
+        break
+    hw.close()
+
+    return '' != self.device
+
+  def __load_weather(self):
     logger.info('Loading terrariumPI weather data')
     self.weather = terrariumWeather(self.config.get_weather_location(),
                                     self.get_temperature_indicator,
                                     self.get_windspeed_indicator,
-                                    self.get_weather)
+                                    self.get_weather,
+                                    self.__snapshot_data.get('weather'))
     logger.info('Done loading terrariumPI weather data')
 
-    # Load humidity and temperature sensors
-    self.__load_sensors()
-
-    # Load Powerswitches part
-    self.__load_power_switches()
-
-    # Load doors from config
-    self.__load_doors()
-
+  def __load_environment(self):
     # Load the environment system. This will controll the lights, sprayer and heaters
     logger.debug('Loading terrariumPI environment system')
     self.environment = terrariumEnvironment(self.sensors, self.power_switches, self.weather, self.is_door_open, self.config.get_environment,self.notification)
     logger.debug('Done loading terrariumPI environment system')
 
-    # Load webcams from config
-    self.__load_webcams()
-
-    # Load audio system
+  def __load_audio_player(self):
     self.__audio_player = terrariumAudioPlayer(self.config.get_audio_playlists(),
                                                self.config.get_active_soundcard(),
                                                any(self.power_switches[switchid].is_pwm_dimmer() for switchid in self.power_switches),
                                                self.get_audio_playing)
 
-    # Start system update loop
-    self.__running = True
-    _thread.start_new_thread(self.__engine_loop, ())
-    _thread.start_new_thread(self.__webcam_loop, ())
-    _thread.start_new_thread(self.__log_tail, ())
-    logger.info('TerrariumPI engine is running')
-
-  def __update_check(self):
-    if datetime.datetime.now() - self.update_last_check > datetime.timedelta(days=1):
-      version_data = terrariumUtils.get_remote_data('https://api.github.com/repos/theyosh/TerrariumPI/releases/latest',json=True)
-      if version_data is None:
-        logger.warning('Unable to get the latest version information from Github. Will check next round.')
-        return None
-
-      self.update_version = version_data['tag_name']
-      self.update_available = int(self.update_version.replace('.','')) > int(self.current_version.replace('.',''))
-      self.update_last_check = datetime.datetime.now()
-
-  # Private/internal functions
   def __load_sensors(self,data = None):
     # Load Sensors, with ID as index
     starttime = time.time()
@@ -200,9 +312,13 @@ class terrariumEngine(object):
         exclude_ids.append(sensor_data['id'])
 
     seen_sensors = []
-    for sensor in terrariumSensor.scan_sensors(self.__unit_type):
-      if sensor.get_id() not in self.sensors and sensor.get_id() not in exclude_ids:
-        self.sensors[sensor.get_id()] = sensor
+    if not reloading:
+      # When reloading, sensors that are not in the new config are removed anyway. So only scan at startup
+      for sensor in terrariumSensor.scan_sensors(self.__unit_type):
+        if sensor.get_id() not in self.sensors and sensor.get_id() not in exclude_ids:
+          self.sensors[sensor.get_id()] = sensor
+        else:
+          sensor.stop()
 
     for sensordata in sensor_config:
       if sensordata['id'] in exclude_ids:
@@ -254,15 +370,34 @@ class terrariumEngine(object):
       if 'exclude_avg' in sensordata and sensordata['exclude_avg'] is not None:
         sensor.set_exclude_avg(sensordata['exclude_avg'])
 
+      if 'filter' in sensordata and sensordata['filter'] is not None:
+        sensor.set_filter(sensordata['filter'])
+
+      if 'push' == sensor.get_type() and 'token' in sensordata and sensordata['token'] is not None:
+        sensor.set_token(sensordata['token'])
+
       seen_sensors.append(sensor.get_id())
+      # Let the other hardware parts of this startup stage continue
+      sleep(0)
 
+    if not reloading:
+      # Sensors without a new measurement start with the last known value
+      for sensorid, sensordata in self.__snapshot_data.get('sensors',{}).items():
+        if sensorid in self.sensors:
+          self.sensors[sensorid].restore_state(sensordata['current'],sensordata['last_update'])
 
     if reloading:
       for sensor_id in set(self.sensors) - set(seen_sensors):
         # clean up old deleted sensors
+        try:
+          self.sensors[sensor_id].stop()
+        except Exception as ex:
+          logger.exception('Error stopping removed sensor with ID {}: {}'.format(sensor_id,ex))
+
         del(self.sensors[sensor_id])
 
-      self.environment.set_sensors(self.sensors)
+      if self.environment is not None:
+        self.environment.set_sensors(self.sensors)
 
     logger.info('Done %s terrariumPI sensors. Found %d sensors in %.3f seconds' % ('reloading' if reloading else 'loading',
                                                                                       len(self.sensors),
@@ -288,10 +423,19 @@ class terrariumEngine(object):
     logger.info('Loaded {} excluding IDs: {}'.format(len(exclude_ids),exclude_ids))
 
     prev_state = {}
+    snapshot_state = {}
     if starting_up:
-      logger.info('Loading previous power switch states from the last 12 hours')
       start = int(time.time())
-      prev_data = self.collector.get_history(['switches'],start,start-43200)
+      if start - self.__snapshot_data.get('timestamp',0) < 43200:
+        logger.info('Loading previous power switch states from the warm start snapshot')
+        for switch in self.__snapshot_data.get('switches',{}):
+          if switch not in exclude_ids:
+            snapshot_state[switch] = self.__snapshot_data['switches'][switch]['state']
+
+      prev_data = {}
+      if len(snapshot_state) == 0:
+        logger.info('Loading previous power switch states from the last 12 hours')
+        prev_data = self.collector.get_history(['switches'],start,start-43200)
 
       if 'switches' in prev_data:
         for switch in prev_data['switches']:
@@ -311,7 +455,11 @@ class terrariumEngine(object):
 
       prev_power_state = terrariumPowerSwitch.OFF
 
-      if power_switch_config['id'] in prev_state and prev_state[power_switch_config['id']] > 0:
+      if power_switch_config['id'] in snapshot_state and snapshot_state[power_switch_config['id']] is not None:
+        prev_power_state = snapshot_state[power_switch_config['id']]
+        prev_state[power_switch_config['id']] = prev_power_state
+
+      elif power_switch_config['id'] in prev_state and prev_state[power_switch_config['id']] > 0:
         prev_power_state = terrariumPowerSwitch.ON
 
         if 'dimmer' in power_switch_config['hardwaretype'] or 'brightpi' == power_switch_config['hardwaretype']:
@@ -362,14 +510,21 @@ class terrariumEngine(object):
                                 power_switch_config['dimmer_off_percentage'])
 
       seen_power_switches.append(power_switch.get_id())
+      sleep(0)
 
     if not starting_up:
       for power_switch_id in set(self.power_switches) - set(seen_power_switches):
         # clean up old deleted switches
+        try:
+          self.power_switches[power_switch_id].stop()
+        except Exception as ex:
+          logger.exception('Error stopping removed power switch with ID {}: {}'.format(power_switch_id,ex))
+
         del(self.power_switches[power_switch_id])
 
       # Should not be needed.... environment needs callback to engine to get this information
-      self.environment.set_power_switches(self.power_switches)
+      if self.environment is not None:
+        self.environment.set_power_switches(self.power_switches)
 
     logger.info('Done %s terrariumPI switches. Found %d switches in %.3f seconds' % ('starting up' if starting_up else 'updating',
                                                                                       len(self.power_switches),
@@ -405,10 +560,16 @@ class terrariumEngine(object):
         door.set_name(doordata['name'])
 
       seen_doors.append(door.get_id())
+      sleep(0)
 
     if reloading:
       for door_id in set(self.doors) - set(seen_doors):
         # clean up old deleted switches
+        try:
+          self.doors[door_id].stop()
+        except Exception as ex:
+          logger.exception('Error stopping removed door with ID {}: {}'.format(door_id,ex))
+
         del(self.doors[door_id])
 
     logger.info('Done %s terrariumPI doors. Found %d doors in %.3f seconds' % ('reloading' if reloading else 'loading',
@@ -526,6 +687,7 @@ class terrariumEngine(object):
         webcam.set_awb(webcamdata['awb'])
 
       seen_webcams.append(webcam.get_id())
+      sleep(0)
 
       if reloading and webcam.is_live():
         webcam.start()
@@ -533,6 +695,11 @@ class terrariumEngine(object):
     if reloading:
       for webcam_id in set(self.webcams) - set(seen_webcams):
         # clean up old deleted switches
+        try:
+          self.webcams[webcam_id].stop()
+        except Exception as ex:
+          logger.exception('Error stopping removed webcam with ID {}: {}'.format(webcam_id,ex))
+
         del(self.webcams[webcam_id])
 
     logger.info('Done %s terrariumPI webcams. Found %d webcams in %.3f seconds' % ('reloading' if reloading else 'loading',
@@ -586,6 +753,12 @@ class terrariumEngine(object):
           # More then 12 seconds to late.... probably never fast enough...
           time_short = 0
 
+  def __update_power_switch(self, power_switch):
+    try:
+      power_switch.update()
+    except Exception as err:
+      logger.exception('Engine loop: Power switch has problems: {}'.format(err))
+
   def __engine_loop(self):
     time_short = 0
     error_counter = 0
@@ -593,47 +766,59 @@ class terrariumEngine(object):
     while self.__running:
       starttime = time.time()
 
-      # Version update check
-      self.__update_check()
-
       motddata = {'average' : [],
                   'system' : 0,
                   'duration' : 0,
                   'error' : ''}
 
       # Update weather
-      self.weather.update()
-      weather_data = self.weather.get_data()
-      if 'hour_forecast' in weather_data and len(weather_data['hour_forecast']) > 0:
-        self.collector.log_weather_data(weather_data['hour_forecast'][0])
-
-      # Update sensors
-      for sensorid in self.sensors:
+      if self.weather is not None:
+        self.weather.update()
+        weather_data = self.weather.get_data()
+        if 'hour_forecast' in weather_data and len(weather_data['hour_forecast']) > 0:
+          self.collector.log_weather_data(weather_data['hour_forecast'][0])
+
+      # Update sensors. Every physical device is read once and updates all its sensors
+      sensor_devices = terrariumSensorDevice.group(list(self.sensors.values()))
+      terrariumSensorDevice.prefetch(sensor_devices)
+      for sensor_device in sensor_devices:
+        updated = True
         try:
-          # Update the current sensor.
-          self.sensors[sensorid].update()
-          # Save new data to database
-          self.collector.log_sensor_data(self.sensors[sensorid].get_data())
-          # Websocket callback
-          self.get_sensors([sensorid],socket=True)
-          # Send notification when needed and enabled
-          if self.sensors[sensorid].is_active() and self.sensors[sensorid].notification_enabled() and self.sensors[sensorid].get_alarm():
-            self.notification.message('sensor_alarm_' + ('low' if self.sensors[sensorid].get_current() < self.sensors[sensorid].get_alarm_min() else 'high'),self.sensors[sensorid].get_data())
-
+          updated = sensor_device.update()
         except Exception as err:
-          logger.exception('Engine loop: Sensor has problems: {}'.format(err))
+          logger.exception('Engine loop: Sensor device has problems: {}'.format(err))
 
-        # Make time for other web request
-        sleep(0.1)
+        for sensor in sensor_device.get_sensors():
+          try:
+            # Sensors that are not due for a read keep their previous value, which is already saved and sent
+            if updated:
+              # Save new data to database
+              self.collector.log_sensor_data(sensor.get_data())
+              # Websocket callback
+              self.get_sensors([sensor.get_id()],socket=True)
 
-      # Update (remote) power switches
+            # Send notification when needed and enabled
+            if sensor.is_active() and sensor.notification_enabled() and sensor.get_alarm():
+              self.notification.message('sensor_alarm_' + ('low' if sensor.get_current() < sensor.get_alarm_min() else 'high'),sensor.get_data())
+
+          except Exception as err:
+            logger.exception('Engine loop: Sensor has problems: {}'.format(err))
+
+        if updated:
+          # Make time for other web request
+          sleep(0.1)
+
+      # Update (remote) power switches. Switches that poll over HTTP are all updated at once
       motddata['power_switches'] = []
+      joinall([spawn(self.__update_power_switch,self.power_switches[power_switch_id]) for power_switch_id in self.power_switches if self.power_switches[power_switch_id].CONCURRENT_UPDATE])
       for power_switch_id in self.power_switches:
         try:
           # Update timer trigger if activated
           #self.power_switches[power_switch_id].timer()
           # Update the current sensor.
-          self.power_switches[power_switch_id].update()
+          if not self.power_switches[power_switch_id].CONCURRENT_UPDATE:
+            self.power_switches[power_switch_id].update()
+
           if self.power_switches[power_switch_id].is_on():
             power_state = '{}%'.format(self.power_switches[power_switch_id].get_state())
             if not self.power_switches[power_switch_id].is_dimmer():
@@ -677,6 +862,14 @@ class terrariumEngine(object):
 
       self.notification.send_display("\n".join(display_message))
 
+      if self.__snapshot.is_due():
+        self.__save_snapshot()
+
+      for name, cache in [('sensors',terrariumSensorCache()),('generic',terrariumCache())]:
+        for stat, value in cache.get_stats().items():
+          terrariumEngine.METRIC_CACHE.set(value,name,stat)
+
+      terrariumEngine.METRIC_LOOP_DURATION.observe(time.time() - starttime)
       duration = (time.time() - starttime) + time_short
       motddata['duration'] = duration
       if duration < terrariumEngine.LOOP_TIMEOUT:
@@ -842,12 +1035,19 @@ reset=$(tput sgr0)
     os.chmod('motd.sh', 0o755)
 
   def __send_message(self,message):
-    clients = self.subscribed_queues
+    max_depth = 0
+    clients = list(self.subscribed_queues)
     for queue in clients:
       queue.put(message)
       # If more then 50 messages in queue, looks like connection is gone and remove the queue from the list
       if queue.qsize() > 50:
         self.subscribed_queues.remove(queue)
+        terrariumEngine.METRIC_WEBSOCKET_DROPPED.inc()
+      else:
+        max_depth = max(max_depth,queue.qsize())
+
+    terrariumEngine.METRIC_WEBSOCKET_QUEUE_DEPTH.set(max_depth)
+    terrariumEngine.METRIC_WEBSOCKET_CLIENTS.set(len(self.subscribed_queues))
 
   def __log_tail(self):
     logger.info('Start terrariumPI engine log')
@@ -858,6 +1058,73 @@ reset=$(tput sgr0)
         logger.info('Stopped terrariumPI engine log')
         logtail.kill()
 
+  def __hardware_ready(self,part):
+    return part in self.__startup['parts'] and self.__startup['parts'][part]['state'] in ['ready','error']
+
+  def __save_snapshot(self):
+    if self.__startup['duration'] is None:
+      # Do not overwrite a good snapshot with a partly loaded system
+      return False
+
+    data = {'system' : {'device' : self.device,
+                        'update_version' : self.update_version,
+                        'update_last_check' : int(time.mktime(self.update_last_check.timetuple()))},
+            'sensors' : {},
+            'switches' : {},
+            'weather' : None if self.weather is None else self.weather.get_state(),
+            'environment' : None if self.environment is None else self.environment.get_data(),
+            'average' : self.get_sensors(['average'])['sensors']}
+
+    for sensorid in self.sensors:
+      data['sensors'][sensorid] = self.sensors[sensorid].get_data()
+      data['sensors'][sensorid]['last_update'] = self.sensors[sensorid].get_last_update()
+
+    for switchid in self.power_switches:
+      data['switches'][switchid] = self.power_switches[switchid].get_data()
+
+    return self.__snapshot.save(data)
+
+  def __get_sensors_data(self,temperature_type = None):
+    data = [self.sensors[sensorid].get_data() for sensorid in list(self.sensors)]
+
+    if not self.__hardware_ready('sensors'):
+      # Until all sensors are loaded, serve the last known values from the warm start snapshot
+      now = int(time.time())
+      for sensorid, sensordata in self.__snapshot_data.get('sensors',{}).items():
+        if sensorid in self.sensors:
+          continue
+
+        sensordata = copy.deepcopy(sensordata)
+        sensordata['error'] = now - sensordata.pop('last_update',0) > terrariumSensor.ERROR_TIMEOUT
+        data.append(sensordata)
+
+    self.__convert_sensors_data(data,temperature_type)
+    return data
+
+  def __convert_sensors_data(self, data, temperature_type = None):
+    # Convert all temperature sensors to the requested temperature indicator at once
+    if temperature_type is None:
+      return
+
+    # Thermal cameras have extra temperature fields
+    fields = ['current','alarm_min','alarm_max','limit_min','limit_max','frame_min','frame_max','frame_mean']
+    sensors = {}
+    for sensordata in data:
+      if 'temperature' == sensordata['type'] and temperature_type != sensordata['indicator']:
+        if sensordata['indicator'] not in sensors:
+          sensors[sensordata['indicator']] = []
+
+        sensors[sensordata['indicator']].append(sensordata)
+
+    for indicator in sensors:
+      items = [(sensordata,field) for sensordata in sensors[indicator] for field in fields if field in sensordata]
+      values = terrariumUtils.convert_values_from_to([sensordata[field] for sensordata, field in items],indicator,temperature_type)
+      for (sensordata, field), value in zip(items,values):
+        sensordata[field] = value
+
+      for sensordata in sensors[indicator]:
+        sensordata['indicator'] = temperature_type
+
   def __unit_type(self,unittype):
     if unittype in self.__units:
       return self.__units[unittype]
@@ -868,12 +1135,19 @@ reset=$(tput sgr0)
     # Stop engine processing first....
     self.__running = False
 
-    self.environment.stop()
+    if self.environment is not None:
+      self.environment.stop()
+
+    if self.__push_server is not None:
+      self.__push_server.stop()
 
     for sensorid in self.sensors:
       self.sensors[sensorid].stop()
       logger.info('Stopped type {} {} sensor {} at address {}'.format(self.sensors[sensorid].get_type(),self.sensors[sensorid].get_sensor_type(),self.sensors[sensorid].get_name(),self.sensors[sensorid].get_address()))
 
+    terrariumI2CBusManager().close()
+    terrariumSerialDeviceManager().close()
+
     for power_switch_id in self.power_switches:
       self.power_switches[power_switch_id].stop()
       logger.info('Stopped power switch {} at address {}'.format(self.power_switches[power_switch_id].get_name(),self.power_switches[power_switch_id].get_address()))
@@ -886,6 +1160,8 @@ reset=$(tput sgr0)
       self.webcams[webcam_id].stop()
       logger.info('Stopped webcam {} at address {}'.format(self.webcams[webcam_id].get_name(),self.webcams[webcam_id].get_location()))
 
+    self.__save_snapshot()
+
     self.notification.stop()
     self.collector.stop()
 
@@ -905,16 +1181,23 @@ reset=$(tput sgr0)
     return self.config.save_weather(data)
 
   def get_weather_config(self):
+    if self.weather is None:
+      return {'location' : self.config.get_weather_location()}
+
     return self.weather.get_config()
 
   def get_weather(self, parameters = [], socket = False):
+    if self.weather is None:
+      return None
+
     try:
       data = self.weather.get_data()
     except Exception as ex:
       logger.error('Strange weather.. error https://github.com/theyosh/TerrariumPI/issues/246: {}'.format(ex))
       return None
 
-    self.environment.update()
+    if self.environment is not None:
+      self.environment.update()
 
     if socket:
       self.__send_message({'type':'update_weather','data':data})
@@ -944,16 +1227,21 @@ reset=$(tput sgr0)
 
     # Filter is based on sensorid
     if filtertype is not None and filtertype in self.sensors:
-      data.append(self.sensors[filtertype].get_data(temperature_type=temperature_type))
+      data.append(self.sensors[filtertype].get_data())
+      self.__convert_sensors_data(data,temperature_type)
 
     else:
-      for sensorid in self.sensors:
+      for sensor in self.__get_sensors_data(temperature_type):
         # Filter based on sensor type
         # Exclude Chirp light sensors for average calculation in favour of Lux measurements
-        if filtertype is None or (filtertype == 'average' and not (self.sensors[sensorid].get_exclude_avg() or (self.sensors[sensorid].get_sensor_type() == 'light' and self.sensors[sensorid].get_type() == 'chirp'))) or filtertype == self.sensors[sensorid].get_sensor_type():
-          data.append(self.sensors[sensorid].get_data(temperature_type=temperature_type))
+        if filtertype is None or (filtertype == 'average' and not (sensor['exclude_avg'] or (sensor['type'] == 'light' and sensor['hardwaretype'] == 'chirp'))) or filtertype in [sensor['type'],sensor['id']]:
+          data.append(sensor)
+
+    if 'average' == filtertype and temperature_type is None and len(data) == 0 and not self.__hardware_ready('sensors'):
+      # No sensors at all yet, use the last known average gauges
+      data = copy.deepcopy(self.__snapshot_data.get('average',{}))
 
-    if 'average' == filtertype or len(parameters) == 2 and parameters[1] == 'average':
+    elif 'average' == filtertype or len(parameters) == 2 and parameters[1] == 'average':
       average = {}
       for sensor in data:
         if sensor['current'] is None:
@@ -995,6 +1283,61 @@ reset=$(tput sgr0)
     else:
       return {'sensors' : data}
 
+  def get_sensor_frames(self, sensorid, history = False, output_format = 'json'):
+    # Thermal camera frames. Binary and PNG output is base64 encoded, so it can be used through the engine IPC as well
+    if sensorid not in self.sensors or not hasattr(self.sensors[sensorid],'get_frames'):
+      return None
+
+    sensor = self.sensors[sensorid]
+    frames = sensor.get_frames(history)
+    if len(frames) == 0:
+      return None
+
+    if 'png' == output_format:
+      return {'content_type' : 'image/png', 'data' : base64.b64encode(sensor.frames_to_png(frames)).decode('ascii')}
+
+    if 'binary' == output_format:
+      return {'content_type' : 'application/octet-stream', 'data' : base64.b64encode(sensor.frames_to_binary(frames)).decode('ascii')}
+
+    return {'width' : sensor.FRAME_WIDTH,
+            'height' : sensor.FRAME_HEIGHT,
+            'frames' : [{'timestamp' : timestamp, 'frame' : frame.tolist()} for timestamp, frame in frames]}
+
+  def push_sensor_data(self, device, token, readings):
+    # Readings of a push sensor device as {<sensor type> : <value>}. Returns the updated sensor ids, or None when the device or token is unknown
+    sensors = [sensor for sensor in list(self.sensors.values()) if 'push' == sensor.get_type() and sensor.get_device_id() == device]
+    if len(sensors) == 0 or not all(sensor.is_valid_token(token) for sensor in sensors):
+      logger.warning('Refused pushed sensor data for unknown device \'{}\' or invalid token'.format(device))
+      return None
+
+    readings = dict((sensor_type,float(value)) for sensor_type, value in readings.items() if terrariumUtils.is_float(value))
+    if len(readings) == 0:
+      return []
+
+    sensors[0].push_data(readings)
+    updated = []
+    for sensor in sensors:
+      if sensor.get_sensor_type() not in readings:
+        continue
+
+      sensor.update()
+      self.collector.log_sensor_data(sensor.get_data())
+      self.get_sensors([sensor.get_id()],socket=True)
+      updated.append(sensor.get_id())
+
+    return updated
+
+  def get_sensor_health(self, sensorid):
+    if sensorid not in self.sensors:
+      return None
+
+    sensor = self.sensors[sensorid]
+    return {'id' : sensor.get_id(),
+            'name' : sensor.get_name(),
+            'hardwaretype' : sensor.get_type(),
+            'type' : sensor.get_sensor_type(),
+            'health' : sensor.get_health()}
+
   def get_sensors_config(self, socket = False):
     return self.get_sensors()
 
@@ -1014,9 +1357,15 @@ reset=$(tput sgr0)
       data.append(self.power_switches[filter].get_data())
 
     else:
-      for switchid in self.power_switches:
+      for switchid in list(self.power_switches):
         data.append(self.power_switches[switchid].get_data())
 
+      if not self.__hardware_ready('power_switches'):
+        # Until all switches are loaded, serve the last known states from the warm start snapshot
+        for switchid, switchdata in self.__snapshot_data.get('switches',{}).items():
+          if switchid not in self.power_switches and (filter is None or filter == switchid):
+            data.append(switchdata)
+
     if socket:
       self.__send_message({'type':'switches','data':data})
     else:
@@ -1197,13 +1546,14 @@ reset=$(tput sgr0)
 
   # Start audio files part
   def reload_audio_files(self):
-    self.__audio_player.reload_audio_files()
+    if self.__audio_player is not None:
+      self.__audio_player.reload_audio_files()
 
   def upload_audio_file(self):
     pass
 
   def delete_audio_file(self,audiofileid):
-    audio_files = self.__audio_player.get_audio_files()
+    audio_files = {} if self.__audio_player is None else self.__audio_player.get_audio_files()
     if audiofileid in audio_files:
       if audio_files[audiofileid].delete():
         self.reload_audio_files()
@@ -1212,7 +1562,7 @@ reset=$(tput sgr0)
     return False
 
   def get_audio_files(self, parameters = []):
-    audio_files = self.__audio_player.get_audio_files()
+    audio_files = {} if self.__audio_player is None else self.__audio_player.get_audio_files()
     data = []
     filter = None
     if len(parameters) > 0 and parameters[0] is not None:
@@ -1228,7 +1578,7 @@ reset=$(tput sgr0)
     return {'audiofiles' : data}
 
   def get_audio_playlists(self, parameters = [], socket = False):
-    playlists = self.__audio_player.get_playlists()
+    playlists = {} if self.__audio_player is None else self.__audio_player.get_playlists()
     data = []
     filter = None
     if len(parameters) > 0 and parameters[0] is not None:
@@ -1250,10 +1600,16 @@ reset=$(tput sgr0)
     return self.get_audio_playlists()
 
   def set_audio_playlists_config(self, data):
+    if self.__audio_player is None:
+      return False
+
     self.__audio_player.reload_playlists(data)
     return self.config.save_audio_playlists(self.__audio_player.get_playlists())
 
   def get_audio_playing(self,socket = False):
+    if self.__audio_player is None:
+      return None
+
     data = self.__audio_player.get_current_state()
 
     if socket:
@@ -1268,10 +1624,16 @@ reset=$(tput sgr0)
     pass
 
   def audio_player_volume_up(self):
+    if self.__audio_player is None:
+      return
+
     self.__audio_player.volume_up()
     self.get_audio_playing(True)
 
   def audio_player_volume_down(self):
+    if self.__audio_player is None:
+      return
+
     self.__audio_player.volume_down()
     self.get_audio_playing(True)
 
@@ -1283,7 +1645,11 @@ reset=$(tput sgr0)
     if len(parameters) > 0 and parameters[0] is not None:
       filter = parameters[0]
 
-    data = self.environment.get_data()
+    if self.environment is None:
+      # Last known environment state until the environment is loaded
+      data = copy.deepcopy(self.__snapshot_data.get('environment') or {})
+    else:
+      data = self.environment.get_data()
 
     if filter is not None and filter in data:
       data = { filter : data[filter]}
@@ -1294,9 +1660,15 @@ reset=$(tput sgr0)
       return { 'environment' : data }
 
   def get_environment_config(self):
+    if self.environment is None:
+      return self.config.get_environment()
+
     return self.environment.get_config()
 
   def set_environment_config(self,data):
+    if self.environment is None:
+      return False
+
     self.environment.load_environment(data)
     return self.config.save_environment(self.environment.get_config())
   # End Environment part
@@ -1359,6 +1731,7 @@ reset=$(tput sgr0)
 
   def subscribe(self,queue):
     self.subscribed_queues.append(queue)
+    terrariumEngine.METRIC_WEBSOCKET_CLIENTS.set(len(self.subscribed_queues))
     self.__send_message({'type':'dashboard_online', 'data':True})
 
   def get_system_stats(self, socket = False):
@@ -1405,10 +1778,35 @@ reset=$(tput sgr0)
     else:
       return data
 
+  def get_startup_status(self, socket = False):
+    parts = copy.deepcopy(self.__startup['parts'])
+    data = {'ready' : len(parts) > 0 and all(parts[part]['state'] in ['ready','error'] for part in parts),
+            'duration' : self.__startup['duration'] if self.__startup['duration'] is not None else time.time() - self.__startup['starttime'],
+            'parts' : parts,
+            'devices' : {'sensors' : {}, 'switches' : {}, 'doors' : {}, 'webcams' : {}}}
+
+    # A device is ready when it has delivered its first valid state
+    for sensorid in list(self.sensors):
+      data['devices']['sensors'][sensorid] = self.sensors[sensorid].get_last_update() > 0
+
+    for switchid in list(self.power_switches):
+      data['devices']['switches'][switchid] = self.power_switches[switchid].get_state() is not None
+
+    for doorid in list(self.doors):
+      data['devices']['doors'][doorid] = self.doors[doorid].get_status() is not None
+
+    for webcamid in list(self.webcams):
+      data['devices']['webcams'][webcamid] = self.webcams[webcamid].get_last_update() > 0
+
+    if socket:
+      self.__send_message({'type':'startup_status','data':data})
+    else:
+      return data
+
   def get_uptime(self, socket = False):
     data = {'uptime' : uptime.uptime(),
             'timestamp' : int(time.time()),
-            'day' : self.weather.is_day(),
+            'day' : None if self.weather is None else self.weather.is_day(),
             'load' : os.getloadavg(),
             'cores' : psutil.cpu_count()}
 
@@ -1539,6 +1937,19 @@ reset=$(tput sgr0)
 
   def set_config(self,part,data,files = None):
     update_ok = False
+    # Changing hardware while it is still loading in the background would race with the loader
+    hardware_part = {'weather' : 'weather',
+                     'system' : 'weather',
+                     'switches' : 'power_switches',
+                     'sensors' : 'sensors',
+                     'webcams' : 'webcams',
+                     'doors' : 'doors',
+                     'audio' : 'audio',
+                     'environment' : 'environment'}.get(part)
+    if hardware_part is not None and not self.__hardware_ready(hardware_part):
+      logger.warning('Cannot change the {} config while the {} hardware is still loading'.format(part,hardware_part))
+      return False
+
     if 'weather' == part:
       update_ok = self.set_weather_config(data)
 
@@ -1607,6 +2018,14 @@ reset=$(tput sgr0)
   # Histroy part (Collector)
   def get_history(self, parameters = [], socket = False):
     data = {}
+    temperature_type = None
+    # The temperature unit is the last parameter, or the one before the period. Exports always add the period 'all'
+    for position in [-1,-2]:
+      if len(parameters) >= abs(position) and parameters[position] in ['celsius','fahrenheit','kelvin']:
+        temperature_type = parameters[position][0].upper()
+        del(parameters[position])
+        break
+
     if len(parameters) == 0:
       data = {'history' : 'ERROR, select a history type'}
     else:
@@ -1624,6 +2043,15 @@ reset=$(tput sgr0)
 
       data = self.collector.get_history(parameters=parameters,stoptime=stoptime,exclude_ids=exclude_ids)
 
+      indicator = self.get_temperature_indicator()
+      if temperature_type is not None and temperature_type != indicator:
+        # History is stored in the temperature indicator of the system. Convert whole graph lines at once
+        for historytype in ['temperature','weather']:
+          for historyid in data.get(historytype,{}):
+            for field in data[historytype][historyid]:
+              if field in ['current','alarm_min','alarm_max','limit_min','limit_max','temperature']:
+                data[historytype][historyid][field] = terrariumUtils.convert_points_from_to(data[historytype][historyid][field],indicator,temperature_type)
+
     if socket:
       self.__send_message({'type':'history_graph','data': data})
     else:
@@ -5,17 +5,24 @@ logger = terrariumLogging.logging.getLogger(__name__)
 import RPi.GPIO as GPIO
 import Adafruit_DHT
 
-from gevent import sleep
+from gevent import sleep, get_hub, Timeout
 from time import time
+from gevent.monkey import get_original
 
 from terrariumSensor import terrariumSensorSource
 from terrariumUtils import terrariumUtils
 
+# Code running in the OS thread pool needs the real blocking sleep
+time_sleep = get_original('time','sleep')
+
 class terrariumGPIOSensor(terrariumSensorSource):
   TYPE = None
   VALID_SENSOR_TYPES = []
+  # Max seconds for a timing critical read in a separate OS thread, see run_in_thread
+  THREAD_READ_TIMEOUT = 10
 
   def __init__(self, sensor_id, sensor_type, address, name = '', callback_indicator = None):
+    self.__thread_read = None
     super(terrariumGPIOSensor,self).__init__(sensor_id, sensor_type, address, name, callback_indicator)
     gpio_pins = self.get_address().split(',')
     logger.debug('Initializing sensor type \'%s\' with GPIO address %s'.format(self.get_type(),gpio_pins))
@@ -29,6 +36,20 @@ class terrariumGPIOSensor(terrariumSensorSource):
 
     return data
 
+  def run_in_thread(self, function, *args):
+    # Bit banged and busy waiting reads block. Run them in the gevent thread pool, so the webserver and the engine keep running
+    if self.__thread_read is not None and not self.__thread_read.ready():
+      logger.warning('Previous read of {} sensor \'{}\' is still running. Skipping this read'.format(self.get_type(),self.get_name()))
+      return None
+
+    self.__thread_read = get_hub().threadpool.spawn(function, *args)
+    try:
+      return self.__thread_read.get(timeout=self.THREAD_READ_TIMEOUT)
+    except Timeout as ex:
+      logger.warning('Reading {} sensor \'{}\' took more then {} seconds. Abort!'.format(self.get_type(),self.get_name(),self.THREAD_READ_TIMEOUT))
+
+    return None
+
   def load_raw_data(self):
     try:
       gpio_pins = self.get_address().split(',')
@@ -84,6 +105,8 @@ class terrariumYTXXSensorDigital(terrariumGPIOSensor):
 class terrariumDHTSensor(terrariumGPIOSensor):
   TYPE = None
   VALID_SENSOR_TYPES = ['temperature','humidity']
+  # Four retries with two seconds delay
+  THREAD_READ_TIMEOUT = 15
 
   def load_raw_data(self):
     data = None
@@ -97,7 +120,9 @@ class terrariumDHTSensor(terrariumGPIOSensor):
       elif terrariumAM2302Sensor.TYPE == self.get_type():
         sensor_device = Adafruit_DHT.AM2302
 
-      data['humidity'], data['temperature'] = Adafruit_DHT.read_retry(sensor_device, terrariumUtils.to_BCM_port_number(gpio_pins[0]),4)
+      values = self.run_in_thread(Adafruit_DHT.read_retry,sensor_device, terrariumUtils.to_BCM_port_number(gpio_pins[0]),4)
+      if values is not None:
+        data['humidity'], data['temperature'] = values
 
     except Exception as ex:
       logger.warning('Error getting new data from {} sensor \'{}\'. Error message: {}'.format(self.get_type(),self.get_name(),ex))
@@ -122,6 +147,9 @@ class terrariumAM2302Sensor(terrariumDHTSensor):
 class terrariumHCSR04Sensor(terrariumGPIOSensor):
   TYPE = 'hc-sr04'
   VALID_SENSOR_TYPES = ['distance']
+  THREAD_READ_TIMEOUT = 5
+  # Max seconds to wait for the echo pin to change
+  PULSE_TIMEOUT = 2
 
   def __init__(self, sensor_id, sensor_type, address, name = '', callback_indicator = None):
     self.set_limit_max(1000)
@@ -155,23 +183,11 @@ class terrariumHCSR04Sensor(terrariumGPIOSensor):
 
       GPIO.output(terrariumUtils.to_BCM_port_number(gpio_pins[0]), False)
       sleep(2)
-      GPIO.output(terrariumUtils.to_BCM_port_number(gpio_pins[0]), True)
-      sleep(0.00001)
-      GPIO.output(terrariumUtils.to_BCM_port_number(gpio_pins[0]), False)
-      pulse_start = time()
-      starttime = pulse_start
-      while GPIO.input(terrariumUtils.to_BCM_port_number(gpio_pins[1])) == 0:
-        pulse_start = time()
-        # Somehow, sometimes this will end in an endless loop. The value will never go to '0' (zero). So wrong measurement and return none...
-        if pulse_start - starttime > 2:
-          logger.warn('Sensor {} \'{}\' is failing to get in the right state. Abort!'.format(self.get_type(),self.get_name()))
-          return data
+      pulse_duration = self.run_in_thread(terrariumHCSR04Sensor.measure_pulse,terrariumUtils.to_BCM_port_number(gpio_pins[0]),terrariumUtils.to_BCM_port_number(gpio_pins[1]))
+      if pulse_duration is None:
+        logger.warn('Sensor {} \'{}\' is failing to get in the right state. Abort!'.format(self.get_type(),self.get_name()))
+        return data
 
-      pulse_end = time()
-      while GPIO.input(terrariumUtils.to_BCM_port_number(gpio_pins[1])) == 1:
-        pulse_end = time()
-
-      pulse_duration = pulse_end - pulse_start
       # https://www.modmypi.com/blog/hc-sr04-ultrasonic-range-sensor-on-the-raspberry-pi
       # Measure in centimetre
       data = { self.get_sensor_type() : round(pulse_duration * 17150,5)}
@@ -181,6 +197,28 @@ class terrariumHCSR04Sensor(terrariumGPIOSensor):
 
     return data
 
+  @staticmethod
+  def measure_pulse(trigger_pin, echo_pin):
+    # Runs in a separate OS thread. Returns the echo pulse duration in seconds, or None when the echo pin does not change in time
+    GPIO.output(trigger_pin, True)
+    time_sleep(0.00001)
+    GPIO.output(trigger_pin, False)
+    pulse_start = time()
+    starttime = pulse_start
+    while GPIO.input(echo_pin) == 0:
+      pulse_start = time()
+      # Somehow, sometimes this will end in an endless loop. The value will never go to '0' (zero). So wrong measurement and return none...
+      if pulse_start - starttime > terrariumHCSR04Sensor.PULSE_TIMEOUT:
+        return None
+
+    pulse_end = time()
+    while GPIO.input(echo_pin) == 1:
+      pulse_end = time()
+      if pulse_end - pulse_start > terrariumHCSR04Sensor.PULSE_TIMEOUT:
+        return None
+
+    return pulse_end - pulse_start
+
   def close(self):
     super(terrariumHCSR04Sensor,self).close()
 
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import terrariumLogging
+logger = terrariumLogging.logging.getLogger(__name__)
+
+import threading
+import smbus
+
+try:
+  import board
+  import busio
+except Exception:
+  pass # Needs python3
+
+from terrariumUtils import terrariumSingleton
+
+class terrariumI2CBus(object):
+  # One open SMBus handle per I2C bus. All transactions on the bus should hold the lock,
+  # so reads from different sensors on the same bus do not interleave
+  def __init__(self, bus_number):
+    self.__bus_number = int(bus_number)
+    self.__handle = None
+    self.__busio = None
+    self.lock = threading.RLock()
+
+  def __enter__(self):
+    self.lock.acquire()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.lock.release()
+
+  def get_bus_number(self):
+    return self.__bus_number
+
+  def get_handle(self):
+    if self.__handle is None:
+      logger.debug('Open I2C bus {}'.format(self.__bus_number))
+      self.__handle = smbus.SMBus(self.__bus_number)
+
+    return self.__handle
+
+  def get_busio(self):
+    # CircuitPython drivers use their own I2C object on the default SCL and SDA pins
+    if self.__busio is None:
+      logger.debug('Open CircuitPython I2C bus on the board SCL and SDA pins')
+      self.__busio = busio.I2C(board.SCL, board.SDA)
+
+    return self.__busio
+
+  def reset(self):
+    # Reopen the handle on the next transaction, after a failed read
+    logger.debug('Reset I2C bus {}'.format(self.__bus_number))
+    self.close()
+
+  def close(self):
+    with self.lock:
+      for handle in [self.__handle, self.__busio]:
+        if handle is None:
+          continue
+
+        try:
+          handle.close()
+        except Exception as ex:
+          logger.warning('Error closing I2C bus {}. Error message: {}'.format(self.__bus_number,ex))
+
+      self.__handle = None
+      self.__busio = None
+
+class terrariumI2CBusManager(terrariumSingleton):
+  DEFAULT_BUS = 1
+
+  def __init__(self):
+    self.__buses = {}
+    self.__lock = threading.Lock()
+    logger.debug('Initialized I2C bus manager')
+
+  def get_bus(self, bus_number = None):
+    bus_number = terrariumI2CBusManager.DEFAULT_BUS if bus_number is None else int(bus_number)
+    with self.__lock:
+      if bus_number not in self.__buses:
+        self.__buses[bus_number] = terrariumI2CBus(bus_number)
+
+      return self.__buses[bus_number]
+
+  def close(self):
+    with self.__lock:
+      buses = list(self.__buses.values())
+
+    for bus in buses:
+      bus.close()
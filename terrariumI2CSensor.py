@@ -3,7 +3,6 @@
 import terrariumLogging
 logger = terrariumLogging.logging.getLogger(__name__)
 
-import smbus
 import sys
 import Adafruit_SHT31
 
@@ -14,20 +13,28 @@ import chirp
 sys.path.insert(0, './python-MLX90614')
 from mlx90614 import MLX90614
 from struct import unpack
+from io import BytesIO
+from time import time
+from collections import deque
 from gevent import sleep
+from PIL import Image
 try:
   import melopero_amg8833 as mp
 except Exception:
   pass # Needs python3
 
+try:
+  import numpy
+except Exception:
+  pass # Only needed for the AMG8833 thermal camera
+
 try:
   import adafruit_sht31d
-  import board
-  import busio
 except Exception:
   pass # Needs python3
 
 from terrariumSensor import terrariumSensorSource
+from terrariumI2CBus import terrariumI2CBusManager
 from terrariumUtils import terrariumUtils
 
 class terrariumI2CSensor(terrariumSensorSource):
@@ -44,26 +51,46 @@ class terrariumI2CSensor(terrariumSensorSource):
   TRIGGER_HUMIDITY_NO_HOLD = 0xF5
   HUMIDITY_WAIT_TIME = 0.1
 
-  def load_data(self):
+  def __init__(self, sensor_id, sensor_type, address, name = '', callback_indicator = None):
     self.i2c_bus = None
+    # Only send a soft reset on the first read and after a failed read
+    self.__soft_reset = True
+    super(terrariumI2CSensor,self).__init__(sensor_id, sensor_type, address, name, callback_indicator)
 
+  def get_i2c_bus_number(self):
+    gpio_pins = self.get_address().split(',')
+    return 1 if len(gpio_pins) == 1 else int(gpio_pins[1])
+
+  def load_data(self):
     data = None
-    if self.open():
-      data = self.load_raw_data()
+    bus = terrariumI2CBusManager().get_bus(self.get_i2c_bus_number())
+
+    with bus:
+      if self.open(bus):
+        data = self.load_raw_data()
+
+      if not data:
+        self.__soft_reset = True
+        bus.reset()
+
       self.close()
 
     return data
 
-  def open(self):
+  def open(self, bus = None, wait = True):
     try:
+      bus = terrariumI2CBusManager().get_bus(self.get_i2c_bus_number()) if bus is None else bus
       gpio_pins = self.get_address().split(',')
       logger.debug('Open sensor type \'{}\' with address {}'.format(self.get_type(),gpio_pins))
+      self.i2c_bus = bus.get_handle()
       #Datasheet recommend do Soft Reset before measurment:
-      self.i2c_bus = smbus.SMBus(1 if len(gpio_pins) == 1 else int(gpio_pins[1]))
-      if self.SOFTRESET_TIMEOUT > 0.0:
+      if self.__soft_reset and self.SOFTRESET_TIMEOUT > 0.0:
         logger.debug('Send soft reset command \'{}\' with a timeout of {} seconds'.format(self.SOFTRESET,self.SOFTRESET_TIMEOUT * 2.0))
         self.i2c_bus.write_byte(int('0x' + gpio_pins[0],16), self.SOFTRESET)
-        sleep(self.SOFTRESET_TIMEOUT * 2.0)
+        if wait:
+          sleep(self.SOFTRESET_TIMEOUT * 2.0)
+
+      self.__soft_reset = False
 
     except Exception as ex:
       logger.warning('Error opening {} sensor \'{}\'. Error message: {}'.format(self.get_type(),self.get_name(),ex))
@@ -71,10 +98,12 @@ class terrariumI2CSensor(terrariumSensorSource):
 
     return True
 
-  def get_raw_data(self,trigger,timeout):
+  def trigger(self,trigger):
     gpio_pins = self.get_address().split(',')
     self.i2c_bus.write_byte(int('0x' + gpio_pins[0],16), trigger)
-    sleep(timeout * 2.0)
+
+  def read_raw_data(self):
+    gpio_pins = self.get_address().split(',')
     data1 = self.i2c_bus.read_byte(int('0x' + gpio_pins[0],16))
     try:
       data2 = self.i2c_bus.read_byte(int('0x' + gpio_pins[0],16))
@@ -84,13 +113,26 @@ class terrariumI2CSensor(terrariumSensorSource):
 
     return (data1,data2)
 
+  def get_raw_data(self,trigger,timeout):
+    self.trigger(trigger)
+    sleep(timeout * 2.0)
+    return self.read_raw_data()
+
+  @staticmethod
+  def convert_temperature(bytedata):
+    return ((bytedata[0]*256.0+bytedata[1])*175.72/65536.0)-46.85
+
+  @staticmethod
+  def convert_humidity(bytedata):
+    return ((bytedata[0]*256.0+bytedata[1])*125.0/65536.0)-6.0
+
   def load_raw_data(self):
     data = None
 
     try:
       data = {}
       bytedata = self.get_raw_data(self.TRIGGER_TEMPERATURE_NO_HOLD,self.TEMPERATURE_WAIT_TIME)
-      data['temperature'] = ((bytedata[0]*256.0+bytedata[1])*175.72/65536.0)-46.85
+      data['temperature'] = terrariumI2CSensor.convert_temperature(bytedata)
     except Exception as ex:
       print('load_raw_data temp:')
       print(ex)
@@ -99,24 +141,65 @@ class terrariumI2CSensor(terrariumSensorSource):
       if data is None:
         data = {}
       bytedata = self.get_raw_data(self.TRIGGER_HUMIDITY_NO_HOLD,self.HUMIDITY_WAIT_TIME)
-      data['humidity'] = ((bytedata[0]*256.0+bytedata[1])*125.0/65536.0)-6.0
+      data['humidity'] = terrariumI2CSensor.convert_humidity(bytedata)
     except Exception as ex:
       print('load_raw_data humid:')
       print(ex)
 
     return data
 
-  def close(self):
+  @staticmethod
+  def load_data_pipelined(sensors):
+    # Trigger the same conversion on all sensors, wait once for the slowest sensor and read all results.
+    # One cycle takes about the longest conversion time instead of the sum of all conversion times
+    data = dict((sensor.get_sensor_cache_key(),{}) for sensor in sensors)
+    buses = [terrariumI2CBusManager().get_bus(bus_number) for bus_number in sorted(set(sensor.get_i2c_bus_number() for sensor in sensors))]
+    # Always lock the buses in the same order
+    for bus in buses:
+      bus.lock.acquire()
+
     try:
-      self.i2c_bus.close()
-    except AttributeError as ex:
-      pass # Bus is already closed
-    except Exception as ex:
-      logger.warning('Error closing {} sensor \'{}\'. Error message: {}'.format(self.get_type(),self.get_name(),ex))
+      reset_timeout = max([sensor.SOFTRESET_TIMEOUT for sensor in sensors if sensor.__soft_reset] + [0.0])
+      sensors = [sensor for sensor in sensors if sensor.open(wait=False)]
+      if reset_timeout > 0.0:
+        sleep(reset_timeout * 2.0)
+
+      for trigger, timeout, sensor_type, convert in [('TRIGGER_TEMPERATURE_NO_HOLD','TEMPERATURE_WAIT_TIME','temperature',terrariumI2CSensor.convert_temperature),
+                                                     ('TRIGGER_HUMIDITY_NO_HOLD','HUMIDITY_WAIT_TIME','humidity',terrariumI2CSensor.convert_humidity)]:
+        triggered = []
+        for sensor in sensors:
+          try:
+            sensor.trigger(getattr(sensor,trigger))
+            triggered.append(sensor)
+          except Exception as ex:
+            logger.warning('Error triggering {} measurement on {} sensor \'{}\'. Error message: {}'.format(sensor_type,sensor.get_type(),sensor.get_name(),ex))
+
+        if len(triggered) == 0:
+          continue
+
+        sleep(max(getattr(sensor,timeout) for sensor in triggered) * 2.0)
+        for sensor in triggered:
+          try:
+            data[sensor.get_sensor_cache_key()][sensor_type] = convert(sensor.read_raw_data())
+          except Exception as ex:
+            logger.warning('Error reading {} measurement from {} sensor \'{}\'. Error message: {}'.format(sensor_type,sensor.get_type(),sensor.get_name(),ex))
+
+      for sensor in sensors:
+        if not data[sensor.get_sensor_cache_key()]:
+          sensor.__soft_reset = True
+          terrariumI2CBusManager().get_bus(sensor.get_i2c_bus_number()).reset()
+
+        sensor.close()
+
+    finally:
+      for bus in reversed(buses):
+        bus.lock.release()
 
-  def stop(self):
-    self.close()
-    super(terrariumI2CSensor,self).stop()
+    return data
+
+  def close(self):
+    # The bus handle is shared by all sensors on the bus and stays open
+    self.i2c_bus = None
 
 class terrariumSHT2XSensor(terrariumI2CSensor):
   TYPE = 'sht2x'
@@ -135,23 +218,32 @@ class terrariumSHT2XSensor(terrariumI2CSensor):
   HUMIDITY_WAIT_TIME = 0.030     # (datasheet: typical=22, max=29 in ms)
   SOFTRESET_TIMEOUT = 0.016      # (datasheet: typical=??, max=15 in ms)
 
+  load_data_batch = staticmethod(terrariumI2CSensor.load_data_pipelined)
+
 class terrariumSHT3XSensor(terrariumSensorSource):
   TYPE = 'sht3x'
   VALID_SENSOR_TYPES = ['temperature','humidity']
 
   # Datasheet: https://cdn-shop.adafruit.com/product-files/2857/Sensirion_Humidity_SHT3x_Datasheet_digital-767294.pdf
+  def __init__(self, sensor_id, sensor_type, address, name = '', callback_indicator = None):
+    self.__device = None
+    super(terrariumSHT3XSensor,self).__init__(sensor_id, sensor_type, address, name, callback_indicator)
+
   def load_data(self):
     data = None
-    try:
-      data = {}
-      gpio_pins = self.get_address().split(',')
-      sensor = Adafruit_SHT31.SHT31(int('0x' + gpio_pins[0],16))
+    with terrariumI2CBusManager().get_bus():
+      try:
+        if self.__device is None:
+          gpio_pins = self.get_address().split(',')
+          self.__device = Adafruit_SHT31.SHT31(int('0x' + gpio_pins[0],16))
 
-      data['temperature'] = float(sensor.read_temperature())
-      data['humidity'] = float(sensor.read_humidity())
+        data = {}
+        data['temperature'] = float(self.__device.read_temperature())
+        data['humidity'] = float(self.__device.read_humidity())
 
-    except Exception as ex:
-      print(ex)
+      except Exception as ex:
+        logger.warning('Error getting new data from {} sensor \'{}\'. Error message: {}'.format(self.get_type(),self.get_name(),ex))
+        self.__device = None
 
     return data
 
@@ -160,21 +252,29 @@ class terrariumSHT3XDSensor(terrariumSensorSource):
   VALID_SENSOR_TYPES = ['temperature','humidity']
 
   # https://github.com/adafruit/Adafruit_CircuitPython_SHT31D/
+  def __init__(self, sensor_id, sensor_type, address, name = '', callback_indicator = None):
+    self.__device = None
+    super(terrariumSHT3XDSensor,self).__init__(sensor_id, sensor_type, address, name, callback_indicator)
+
   def load_data(self):
     data = None
-    try:
-      data = {}
-      # Used 2 fixed known addresses
-      i2c = busio.I2C(board.SCL, board.SDA)
-      sensor = adafruit_sht31d.SHT31D(i2c)
-      sensor.repeatability = adafruit_sht31d.REP_MED
-      sensor.mode = adafruit_sht31d.MODE_SINGLE
+    bus = terrariumI2CBusManager().get_bus()
+    with bus:
+      try:
+        if self.__device is None:
+          # Used 2 fixed known addresses
+          self.__device = adafruit_sht31d.SHT31D(bus.get_busio())
+          self.__device.repeatability = adafruit_sht31d.REP_MED
+          self.__device.mode = adafruit_sht31d.MODE_SINGLE
 
-      data['temperature'] = float(sensor.temperature)
-      data['humidity'] = float(sensor.relative_humidity)
+        data = {}
+        data['temperature'] = float(self.__device.temperature)
+        data['humidity'] = float(self.__device.relative_humidity)
 
-    except Exception as ex:
-      print(ex)
+      except Exception as ex:
+        logger.warning('Error getting new data from {} sensor \'{}\'. Error message: {}'.format(self.get_type(),self.get_name(),ex))
+        self.__device = None
+        bus.reset()
 
     return data
 
@@ -186,6 +286,8 @@ class terrariumHTU21DSensor(terrariumI2CSensor):
   HUMIDITY_WAIT_TIME = 0.019     # (datasheet: typ=14, max=18 in ms)
   SOFTRESET_TIMEOUT = 0.016      # (datasheet: typ=??, max=15 in ms)
 
+  load_data_batch = staticmethod(terrariumI2CSensor.load_data_pipelined)
+
 class terrariumSi7021Sensor(terrariumI2CSensor):
   TYPE = 'si7021'
 
@@ -194,6 +296,8 @@ class terrariumSi7021Sensor(terrariumI2CSensor):
   HUMIDITY_WAIT_TIME = 0.07     # (datasheet: typ=10, max=12 in ms) -> Not correct??
   SOFTRESET_TIMEOUT = 0.016      # (datasheet: typ=5, max=15 in ms)
 
+  load_data_batch = staticmethod(terrariumI2CSensor.load_data_pipelined)
+
 class terrariumBME280Sensor(terrariumI2CSensor):
   TYPE = 'bme280'
   VALID_SENSOR_TYPES = ['temperature','humidity','altitude','presure']
@@ -540,6 +644,11 @@ class terrariumChirpSensor(terrariumSensorSource):
     return self.__temp_offset
 
   def load_data(self):
+    gpio_pins = self.get_address().split(',')
+    with terrariumI2CBusManager().get_bus(1 if len(gpio_pins) == 1 else int(gpio_pins[1])):
+      return self.__load_data()
+
+  def __load_data(self):
     data = None
     try:
       data = {}
@@ -595,6 +704,10 @@ class terrariumMLX90614Sensor(terrariumSensorSource):
         self.i2c_bus = data[1]
 
   def load_data(self):
+    with terrariumI2CBusManager().get_bus(self.i2c_bus):
+      return self.__load_data()
+
+  def __load_data(self):
     data = None
 
     try:
@@ -686,6 +799,22 @@ class terrariumAMG8833Sensor(terrariumSensorSource):
   TYPE = 'amg8833'
   VALID_SENSOR_TYPES = ['temperature']
 
+  FRAME_WIDTH = 8
+  FRAME_HEIGHT = 8
+  # Amount of frames to keep for the API
+  FRAME_HISTORY = 30
+  # Pixels within X degrees of the hottest pixel are part of the hotspot
+  HOTSPOT_RANGE = 2.0
+  # Pixel size of a heatmap image
+  HEATMAP_SCALE = 32
+
+  def __init__(self, sensor_id, sensor_type, address, name = '', callback_indicator = None):
+    self.__device = None
+    self.__frames = deque(maxlen=terrariumAMG8833Sensor.FRAME_HISTORY)
+    # Stats of the latest frame. They stay available between reads, also when polling slows down
+    self.__frame_stats = None
+    super(terrariumAMG8833Sensor,self).__init__(sensor_id, sensor_type, address, name, callback_indicator)
+
   def set_address(self,address):
     super(terrariumAMG8833Sensor,self).set_address(address)
     data = self.get_address().split(',')
@@ -693,16 +822,77 @@ class terrariumAMG8833Sensor(terrariumSensorSource):
     self.i2c_bus = 1
 
   def load_data(self):
+    with terrariumI2CBusManager().get_bus(self.i2c_bus):
+      return self.__load_data()
+
+  def __load_data(self):
     data = None
 
     try:
-      data = {}
-      sensor = mp.AMGGridEye(self.i2c_address,self.i2c_bus)
-      sensor.set_fps_mode(mp.AMGGridEye.FPS_1_MODE)
-      sensor.update_temperature()
-      data['temperature'] = float(sensor.get_temperature())
+      if self.__device is None:
+        self.__device = mp.AMGGridEye(self.i2c_address,self.i2c_bus)
+        self.__device.set_fps_mode(mp.AMGGridEye.FPS_1_MODE)
+
+      self.__device.update_temperature()
+      self.__device.update_pixel_temperature_matrix()
+      frame = numpy.array(self.__device.get_pixel_temperature_matrix(),dtype=numpy.float32).reshape(terrariumAMG8833Sensor.FRAME_HEIGHT,terrariumAMG8833Sensor.FRAME_WIDTH)
+      self.__frames.append((time(),frame))
+
+      self.__frame_stats = terrariumAMG8833Sensor.get_frame_stats(frame)
+      data = dict(self.__frame_stats)
+      data['temperature'] = float(self.__device.get_temperature())
 
     except Exception as ex:
-      print(ex)
+      logger.warning('Error getting new data from {} sensor \'{}\'. Error message: {}'.format(self.get_type(),self.get_name(),ex))
+      self.__device = None
+
+    return data
+
+  @staticmethod
+  def get_frame_stats(frame):
+    hotspot = numpy.unravel_index(numpy.argmax(frame),frame.shape)
+    return {'frame_min' : float(frame.min()),
+            'frame_max' : float(frame.max()),
+            'frame_mean' : float(frame.mean()),
+            'hotspot_x' : int(hotspot[1]),
+            'hotspot_y' : int(hotspot[0]),
+            # Percentage of the pixels that are part of the hotspot
+            'hotspot_area' : float(numpy.count_nonzero(frame >= frame.max() - terrariumAMG8833Sensor.HOTSPOT_RANGE)) / frame.size * 100.0}
+
+  def get_data(self, temperature_type = None):
+    data = super(terrariumAMG8833Sensor,self).get_data(temperature_type)
+    frame_stats = self.__frame_stats
+    if frame_stats is not None:
+      for field in ['hotspot_x','hotspot_y','hotspot_area']:
+        data[field] = frame_stats[field]
+
+      # Frame temperatures are measured in Celsius. Show them in the same unit as the current value
+      converter = terrariumUtils.get_value_converter(self.get_indicator())
+      for field in ['frame_min','frame_max','frame_mean']:
+        data[field] = converter(frame_stats[field])
+        if temperature_type is not None and data[field] is not None:
+          data[field] = terrariumUtils.convert_from_to(data[field],self.get_indicator(),temperature_type)
 
     return data
+
+  def get_frames(self, history = False):
+    # List of (timestamp, 8x8 NumPy array) tuples, oldest first
+    frames = list(self.__frames)
+    return frames if history else frames[-1:]
+
+  @staticmethod
+  def frames_to_binary(frames):
+    # Per frame: timestamp as little endian double, followed by the pixels row by row as little endian floats
+    return b''.join(numpy.float64(timestamp).astype('<f8').tobytes() + frame.astype('<f4').tobytes() for timestamp, frame in frames)
+
+  @staticmethod
+  def frames_to_png(frames):
+    # Heatmap from blue (coldest) to red (hottest) pixel. Multiple frames are placed next to each other
+    frames = numpy.hstack([frame for timestamp, frame in frames])
+    value_range = max(frames.max() - frames.min(),0.1)
+    values = (frames - frames.min()) / value_range
+    pixels = numpy.dstack((values * 255, (1.0 - numpy.abs(values * 2.0 - 1.0)) * 255, (1.0 - values) * 255)).astype(numpy.uint8)
+    image = Image.fromarray(pixels,'RGB').resize((pixels.shape[1] * terrariumAMG8833Sensor.HEATMAP_SCALE,pixels.shape[0] * terrariumAMG8833Sensor.HEATMAP_SCALE),Image.BICUBIC)
+    output = BytesIO()
+    image.save(output,'png')
+    return output.getvalue()
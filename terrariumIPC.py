@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+import terrariumLogging
+logger = terrariumLogging.logging.getLogger(__name__)
+
+try:
+  import thread as _thread
+except ImportError as ex:
+  import _thread
+
+import os
+import json
+import socket
+import shutil
+import tempfile
+import threading
+
+from gevent import sleep
+try:
+  from queue import Queue, Empty
+except ImportError:
+  from Queue import Queue, Empty
+
+# Line delimited JSON messages over a Unix socket between the engine process and the webserver process.
+# A request contains an attribute path on the engine, like engine.power_switches[<id>].toggle(), and an
+# operation on the end of that path: call, get, contains or subscribe.
+
+class terrariumIPCException(Exception):
+  '''The remote engine returned an error or could not be reached'''
+
+class terrariumIPCFile(object):
+  # Stand-in for an uploaded file that is already stored on disk by the webserver process
+  def __init__(self, filename, path):
+    self.filename = filename
+    self.__path = path
+
+  def save(self, destination, overwrite = False):
+    if os.path.isdir(destination):
+      destination = os.path.join(destination,self.filename)
+
+    if not overwrite and os.path.exists(destination):
+      raise IOError('File exists.')
+
+    shutil.move(self.__path,destination)
+
+class terrariumIPCServer(object):
+  SOCKET = '/dev/shm/terrariumpi.sock'
+  # Same limit as the engine uses for websocket clients
+  MAX_QUEUE_SIZE = 50
+
+  def __init__(self, engine, socket_file = None):
+    self.__engine = engine
+    self.__socket_file = terrariumIPCServer.SOCKET if socket_file is None else socket_file
+    self.__socket = None
+    self.__running = False
+
+  def start(self):
+    if os.path.exists(self.__socket_file):
+      os.unlink(self.__socket_file)
+
+    self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.__socket.bind(self.__socket_file)
+    os.chmod(self.__socket_file,0o600)
+    self.__socket.listen(16)
+
+    self.__running = True
+    _thread.start_new_thread(self.__accept_loop, ())
+    logger.info('Engine IPC server is listening at {}'.format(self.__socket_file))
+
+  def stop(self):
+    self.__running = False
+    try:
+      self.__socket.close()
+      os.unlink(self.__socket_file)
+    except Exception as ex:
+      pass
+
+    logger.info('Stopped engine IPC server')
+
+  def is_running(self):
+    return self.__running
+
+  def __accept_loop(self):
+    while self.__running:
+      try:
+        connection, address = self.__socket.accept()
+      except Exception as ex:
+        if self.__running:
+          logger.exception('Engine IPC server accept error: {}'.format(ex))
+        continue
+
+      _thread.start_new_thread(self.__handle_connection, (connection,))
+
+  def __resolve(self, path):
+    obj = self.__engine
+    for kind, name in path:
+      if 'attr' == kind:
+        if name.startswith('_'):
+          raise AttributeError('Private attribute {} is not available'.format(name))
+
+        obj = getattr(obj,name)
+      else:
+        obj = obj[name]
+
+    return obj
+
+  def __decode(self, value):
+    if isinstance(value,dict):
+      if '__file__' in value:
+        return terrariumIPCFile(value['__file__']['filename'],value['__file__']['path'])
+
+      return dict((key,self.__decode(item)) for key, item in value.items())
+
+    if isinstance(value,list):
+      return [self.__decode(item) for item in value]
+
+    return value
+
+  @staticmethod
+  def _send(connection, data):
+    connection.sendall((json.dumps(data,default=str) + '\n').encode('utf-8'))
+
+  def __handle_connection(self, connection):
+    reader = connection.makefile('rb')
+    try:
+      for line in reader:
+        request = json.loads(line.decode('utf-8'))
+        response = {'id' : request.get('id')}
+
+        if 'subscribe' == request['op']:
+          self.__stream_messages(connection)
+          break
+
+        try:
+          obj = self.__resolve(request['path'])
+          if 'call' == request['op']:
+            response['result'] = obj(*self.__decode(request.get('args',[])),**self.__decode(request.get('kwargs',{})))
+          elif 'contains' == request['op']:
+            response['result'] = self.__decode(request['args'][0]) in obj
+          elif 'keys' == request['op']:
+            response['result'] = list(obj)
+          else:
+            response['result'] = obj
+
+        except Exception as ex:
+          logger.exception('Engine IPC request {} failed: {}'.format(request,ex))
+          response['error'] = str(ex)
+
+        terrariumIPCServer._send(connection,response)
+
+    except Exception as ex:
+      logger.debug('Engine IPC connection closed: {}'.format(ex))
+
+    finally:
+      reader.close()
+      connection.close()
+
+  def __stream_messages(self, connection):
+    messages = Queue()
+    self.__engine.subscribe(messages)
+
+    while self.__running:
+      try:
+        message = messages.get(timeout=30)
+      except Empty:
+        if messages not in self.__engine.subscribed_queues:
+          # The engine dropped this subscription
+          break
+
+        continue
+
+      terrariumIPCServer._send(connection,{'message' : message})
+
+class terrariumIPCClient(object):
+  CONNECT_TIMEOUT = 60
+
+  def __init__(self, socket_file = None):
+    self.__socket_file = terrariumIPCServer.SOCKET if socket_file is None else socket_file
+    self.__connections = []
+    self.__lock = threading.Lock()
+    self.__request_id = 0
+    self.__upload_folder = tempfile.mkdtemp(prefix='terrariumpi_upload_')
+
+  def connect(self, timeout = None):
+    timeout = terrariumIPCClient.CONNECT_TIMEOUT if timeout is None else timeout
+    while True:
+      try:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(self.__socket_file)
+        return connection
+
+      except socket.error as ex:
+        connection.close()
+        timeout -= 0.5
+        if timeout <= 0:
+          raise terrariumIPCException('Unable to connect to engine at {}: {}'.format(self.__socket_file,ex))
+
+        sleep(0.5)
+
+  def __get_connection(self):
+    # Every concurrent request uses its own connection. Idle connections are reused
+    with self.__lock:
+      self.__request_id += 1
+      if len(self.__connections) > 0:
+        return self.__request_id, self.__connections.pop()
+
+    connection = self.connect()
+    return self.__request_id, (connection, connection.makefile('rb'))
+
+  def __release_connection(self, connection):
+    with self.__lock:
+      self.__connections.append(connection)
+
+  def __encode(self, value):
+    if hasattr(value,'save') and hasattr(value,'filename') and hasattr(value,'file'):
+      # Uploaded file. Store it on disk, the engine will move it to its final location
+      filename = tempfile.mktemp(dir=self.__upload_folder)
+      value.save(filename)
+      return {'__file__' : {'filename' : value.filename, 'path' : filename}}
+
+    if isinstance(value,dict) or hasattr(value,'allitems'):
+      return dict((key,self.__encode(value[key])) for key in value.keys())
+
+    if isinstance(value,(list,tuple)):
+      return [self.__encode(item) for item in value]
+
+    return value
+
+  def request(self, op, path, args = None, kwargs = None):
+    request_id, connection = self.__get_connection()
+    try:
+      terrariumIPCServer._send(connection[0],{'id' : request_id,
+                                              'op' : op,
+                                              'path' : path,
+                                              'args' : self.__encode(list(args or [])),
+                                              'kwargs' : self.__encode(kwargs or {})})
+      line = connection[1].readline()
+    except Exception as ex:
+      connection[1].close()
+      connection[0].close()
+      raise terrariumIPCException('Lost connection to engine: {}'.format(ex))
+
+    if not line:
+      connection[1].close()
+      connection[0].close()
+      raise terrariumIPCException('Lost connection to engine')
+
+    self.__release_connection(connection)
+    response = json.loads(line.decode('utf-8'))
+    if 'error' in response:
+      raise terrariumIPCException(response['error'])
+
+    return response.get('result')
+
+  def subscribe(self, queue):
+    connection = self.connect()
+    terrariumIPCServer._send(connection,{'id' : None, 'op' : 'subscribe', 'path' : []})
+    _thread.start_new_thread(self.__receive_messages, (connection,queue))
+
+  def __receive_messages(self, connection, queue):
+    reader = connection.makefile('rb')
+    try:
+      for line in reader:
+        queue.put(json.loads(line.decode('utf-8'))['message'])
+        if queue.qsize() > terrariumIPCServer.MAX_QUEUE_SIZE:
+          # Websocket client is gone
+          break
+
+    except Exception as ex:
+      logger.debug('Engine IPC message stream closed: {}'.format(ex))
+
+    finally:
+      reader.close()
+      connection.close()
+
+class terrariumIPCRemoteObject(object):
+  # Proxy for an object inside the engine process. Attribute and item lookups only extend the path,
+  # the actual request is done when the object is called, converted to a string or searched.
+  def __init__(self, client, path = None):
+    self._client = client
+    self._path = [] if path is None else path
+
+  def __getattr__(self, name):
+    if name.startswith('_'):
+      raise AttributeError(name)
+
+    return terrariumIPCRemoteObject(self._client, self._path + [['attr',name]])
+
+  def __getitem__(self, key):
+    return terrariumIPCRemoteObject(self._client, self._path + [['item',key]])
+
+  def __contains__(self, key):
+    return self._client.request('contains',self._path,[key])
+
+  def __iter__(self):
+    return iter(self._client.request('keys',self._path))
+
+  def __call__(self, *args, **kwargs):
+    return self._client.request('call',self._path,args,kwargs)
+
+  def __str__(self):
+    return str(self._client.request('get',self._path))
+
+  def get_value(self):
+    return self._client.request('get',self._path)
+
+class terrariumEngineProxy(terrariumIPCRemoteObject):
+  def __init__(self, socket_file = None):
+    super(terrariumEngineProxy,self).__init__(terrariumIPCClient(socket_file))
+    # Wait for the engine process to be available
+    self._client.connect().close()
+    logger.info('Connected to engine process')
+
+  def subscribe(self, queue):
+    self._client.subscribe(queue)
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+import terrariumLogging
+logger = terrariumLogging.logging.getLogger(__name__)
+
+import os
+import threading
+
+from terrariumUtils import terrariumSingleton
+
+class terrariumMetric(object):
+  TYPE = None
+
+  def __init__(self, name, description, labels = None):
+    self.name = name
+    self.description = description
+    self.labels = tuple(labels or [])
+    # Only protects this metric's own values. Updating or rendering a metric never touches engine locks
+    self._lock = threading.Lock()
+    self._values = {}
+
+  def _label_key(self, labels):
+    if len(labels) != len(self.labels):
+      raise ValueError('Metric {} expects labels {}, got {}'.format(self.name,self.labels,labels))
+
+    return tuple(str(label) for label in labels)
+
+  def _format_labels(self, key, extra = None):
+    labels = list(zip(self.labels,key))
+    if extra is not None:
+      labels.append(extra)
+
+    if len(labels) == 0:
+      return ''
+
+    return '{' + ','.join('{}="{}"'.format(name,value.replace('\\','\\\\').replace('"','\\"').replace('\n','\\n')) for name,value in labels) + '}'
+
+  @staticmethod
+  def _format_value(value):
+    if value == float('inf'):
+      return '+Inf'
+
+    return repr(float(value))
+
+  def _samples(self):
+    return []
+
+  def render(self):
+    lines = ['# HELP {} {}'.format(self.name,self.description),
+             '# TYPE {} {}'.format(self.name,self.TYPE)]
+
+    with self._lock:
+      samples = self._samples()
+
+    for name, labels, value in samples:
+      lines.append('{}{} {}'.format(name,labels,terrariumMetric._format_value(value)))
+
+    return '\n'.join(lines)
+
+class terrariumMetricCounter(terrariumMetric):
+  TYPE = 'counter'
+
+  def inc(self, amount = 1, *labels):
+    key = self._label_key(labels)
+    with self._lock:
+      self._values[key] = self._values.get(key,0.0) + amount
+
+  def _samples(self):
+    return [(self.name,self._format_labels(key),value) for key,value in self._values.items()]
+
+class terrariumMetricGauge(terrariumMetric):
+  TYPE = 'gauge'
+
+  def set(self, value, *labels):
+    key = self._label_key(labels)
+    with self._lock:
+      self._values[key] = float(value)
+
+  def inc(self, amount = 1, *labels):
+    key = self._label_key(labels)
+    with self._lock:
+      self._values[key] = self._values.get(key,0.0) + amount
+
+  def dec(self, amount = 1, *labels):
+    self.inc(-amount, *labels)
+
+  def _samples(self):
+    return [(self.name,self._format_labels(key),value) for key,value in self._values.items()]
+
+class terrariumMetricHistogram(terrariumMetric):
+  TYPE = 'histogram'
+  DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+  def __init__(self, name, description, labels = None, buckets = None):
+    super(terrariumMetricHistogram,self).__init__(name,description,labels)
+    self.buckets = tuple(sorted(buckets or terrariumMetricHistogram.DEFAULT_BUCKETS)) + (float('inf'),)
+
+  def observe(self, value, *labels):
+    key = self._label_key(labels)
+    with self._lock:
+      if key not in self._values:
+        self._values[key] = {'buckets' : [0] * len(self.buckets), 'sum' : 0.0, 'count' : 0}
+
+      data = self._values[key]
+      for index, bound in enumerate(self.buckets):
+        if value <= bound:
+          data['buckets'][index] += 1
+          break
+
+      data['sum'] += value
+      data['count'] += 1
+
+  def _samples(self):
+    samples = []
+    for key, data in self._values.items():
+      total = 0
+      for index, bound in enumerate(self.buckets):
+        total += data['buckets'][index]
+        samples.append((self.name + '_bucket',self._format_labels(key,('le',terrariumMetric._format_value(bound))),total))
+
+      samples.append((self.name + '_sum',self._format_labels(key),data['sum']))
+      samples.append((self.name + '_count',self._format_labels(key),data['count']))
+
+    return samples
+
+class terrariumMetrics(terrariumSingleton):
+  CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+  # In multi process mode the engine process writes its metrics to this file, and the webserver process serves it
+  SNAPSHOT = '/dev/shm/terrariumpi_metrics.prom'
+
+  def __init__(self):
+    self.__metrics = {}
+    self.__lock = threading.Lock()
+    logger.debug('Initialized metrics registry')
+
+  def __register(self, metric_class, name, *args, **kwargs):
+    with self.__lock:
+      if name not in self.__metrics:
+        self.__metrics[name] = metric_class(name, *args, **kwargs)
+      elif not isinstance(self.__metrics[name],metric_class):
+        raise ValueError('Metric {} is already registered as a {}'.format(name,self.__metrics[name].TYPE))
+
+      return self.__metrics[name]
+
+  def counter(self, name, description, labels = None):
+    return self.__register(terrariumMetricCounter, name, description, labels)
+
+  def gauge(self, name, description, labels = None):
+    return self.__register(terrariumMetricGauge, name, description, labels)
+
+  def histogram(self, name, description, labels = None, buckets = None):
+    return self.__register(terrariumMetricHistogram, name, description, labels, buckets)
+
+  def render(self):
+    with self.__lock:
+      metrics = sorted(self.__metrics.values(), key=lambda metric: metric.name)
+
+    return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+  def save_snapshot(self, filename = None):
+    filename = terrariumMetrics.SNAPSHOT if filename is None else filename
+    with open(filename + '.tmp','w') as snapshot:
+      snapshot.write(self.render())
+
+    # Atomic replace, so the webserver never reads a half written snapshot
+    os.rename(filename + '.tmp',filename)
+
+  @staticmethod
+  def load_snapshot(filename = None):
+    filename = terrariumMetrics.SNAPSHOT if filename is None else filename
+    try:
+      with open(filename) as snapshot:
+        return snapshot.read()
+    except IOError as ex:
+      logger.debug('No metrics snapshot available at {}: {}'.format(filename,ex))
+      return ''
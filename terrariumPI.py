@@ -15,21 +15,90 @@ try:
 except Exception as ex:
   pass
 
+import sys
+import signal
+import subprocess
+import psutil
+
 import terrariumLogging
 logger = terrariumLogging.logging.getLogger(__name__)
 
-from terrariumEngine import terrariumEngine
-from terrariumWebserver import terrariumWebserver
+from terrariumConfig import terrariumConfig
+from terrariumUtils import terrariumUtils
 logger.info('Starting terrariumPI')
 
-if __name__  == "__main__":
+def run_engine_process():
+  # Engine process in multi process mode. The webserver talks to it through terrariumIPC
+  from terrariumEngine import terrariumEngine
+  from terrariumIPC import terrariumIPCServer
+  from terrariumMetrics import terrariumMetrics
+  from terrariumWebcam import terrariumWebcam
+
+  terrariumWebcam.set_worker_pool(max(1,psutil.cpu_count() - 1))
+
+  logger.debug('Starting terrariumPI engine process')
+  engine = terrariumEngine()
+  ipc_server = terrariumIPCServer(engine)
+  ipc_server.start()
+  logger.debug('Started terrariumPI engine process')
+
+  def stop_engine(signum, frame):
+    ipc_server.stop()
+
+  signal.signal(signal.SIGTERM, stop_engine)
+  signal.signal(signal.SIGINT, stop_engine)
+
+  # The webserver process serves the metrics from a snapshot, so scraping does not wait on the engine
+  metrics_counter = 0
+  while ipc_server.is_running():
+    if metrics_counter % 10 == 0:
+      terrariumMetrics().save_snapshot()
+
+    metrics_counter += 1
+    sleep(1)
+
+  logger.info('Stopping terrariumPI engine process')
+  engine.stop()
+  terrariumWebcam.set_worker_pool(None)
+
+def run_webserver_process():
+  # Webserver process in multi process mode. The engine runs in a child process
+  from terrariumIPC import terrariumEngineProxy
+  from terrariumWebserver import terrariumWebserver
+
+  logger.debug('Starting terrariumPI engine process')
+  engine_process = subprocess.Popen([sys.executable,os.path.join(BASEDIR,'terrariumPI.py'),'engine'])
+  engine = terrariumEngineProxy()
+  logger.debug('Started terrariumPI engine process with PID {}'.format(engine_process.pid))
+
+  logger.debug('Starting terrariumPI webserver')
+  webserver = terrariumWebserver(engine)
+  logger.debug('Started terrariumPI webserver')
+  webserver.start()
+  logger.info('Stopping terrariumPI')
+  engine_process.terminate()
+  engine_process.wait()
+
+def run_single_process():
+  from terrariumEngine import terrariumEngine
+  from terrariumWebserver import terrariumWebserver
+
   logger.debug('Starting terrariumPI engine')
-  terrariumEngine = terrariumEngine()
+  engine = terrariumEngine()
   logger.debug('Started terrariumPI engine')
   logger.debug('Starting terrariumPI webserver')
-  terrariumWebserver = terrariumWebserver(terrariumEngine)
+  webserver = terrariumWebserver(engine)
   logger.debug('Started terrariumPI webserver')
-  terrariumWebserver.start()
+  webserver.start()
   logger.info('Stopping terrariumPI')
-  terrariumEngine.stop()
+  engine.stop()
+
+if __name__  == "__main__":
+  if len(sys.argv) > 1 and 'engine' == sys.argv[1]:
+    run_engine_process()
+  elif terrariumUtils.is_true(terrariumConfig().get_system().get('multi_process',False)):
+    run_webserver_process()
+  else:
+    run_single_process()
+
   logger.info('Shutdown terrariumPI done. Bye bye ...')
@@ -6,50 +6,116 @@ import os.path
 import re
 import subprocess
 import json
-import sys
-import serial
+import threading
+import math
+import hmac
 
 from glob import iglob
+from collections import OrderedDict
 from time import time
 from pyownet import protocol
 from hashlib import md5
-from gevent import sleep
+from gevent import spawn, joinall, Timeout, get_hub
 
-from terrariumUtils import terrariumUtils, terrariumSingleton
+from terrariumUtils import terrariumUtils, terrariumSingleton, terrariumTTLCache
+from terrariumMetrics import terrariumMetrics
+from terrariumSerialDevice import terrariumSerialDeviceManager, terrariumSerialDeviceException
+from terrariumSensorFilter import terrariumSensorFilter, terrariumSensorFilterException, terrariumRingBuffer
 
-class terrariumSensorCache(terrariumSingleton):
+class terrariumSensorCache(terrariumTTLCache, terrariumSingleton):
   def __init__(self):
-    self.__cache = {}
-    self.__running = {}
+    super(terrariumSensorCache,self).__init__('sensors cache')
     logger.debug('Initialized sensors cache')
 
   def set_sensor_data(self,sensor_hash,sensor_data,cache_timeout = 30):
-    self.__cache[sensor_hash] = { 'data' : sensor_data, 'expire' : int(time()) + cache_timeout}
-    logger.debug('Added new sensor to sensors cache with hash: {}. Total in cache: {}'.format(sensor_hash,len(self.__cache)))
+    self.set(sensor_hash,sensor_data,cache_timeout)
 
   def get_sensor_data(self,sensor_hash):
-    if sensor_hash in self.__cache and self.__cache[sensor_hash]['expire'] > int(time()):
-      return self.__cache[sensor_hash]['data']
+    return self.get(sensor_hash)
 
   def clear_sensor_data(self,sensor_hash):
-    if sensor_hash in self.__cache:
-      del(self.__cache[sensor_hash])
+    self.clear(sensor_hash)
 
-  def is_running(self,sensor_hash):
-    if sensor_hash in self.__running:
-      return True
+class terrariumSensorHealth(object):
+  # Rolling read statistics of a single sensor, with a fixed size
+  LATENCY_SAMPLES = 100
 
-    return False
+  __slots__ = ('__latencies', '__requests', '__loads', '__success', '__failure', '__erratic', '__last_error', '__last_error_time')
+
+  def __init__(self):
+    self.__latencies = terrariumRingBuffer(terrariumSensorHealth.LATENCY_SAMPLES)
+    self.__requests = 0
+    self.__loads = 0
+    self.__success = 0
+    self.__failure = 0
+    self.__erratic = 0
+    self.__last_error = None
+    self.__last_error_time = None
+
+  def request(self):
+    self.__requests += 1
+
+  def read(self, duration):
+    self.__loads += 1
+    self.__latencies.append(duration)
+
+  def success(self):
+    self.__success += 1
+
+  def failure(self, message = None):
+    self.__failure += 1
+    if message is not None:
+      self.error(message)
+
+  def erratic(self, message):
+    self.__erratic += 1
+    self.error(message)
+
+  def error(self, message):
+    self.__last_error = message
+    self.__last_error_time = int(time())
 
-  def set_running(self,sensor_hash):
-    self.__running[sensor_hash] = True
+  @staticmethod
+  def percentile(values, percentile):
+    # Nearest rank on sorted values
+    if len(values) == 0:
+      return None
 
-  def clear_running(self,sensor_hash):
-    del(self.__running[sensor_hash])
+    return values[max(0,int(math.ceil(percentile / 100.0 * len(values))) - 1)]
+
+  def get_data(self):
+    latencies = sorted(self.__latencies.values())
+    return {'latency_p50' : terrariumSensorHealth.percentile(latencies,50),
+            'latency_p95' : terrariumSensorHealth.percentile(latencies,95),
+            'success' : self.__success,
+            'failure' : self.__failure,
+            'erratic' : self.__erratic,
+            'last_error' : self.__last_error,
+            'last_error_time' : self.__last_error_time,
+            # Requests that did not need a hardware read. Waiting on a read of an other sensor of the same device counts as a hit
+            'cache_hit_ratio' : None if self.__requests == 0 else max(0.0,1.0 - float(self.__loads) / self.__requests)}
 
 class terrariumSensorSource(object):
   TYPE = None
   VALID_SENSOR_TYPES = []
+  # Sensors that can have a different value per sensor type on the same address, need their own cache key per sensor type
+  CACHE_KEY_PER_SENSOR_TYPE = False
+
+  METRIC_READ_DURATION = terrariumMetrics().histogram('terrariumpi_sensor_read_duration_seconds','Duration of sensor hardware reads in seconds',['hardwaretype'])
+  METRIC_READ_ERRORS = terrariumMetrics().counter('terrariumpi_sensor_read_errors_total','Number of sensor hardware reads without data',['hardwaretype'])
+
+  # Hardware that can read multiple devices in one go overrides this with a static method.
+  # It gets a list of sensors, one per device, and returns the new data per sensor cache key
+  load_data_batch = None
+
+  # Adaptive polling. Sensors with stable values are read less often, up to POLL_INTERVAL_MAX seconds. Changing values
+  # and values close to the alarm limits are read every update again
+  POLL_INTERVAL_MIN = 0
+  POLL_INTERVAL_MAX = 120
+  # Changes smaller then this part of the valid range (limit_min - limit_max) are seen as stable
+  POLL_DEADBAND = 0.005
+  # Values within this part of the alarm range from alarm_min or alarm_max are read every update
+  POLL_ALARM_MARGIN = 0.1
 
   def __init__(self, sensor_id, sensor_type, address, name = '', callback_indicator = None):
     self.__sensor_cache = terrariumSensorCache()
@@ -58,8 +124,14 @@ class terrariumSensorSource(object):
     self.__current_value = None
     self.__erratic_errors = 0
     self.__last_update = 0
+    self.__poll_interval = self.POLL_INTERVAL_MIN
+    self.__next_update = 0
 
     self.exclude_avg = False
+    self.__filter = None
+    self.__converter = None
+    self.__converter_indicator = None
+    self.__health = terrariumSensorHealth()
 
     self.sensor_id = sensor_id
     self.notification = True
@@ -81,88 +153,177 @@ class terrariumSensorSource(object):
     # Default max diff: abs(limit_min-limit_max) * 25%
     self.set_max_diff(abs(self.get_limit_max() - self.get_limit_min()) / 4.0)
     logger.info('Loaded %s %s sensor \'%s\' on location %s.' % (self.get_type(),self.get_sensor_type(),self.get_name(),self.get_address()))
-
-    self.update()
+    # The first read is done by the engine update loop, so loading sensors does not wait on the hardware
 
   def get_sensor_cache_key(self):
     if self.__sensor_cache_key is None:
-      self.__sensor_cache_key = md5((self.get_type() + self.get_address()).encode()).hexdigest()
+      self.__sensor_cache_key = md5((self.get_type() + self.get_address() + (self.get_sensor_type() if self.CACHE_KEY_PER_SENSOR_TYPE else '')).encode()).hexdigest()
 
     return self.__sensor_cache_key
 
+  def __convert(self, value):
+    # Convert a measurement to the current indicator unit. The converter is only looked up again when the indicator changes
+    indicator = self.get_indicator()
+    if indicator != self.__converter_indicator:
+      self.__converter = terrariumUtils.get_value_converter(indicator)
+      self.__converter_indicator = indicator
+
+    try:
+      return float(self.__converter(value))
+    except (TypeError, ValueError) as ex:
+      return None
+
   def __within_limits(self,current_value):
     if self.get_current() is None or self.get_sensor_type() in ['uva','uvb','light'] or self.get_type() in ['ytxx-digital']:
       return True
 
     return abs(self.get_current() - current_value) < self.get_max_diff()
 
-  def update(self, force = False):
-    starttime = time()
-    cached_data = self.__sensor_cache.get_sensor_data(self.get_sensor_cache_key())
+  def __near_alarm(self):
+    if self.get_alarm_min() >= self.get_alarm_max():
+      return False
+
+    margin = (self.get_alarm_max() - self.get_alarm_min()) * self.POLL_ALARM_MARGIN
+    return not self.get_alarm_min() + margin <= self.get_current() <= self.get_alarm_max() - margin
+
+  def __schedule_update(self, previous_value, previous_update, starttime):
+    if previous_value is None or self.get_current() is None or self.__near_alarm():
+      self.__poll_interval = self.POLL_INTERVAL_MIN
+
+    else:
+      deadband = abs(self.get_limit_max() - self.get_limit_min()) * self.POLL_DEADBAND
+      change = abs(self.get_current() - previous_value)
+
+      if change <= deadband:
+        # Stable, back off. Start at one update interval, so at least one update is skipped after the second stable read
+        self.__poll_interval = min(self.POLL_INTERVAL_MAX,max(terrariumSensor.UPDATE_TIMEOUT,self.__poll_interval * 2))
+      elif change <= deadband * 2:
+        self.__poll_interval /= 2.0
+      else:
+        self.__poll_interval = self.POLL_INTERVAL_MIN
+
+      if self.__poll_interval > self.POLL_INTERVAL_MIN and self.get_alarm_min() < self.get_alarm_max():
+        # Make sure the alarm limit is not passed before the next read when the value keeps changing at the current rate
+        rate = change / max(1.0,starttime - previous_update)
+        distance = min(abs(self.get_current() - self.get_alarm_min()),abs(self.get_alarm_max() - self.get_current()))
+        if rate > 0:
+          self.__poll_interval = max(self.POLL_INTERVAL_MIN,min(self.__poll_interval,distance / rate / 2.0))
+
+    self.__next_update = starttime + self.__poll_interval
+
+  def get_poll_interval(self):
+    return self.__poll_interval
 
-    if (cached_data is None or force) and not self.__sensor_cache.is_running(self.get_sensor_cache_key()):
-      self.__sensor_cache.set_running(self.get_sensor_cache_key())
-      logger.debug('Start getting new {} sensor data from location: \'{}\''.format(self.get_sensor_type(),self.get_address()))
+  def is_update_due(self, now = None):
+    return (time() if now is None else now) >= self.__next_update
+
+  def __load_data(self, sensors):
+    logger.debug('Start getting new {} sensor data from location: \'{}\''.format(self.get_sensor_type(),self.get_address()))
+    readtime = time()
+    try:
       new_data = self.load_data()
+    except Exception as ex:
+      for sensor in sensors:
+        sensor.add_read_error(str(ex))
+      raise
 
-      if new_data is not None:
-        self.__sensor_cache.set_sensor_data(self.get_sensor_cache_key(),new_data,terrariumSensor.UPDATE_TIMEOUT)
-        cached_data = new_data
+    finally:
+      readtime = time()-readtime
+      terrariumSensorSource.METRIC_READ_DURATION.observe(readtime,self.get_type())
+      for sensor in sensors:
+        sensor.add_read_duration(readtime)
 
-      self.__sensor_cache.clear_running(self.get_sensor_cache_key())
+    if new_data is None:
+      terrariumSensorSource.METRIC_READ_ERRORS.inc(1,self.get_type())
+      for sensor in sensors:
+        sensor.add_read_error('No data from hardware')
 
-    current = None if cached_data is None or self.get_sensor_type() not in cached_data else cached_data[self.get_sensor_type()]
-    if current is None or not (self.get_limit_min() <= terrariumUtils.conver_to_value(current,self.get_indicator()) <= self.get_limit_max()):
+    return new_data
+
+  # Read statistics. All sensors of the same device get the statistics of the shared reads
+  def add_request(self):
+    self.__health.request()
+
+  def add_read_duration(self, duration):
+    self.__health.read(duration)
+
+  def add_read_error(self, message):
+    self.__health.error(message)
+
+  def get_health(self):
+    return self.__health.get_data()
+
+  def has_device_data(self):
+    return self.__sensor_cache.get_sensor_data(self.get_sensor_cache_key()) is not None
+
+  def set_device_data(self, data):
+    self.__sensor_cache.set_sensor_data(self.get_sensor_cache_key(),data,terrariumSensor.UPDATE_TIMEOUT)
+
+  def get_device_data(self, force = False, sensors = None):
+    # All values of the physical device, shared through the cache by all sensors on the same device.
+    # Sensors is the list of all sensors on the device, default only this sensor
+    sensors = [self] if sensors is None else sensors
+    for sensor in sensors:
+      sensor.add_request()
+
+    return self.__sensor_cache.get_or_load(self.get_sensor_cache_key(),lambda: self.__load_data(sensors),terrariumSensor.UPDATE_TIMEOUT,force)
+
+  def update(self, force = False):
+    starttime = time()
+    self.process_data(self.get_device_data(force),starttime)
+
+  def process_data(self, cached_data, starttime = None):
+    starttime = time() if starttime is None else starttime
+    current = None if cached_data is None else cached_data.get(self.sensor_type)
+    value = None if current is None else self.__convert(current)
+    if value is None or not (self.limit_min <= value <= self.limit_max):
       # Invalid current value.... log and ingore
-      self.__sensor_cache.clear_sensor_data(self.get_sensor_cache_key())
-      logger.warning('Measured value %s%s from %s sensor \'%s\' is outside valid range %.2f%s - %.2f%s in %.5f seconds.' % (terrariumUtils.conver_to_value(current,self.get_indicator()),
-                                                                                                                            self.get_indicator(),
-                                                                                                                            self.get_type(),
-                                                                                                                            self.get_name(),
-                                                                                                                            self.get_limit_min(),
-                                                                                                                            self.get_indicator(),
-                                                                                                                            self.get_limit_max(),
-                                                                                                                            self.get_indicator(),
-                                                                                                                            time()-starttime))
-
-    elif not self.__within_limits(terrariumUtils.conver_to_value(current,self.get_indicator())):
+      # A missing value is already registered as read error
+      self.__health.failure(None if value is None else 'Value {} is outside valid range'.format(value))
+      if logger.isEnabledFor(terrariumLogging.logging.WARNING):
+        indicator = self.get_indicator()
+        logger.warning('Measured value %s%s from %s sensor \'%s\' is outside valid range %.2f%s - %.2f%s in %.5f seconds.',
+                       value,indicator,self.get_type(),self.name,self.limit_min,indicator,self.limit_max,indicator,time()-starttime)
+
+      self.__next_update = 0
+      return
+
+    if self.__filter is not None:
+      # The filter takes care of spikes and noise, so the erratic check is not needed
+      current = self.__filter.filter(float(current))
+
+    elif not self.__within_limits(value):
       self.__erratic_errors += 1
-      logger.warning('Measured value %s%s from %s sensor \'%s\' is erratic compared to previous value %s%s in %.5f seconds.' % (terrariumUtils.conver_to_value(current,self.get_indicator()),
-                                                                                                                                self.get_indicator(),
-                                                                                                                                self.get_type(),
-                                                                                                                                self.get_name(),
-                                                                                                                                self.__current_value,
-                                                                                                                                self.get_indicator(),
-                                                                                                                                time()-starttime))
+      self.__health.erratic('Value {} is erratic compared to previous value {}'.format(value,self.get_current()))
+      if logger.isEnabledFor(terrariumLogging.logging.WARNING):
+        indicator = self.get_indicator()
+        logger.warning('Measured value %s%s from %s sensor \'%s\' is erratic compared to previous value %s%s in %.5f seconds.',
+                       value,indicator,self.get_type(),self.name,self.__current_value,indicator,time()-starttime)
+
       if self.__erratic_errors >= 5:
         # After 5 times, use the current value as the new truth
         self.__current_value = current
         self.__last_update = int(starttime)
-        logger.warning('After %s erratic measurements is the current value %s%s is promoted to a valid value for %s sensor \'%s\' in %.5f seconds.' %
-                                                                                                                                   (self.__erratic_errors,
-                                                                                                                                    self.get_current(),
-                                                                                                                                    self.get_indicator(),
-                                                                                                                                    self.get_type(),
-                                                                                                                                    self.get_name(),
-                                                                                                                                    time()-starttime))
+        if logger.isEnabledFor(terrariumLogging.logging.WARNING):
+          logger.warning('After %s erratic measurements is the current value %s%s is promoted to a valid value for %s sensor \'%s\' in %.5f seconds.',
+                         self.__erratic_errors,value,self.get_indicator(),self.get_type(),self.name,time()-starttime)
         self.__erratic_errors = 0
 
+      self.__next_update = 0
+      return
 
-      else:
-        self.__sensor_cache.clear_sensor_data(self.get_sensor_cache_key())
+    previous_value = self.get_current()
+    previous_update = self.__last_update
+    self.__health.success()
+    self.__erratic_errors = 0
+    self.__last_update = int(starttime)
+    self.__current_value = current
+    if logger.isEnabledFor(terrariumLogging.logging.INFO):
+      indicator = self.get_indicator()
+      logger.info('Updated %s sensor \'%s\' from %.2f%s to %.2f%s in %.5f seconds',
+                  self.get_type(),self.name,0 if previous_value is None else previous_value,indicator,self.get_current(),indicator,time()-starttime)
 
-    else:
-      self.__erratic_errors = 0
-
-      self.__last_update = int(starttime)
-      logger.info('Updated %s sensor \'%s\' from %.2f%s to %.2f%s in %.5f seconds' % (self.get_type(),
-                                                                                      self.get_name(),
-                                                                                      0 if self.get_current() is None else self.get_current(),
-                                                                                      self.get_indicator(),
-                                                                                      terrariumUtils.conver_to_value(current,self.get_indicator()),
-                                                                                      self.get_indicator(),
-                                                                                      time()-starttime))
-      self.__current_value = current
+    self.__schedule_update(previous_value,previous_update,starttime)
 
   def get_data(self, temperature_type = None):
     data = {'id' : self.get_id(),
@@ -179,7 +340,9 @@ class terrariumSensorSource(object):
             'max_diff' : self.get_max_diff(),
             'alarm' : self.get_alarm(),
             'error' : not self.is_active(),
-            'exclude_avg' : self.get_exclude_avg()
+            'exclude_avg' : self.get_exclude_avg(),
+            'filter' : self.get_filter(),
+            'health' : self.get_health()
             }
 
     if 'temperature' == self.get_sensor_type() and temperature_type is not None and temperature_type != self.get_indicator():
@@ -195,6 +358,12 @@ class terrariumSensorSource(object):
   def get_last_update(self):
     return self.__last_update
 
+  def restore_state(self, current, last_update):
+    # Only restore a previous value when there is no new measurement yet
+    if self.__current_value is None and current is not None:
+      self.__current_value = current
+      self.__last_update = int(last_update)
+
   def load_data(self):
     return None
 
@@ -214,6 +383,7 @@ class terrariumSensorSource(object):
 
   def set_address(self,address):
     self.sensor_address = address
+    self.__sensor_cache_key = None
 
   def get_address(self):
     return self.sensor_address
@@ -260,6 +430,15 @@ class terrariumSensorSource(object):
   def get_exclude_avg(self):
     return self.exclude_avg
 
+  def set_filter(self,value):
+    try:
+      self.__filter = terrariumSensorFilter(value)
+    except terrariumSensorFilterException as ex:
+      logger.warning('Ignoring filter \'{}\' for {} sensor \'{}\', keeping the current filter: {}'.format(value,self.get_type(),self.get_name(),ex))
+
+  def get_filter(self):
+    return None if self.__filter is None else self.__filter.get_config()
+
   def get_indicator(self):
     # Use a callback from terrariumEngine for 'realtime' updates
     return self.__indicator(self.get_sensor_type())
@@ -268,7 +447,7 @@ class terrariumSensorSource(object):
     if self.__current_value is None:
       return None
 
-    return terrariumUtils.conver_to_value(self.__current_value,self.get_indicator())
+    return self.__convert(self.__current_value)
 
 
   def get_alarm(self):
@@ -293,25 +472,265 @@ class terrariumSensorSource(object):
 class terrariumRemoteSensor(terrariumSensorSource):
   TYPE = 'remote'
   VALID_SENSOR_TYPES = []
+  # Sensors with the same url and a different #fragment share the downloaded document for X seconds
+  DOCUMENT_TIMEOUT = 10
+  # Every remote sensor has its own value, also when sensors of different types use the same url
+  CACHE_KEY_PER_SENSOR_TYPE = True
 
   def load_data(self):
-    data = terrariumUtils.get_remote_data(self.get_address())
+    address = self.get_address().split('#',1)
+    data = terrariumSensorCache().get_or_load(md5(address[0].encode()).hexdigest(),
+                                              lambda: terrariumUtils.get_remote_data(address[0]),
+                                              terrariumRemoteSensor.DOCUMENT_TIMEOUT)
     if data is None:
       return None
 
+    if len(address) == 2 and isinstance(data,(dict,list)):
+      try:
+        data = terrariumUtils.get_json_path(data,address[1])
+      except Exception as ex:
+        logger.warning('Remote sensor \'{}\' has no value at path {} in document {}'.format(self.get_name(),address[1],address[0]))
+        return None
+
     return { self.get_sensor_type() : data}
 
+  @staticmethod
+  def load_data_concurrent(sensors):
+    # Request all remote sensors at the same time. Sensors on the same url wait for a single download,
+    # and the HTTP client limits the parallel requests per host
+    jobs = [(sensor,spawn(sensor.load_data)) for sensor in sensors]
+    joinall([job for sensor, job in jobs])
+    return dict((sensor.get_sensor_cache_key(),job.value) for sensor, job in jobs)
+
+  load_data_batch = load_data_concurrent
+
+class terrariumPushSensor(terrariumSensorSource):
+  # Sensor that is never polled. The device sends its readings to the API (POST /api/sensors/push) or to the line protocol
+  # of terrariumSensorPushServer. Enter the address as <device id>,<token>. The token is split off and stored separately,
+  # so it is never part of the sensor data. All sensors of the same device use the same token
+  TYPE = 'push'
+  VALID_SENSOR_TYPES = []
+
+  def __init__(self, sensor_id, sensor_type, address, name = '', callback_indicator = None):
+    self.__token = None
+    super(terrariumPushSensor,self).__init__(sensor_id, sensor_type, address, name, callback_indicator)
+
+  def set_address(self,address):
+    address = address.split(',',1)
+    if len(address) == 2:
+      self.set_token(address[1])
+
+    super(terrariumPushSensor,self).set_address(address[0].strip())
+
+  def set_token(self,token):
+    token = None if token is None else str(token).strip()
+    self.__token = None if token in [None,''] else token
+
+  def get_token(self):
+    return self.__token
+
+  def get_device_id(self):
+    return self.get_address()
+
+  def is_valid_token(self, token):
+    if self.__token is None or token is None:
+      return False
+
+    return hmac.compare_digest(self.__token.encode('utf-8'),str(token).encode('utf-8'))
+
+  def is_update_due(self, now = None):
+    # New readings are processed directly when they are pushed
+    return False
+
+  def get_device_data(self, force = False, sensors = None):
+    return terrariumSensorCache().get_sensor_data(self.get_sensor_cache_key())
+
+  def push_data(self, readings):
+    # Devices can push a part of their values. Merge them with the other recently pushed values
+    data = dict(self.get_device_data() or {})
+    data.update(readings)
+    self.set_device_data(data)
+
+class terrariumScriptWorker(object):
+  # Long running sensor script, started once and shared by all sensors with the same script. It gets one JSON request per line on stdin:
+  #   {"id": 1, "type": "temperature"}
+  # and answers with one JSON line on stdout, with a single value or an object with the values per sensor type:
+  #   {"id": 1, "value": 21.5} or {"id": 1, "temperature": 21.5, "humidity": 60.1}
+  READ_TIMEOUT = 10
+  # After X failures in a row the sensors fall back to running the script per read. Try the worker again after Y seconds
+  MAX_FAILURES = 3
+  RETRY_TIMEOUT = 10 * 60
+
+  __workers = {}
+  __workers_lock = threading.Lock()
+
+  def __init__(self, script):
+    self.__script = script
+    self.__process = None
+    self.__lock = threading.Lock()
+    self.__request_id = 0
+    self.__failures = 0
+    self.__last_failure = 0
+    self.__users = set()
+
+  @staticmethod
+  def get_worker(script, user):
+    with terrariumScriptWorker.__workers_lock:
+      if script not in terrariumScriptWorker.__workers:
+        terrariumScriptWorker.__workers[script] = terrariumScriptWorker(script)
+
+      worker = terrariumScriptWorker.__workers[script]
+      worker.__users.add(user)
+      return worker
+
+  @staticmethod
+  def release_worker(script, user):
+    # The worker process is stopped when the last sensor using it is gone
+    with terrariumScriptWorker.__workers_lock:
+      worker = terrariumScriptWorker.__workers.get(script)
+      if worker is None:
+        return
+
+      worker.__users.discard(user)
+      if len(worker.__users) > 0:
+        return
+
+      del(terrariumScriptWorker.__workers[script])
+
+    worker.stop()
+
+  def is_available(self):
+    if self.__failures >= terrariumScriptWorker.MAX_FAILURES and time() - self.__last_failure < terrariumScriptWorker.RETRY_TIMEOUT:
+      return False
+
+    return True
+
+  def __start(self):
+    logger.info('Starting sensor script worker: {}'.format(self.__script))
+    self.__process = subprocess.Popen(self.__script,shell=True,stdin=subprocess.PIPE,stdout=subprocess.PIPE,universal_newlines=True,bufsize=1)
+
+  def read(self, sensor_type):
+    with self.__lock:
+      try:
+        if self.__process is None or self.__process.poll() is not None:
+          if self.__process is not None:
+            logger.warning('Sensor script worker {} stopped with exit code {}. Restarting'.format(self.__script,self.__process.returncode))
+
+          self.__start()
+
+        self.__request_id += 1
+        self.__process.stdin.write(json.dumps({'id' : self.__request_id, 'type' : sensor_type}) + '\n')
+        self.__process.stdin.flush()
+
+        line = None
+        with Timeout(terrariumScriptWorker.READ_TIMEOUT,False):
+          line = self.__process.stdout.readline()
+
+        if not line:
+          raise IOError('No answer within {} seconds'.format(terrariumScriptWorker.READ_TIMEOUT))
+
+        data = self.__parse(line,sensor_type,self.__request_id)
+        self.__failures = 0
+        return data
+
+      except Exception as ex:
+        self.__failures += 1
+        self.__last_failure = time()
+        logger.warning('Sensor script worker {} failed ({} times in a row): {}'.format(self.__script,self.__failures,ex))
+        self.__stop()
+
+    return None
+
+  def __parse(self, line, sensor_type, request_id):
+    response = json.loads(line)
+    if response.get('id') != request_id:
+      raise IOError('Answer for request {} while waiting for request {}'.format(response.get('id'),request_id))
+
+    if 'error' in response:
+      logger.warning('Sensor script worker {} could not read {}: {}'.format(self.__script,sensor_type,response['error']))
+      return None
+
+    del(response['id'])
+    return {sensor_type : response['value']} if 'value' in response else response
+
+  def read_once(self, sensor_type):
+    # Fallback: start the script for a single request. The script stops when its input is closed
+    try:
+      process = subprocess.Popen(self.__script,shell=True,stdin=subprocess.PIPE,stdout=subprocess.PIPE,universal_newlines=True)
+      with Timeout(terrariumScriptWorker.READ_TIMEOUT):
+        output = process.communicate(json.dumps({'id' : 0, 'type' : sensor_type}) + '\n')[0]
+
+      return self.__parse(output.strip().split('\n')[0],sensor_type,0)
+
+    except (Exception, Timeout) as ex:
+      logger.warning('Sensor script {} failed a single read: {}'.format(self.__script,ex))
+      try:
+        process.kill()
+      except Exception as ex:
+        pass
+
+    return None
+
+  def __stop(self):
+    if self.__process is not None:
+      try:
+        self.__process.kill()
+        self.__process.wait()
+      except Exception as ex:
+        pass
+
+      self.__process = None
+
+  def stop(self):
+    with self.__lock:
+      self.__stop()
+
 class terrariumScriptSensor(terrariumSensorSource):
   TYPE = 'script'
   VALID_SENSOR_TYPES = []
+  # Scripts with this address prefix are started once and read through terrariumScriptWorker
+  WORKER_PREFIX = 'worker:'
+  # A script may return a different value for every sensor type
+  CACHE_KEY_PER_SENSOR_TYPE = True
+
+  __worker_script = None
+
+  def __get_script(self):
+    address = self.get_address().strip()
+    if address.startswith(terrariumScriptSensor.WORKER_PREFIX):
+      return address[len(terrariumScriptSensor.WORKER_PREFIX):].strip(), True
+
+    return address, False
 
   def load_data(self):
-    data = terrariumUtils.get_script_data(self.get_address())
+    script, worker = self.__get_script()
+    if self.__worker_script is not None and (not worker or self.__worker_script != script):
+      # The address has changed
+      terrariumScriptWorker.release_worker(self.__worker_script,self.get_id())
+      self.__worker_script = None
+
+    if worker:
+      worker = terrariumScriptWorker.get_worker(script,self.get_id())
+      self.__worker_script = script
+      if worker.is_available():
+        return worker.read(self.get_sensor_type())
+
+      logger.debug('Sensor script worker {} is not available, running the script once'.format(script))
+      return worker.read_once(self.get_sensor_type())
+
+    data = terrariumUtils.get_script_data(script)
     if data is None:
       return None
 
     return { self.get_sensor_type() : data}
 
+  def stop(self):
+    if self.__worker_script is not None:
+      terrariumScriptWorker.release_worker(self.__worker_script,self.get_id())
+      self.__worker_script = None
+
+    super(terrariumScriptSensor,self).stop()
+
 class terrarium1WSensor(terrariumSensorSource):
   TYPE = 'w1'
   VALID_SENSOR_TYPES = ['temperature']
@@ -319,16 +738,32 @@ class terrarium1WSensor(terrariumSensorSource):
   W1_BASE_PATH = '/sys/bus/w1/devices/'
   W1_TEMP_REGEX = re.compile(r'(?P<type>t|f)=(?P<value>[0-9\-]+)',re.IGNORECASE)
 
+  # Every w1_slave read starts its own conversion of up to 750ms. With bulk reading, all devices on a bus master start converting
+  # at once through the kernel 'therm_bulk_read' interface, and the following reads only get the results. Masters without
+  # bulk read support (older kernels) still read all devices in parallel
+  BULK_READ = True
+  # Max seconds for reading all devices in a batch
+  BULK_READ_TIMEOUT = 10
+
+  @staticmethod
+  def read_raw_device(address):
+    with open(os.path.join(terrarium1WSensor.W1_BASE_PATH,address,'w1_slave'), 'r') as w1data:
+      return w1data.read()
+
+  @staticmethod
+  def read_device(address):
+    w1data = terrarium1WSensor.W1_TEMP_REGEX.search(terrarium1WSensor.read_raw_device(address))
+    if w1data:
+      # Found data
+      return float(w1data.group('value')) / 1000.0
+
+    return None
+
   def load_data(self):
     data = None
     try:
       if self.get_address() is not None:
-        with open(os.path.join(terrarium1WSensor.W1_BASE_PATH,self.get_address(),'w1_slave'), 'r') as w1data:
-          data = w1data.read()
-          w1data = terrarium1WSensor.W1_TEMP_REGEX.search(data)
-          if w1data:
-            # Found data
-            data = float(w1data.group('value')) / 1000.0
+        data = terrarium1WSensor.read_device(self.get_address())
     except Exception as ex:
       logger.exception('Error loading 1 Wire data at location: {} with error: {}'.format(os.path.join(terrarium1WSensor.W1_BASE_PATH,self.get_address(),'w1_slave'),ex))
 
@@ -337,24 +772,99 @@ class terrarium1WSensor(terrariumSensorSource):
 
     return { self.get_sensor_type() : data}
 
+  @staticmethod
+  def get_bus_master(address):
+    # The device folder links to a sub folder of its bus master, like /sys/devices/w1_bus_master1/28-0316a2797cff
+    return os.path.dirname(os.path.realpath(os.path.join(terrarium1WSensor.W1_BASE_PATH,address)))
+
+  @staticmethod
+  def trigger_bulk_conversion(master):
+    bulk_read = os.path.join(master,'therm_bulk_read')
+    if not os.path.isfile(bulk_read):
+      return False
+
+    with open(bulk_read,'w') as trigger:
+      trigger.write('trigger\n')
+
+    return True
+
+  @staticmethod
+  def load_data_bulk(sensors):
+    # Sysfs reads block until the conversion is done, so they run in the gevent thread pool
+    threadpool = get_hub().threadpool
+    endtime = time() + terrarium1WSensor.BULK_READ_TIMEOUT
+    sensors = [sensor for sensor in sensors if sensor.get_address() is not None]
+
+    if terrarium1WSensor.BULK_READ:
+      masters = set(terrarium1WSensor.get_bus_master(sensor.get_address()) for sensor in sensors)
+      for master, job in [(master,threadpool.spawn(terrarium1WSensor.trigger_bulk_conversion,master)) for master in masters]:
+        if time() >= endtime:
+          break
+
+        try:
+          if job.get(timeout=endtime - time()):
+            logger.debug('Started bulk temperature conversion on 1 Wire bus master {}'.format(master))
+        except Timeout as ex:
+          logger.warning('Starting bulk temperature conversion on 1 Wire bus master {} took more then {} seconds'.format(master,terrarium1WSensor.BULK_READ_TIMEOUT))
+        except Exception as ex:
+          logger.warning('Error starting bulk temperature conversion on 1 Wire bus master {}. Error message: {}'.format(master,ex))
+
+    data = {}
+    skipped = 0
+    for sensor, job in [(sensor,threadpool.spawn(terrarium1WSensor.read_device,sensor.get_address())) for sensor in sensors]:
+      if time() >= endtime and not job.ready():
+        # Past the deadline only the finished reads are used. The others are read again on the next update
+        skipped += 1
+        continue
+
+      try:
+        value = job.get(timeout=max(0,endtime - time()))
+        if value is not None:
+          data[sensor.get_sensor_cache_key()] = {sensor.get_sensor_type() : value}
+
+      except Timeout as ex:
+        skipped += 1
+      except Exception as ex:
+        logger.warning('Error loading 1 Wire data at location: {} with error: {}'.format(os.path.join(terrarium1WSensor.W1_BASE_PATH,sensor.get_address(),'w1_slave'),ex))
+
+    if skipped > 0:
+      logger.warning('Reading 1 Wire devices took more then {} seconds. Skipped {} of {} devices'.format(terrarium1WSensor.BULK_READ_TIMEOUT,skipped,len(sensors)))
+
+    return data
+
+  load_data_batch = load_data_bulk
+
   @staticmethod
   def scan_sensors(callback = None):
-    # Scanning w1 system bus
-    for address in iglob(terrarium1WSensor.W1_BASE_PATH + '[1-9][0-9]-*'):
-      if not os.path.isfile(address + '/w1_slave'):
-        break
+    # Scanning w1 system bus. All devices are read at the same time in the gevent thread pool,
+    # so the reads do not block the other scanners and the scan deadline
+    threadpool = get_hub().threadpool
+    addresses = [os.path.basename(address) for address in iglob(terrarium1WSensor.W1_BASE_PATH + '[1-9][0-9]-*') if os.path.isfile(address + '/w1_slave')]
+
+    if terrarium1WSensor.BULK_READ:
+      masters = set(terrarium1WSensor.get_bus_master(address) for address in addresses)
+      for job in [threadpool.spawn(terrarium1WSensor.trigger_bulk_conversion,master) for master in masters]:
+        try:
+          job.get()
+        except Exception as ex:
+          logger.debug('Error starting bulk temperature conversion during 1 Wire scan: {}'.format(ex))
 
-      data = ''
-      with open(address + '/w1_slave', 'r') as w1data:
-        data = w1data.read()
+    for address, job in [(address,threadpool.spawn(terrarium1WSensor.read_raw_device,address)) for address in addresses]:
+      try:
+        w1data = terrarium1WSensor.W1_TEMP_REGEX.search(job.get())
+      except Exception as ex:
+        logger.warning('Error scanning 1 Wire device {}. Error message: {}'.format(address,ex))
+        continue
 
-      w1data = terrarium1WSensor.W1_TEMP_REGEX.search(data)
       if w1data:
         # Found valid data
-        yield terrarium1WSensor(None,
-                                'temperature' if 't' == w1data.group('type') else 'humidity',
-                                os.path.basename(address),
-                                callback_indicator = callback)
+        sensor = terrarium1WSensor(None,
+                                   'temperature' if 't' == w1data.group('type') else 'humidity',
+                                   address,
+                                   callback_indicator = callback)
+        # Reuse the measurement of the scan for the first update
+        sensor.set_device_data({sensor.get_sensor_type() : float(w1data.group('value')) / 1000.0})
+        yield sensor
 
 class terrariumOWFSSensor(terrariumSensorSource):
   TYPE = 'owfs'
@@ -419,95 +929,206 @@ class terrariumOWFSSensor(terrariumSensorSource):
     except Exception as ex:
       logger.warning('OWFS file system is not actve / installed on this device! If this is not correct, try \'i2cdetect -y 1\' to see if device is connected.')
 
-class terrariumMHZ19Sensor(terrariumSensorSource):
-  TYPE = 'mh-z19'
-  VALID_SENSOR_TYPES = ['co2','temperature']
+class terrariumSerialSensor(terrariumSensorSource):
+  # Sensors on a serial port. The port stays open and the device is configured once, see terrariumSerialDevice
+  TYPE = None
+  VALID_SENSOR_TYPES = []
+  BAUDRATE = 9600
 
-  def set_address(self,address):
-    # Address is not needed according to source....
-    self.sensor_address = 'N/A'
+  def get_serial_device(self):
+    return terrariumSerialDeviceManager().get_device(self.get_address(),self.BAUDRATE)
+
+  def configure(self, device):
+    pass
 
   def load_data(self):
     data = None
     if self.get_address() is not None:
+      device = self.get_serial_device()
       try:
-        data = json.loads(subprocess.check_output(['/usr/bin/sudo', '/usr/bin/python' + ('3' if sys.version_info.major == 3 else '2'), '-m', 'mh_z19','--all']).decode('utf-8').replace("'",'"'))
-      except Exception as ex:
-        print(ex)
+        with device:
+          if not device.is_configured():
+            self.configure(device)
+            device.set_configured()
 
-    if data is None:
-      return None
-    else:
-      del(data['SS'])
-      del(data['UhUl'])
-      del(data['TT'])
+          data = self.load_serial_data(device)
+
+      except Exception as ex:
+        logger.warning('Error getting new data from {} sensor \'{}\'. Error message: {}'.format(self.get_type(),self.get_name(),ex))
+        device.reset()
 
     return data
 
-class terrariumK30CO2Sensor(terrariumSensorSource):
+  def load_serial_data(self, device):
+    return None
+
+class terrariumMHZ19Sensor(terrariumSerialSensor):
+  # https://www.winsen-sensor.com/d/files/infrared-gas-sensor/mh-z19b-co2-ver1_0.pdf
+  TYPE = 'mh-z19'
+  VALID_SENSOR_TYPES = ['co2','temperature']
+  DEFAULT_PORT = '/dev/serial0'
+
+  __READ_COMMAND = b'\xFF\x01\x86\x00\x00\x00\x00\x00\x79'
+
+  def set_address(self,address):
+    # Older setups have no address, use the default UART of the Raspberry PI
+    super(terrariumMHZ19Sensor,self).set_address(terrariumMHZ19Sensor.DEFAULT_PORT if address is None or address.strip() in ['','N/A'] else address.strip())
+
+  def load_serial_data(self, device):
+    response = device.request_frame(terrariumMHZ19Sensor.__READ_COMMAND,9,0xFF)
+    if response[1] != 0x86 or response[8] != terrariumMHZ19Sensor.checksum(response):
+      raise terrariumSerialDeviceException('Invalid answer {}'.format(list(response)))
+
+    return {'co2' : float((response[2] * 256) + response[3]),
+            'temperature' : float(response[4] - 40)}
+
+  @staticmethod
+  def checksum(frame):
+    return (0xFF - (sum(frame[1:8]) & 0xFF) + 1) & 0xFF
+
+class terrariumK30CO2Sensor(terrariumSerialSensor):
   # https://computenodes.net/2017/08/18/__trashed-4/ , https://github.com/theyosh/TerrariumPI/issues/177
   TYPE = 'k30co2'
   VALID_SENSOR_TYPES = ['co2']
 
-  def load_data(self):
-    data = None
-    if self.get_address() is not None:
-      try:
-        device = serial.Serial(self.get_address(),baudrate = 9600,timeout = 1)
-        device.flushInput()
-        sleep(1)
+  __READ_COMMAND = b'\xFE\x44\x00\x08\x02\x9F\x25'
 
-        device.write(b"\xFE\x44\x00\x08\x02\x9F\x25")
-        sleep(.5)
-        response = device.read(7)
-        high = response[3]
-        low = response[4]
-        data = {'co2' : (high * 256) + low}
+  def load_serial_data(self, device):
+    response = device.request_frame(terrariumK30CO2Sensor.__READ_COMMAND,7,0xFE)
+    if response[1] != 0x44 or terrariumK30CO2Sensor.crc16(response[:5]) != response[5] + (response[6] << 8):
+      raise terrariumSerialDeviceException('Invalid answer {}'.format(list(response)))
 
-      except Exception as ex:
-        print(ex)
+    return {'co2' : float((response[3] * 256) + response[4])}
 
-    if data is None:
-      return None
+  @staticmethod
+  def crc16(frame):
+    # Modbus CRC
+    crc = 0xFFFF
+    for value in frame:
+      crc ^= value
+      for counter in range(8):
+        crc = (crc >> 1) ^ 0xA001 if crc & 0x0001 else crc >> 1
 
-    return data
+    return crc
 
-class terrariumCOZIRCO2Sensor(terrariumSensorSource):
+class terrariumCOZIRCO2Sensor(terrariumSerialSensor):
   # http://www.co2meters.com/Documentation/AppNotes/AN127-COZIR-sensor-raspberry-pi-uart.pdf
   TYPE = 'cozirco2'
   VALID_SENSOR_TYPES = ['co2']
+  DEFAULT_MULTIPLIER = 10
 
-  def load_data(self):
-    data = None
-    multiplier = 10
-
-    if self.get_address() is not None:
-      try:
-        device = serial.Serial(self.get_address(),baudrate = 9600,timeout = 1)
-        device.write(b"M 4\r\n") # set display mode to show only CO2
-        device.write(b"K 2\r\n") # set  operating mode
-        device.flushInput()
-        sleep(1)
-
-        device.write(b"Z\r\n")
-        sleep(.5)
-        response = device.read(10)
-        response = response[:8]
-        data = {'co2' : float(response[2:]) * multiplier}
+  def __init__(self, sensor_id, sensor_type, address, name = '', callback_indicator = None):
+    self.__multiplier = terrariumCOZIRCO2Sensor.DEFAULT_MULTIPLIER
+    super(terrariumCOZIRCO2Sensor,self).__init__(sensor_id, sensor_type, address, name, callback_indicator)
 
-      except Exception as ex:
-        print(ex)
+  def configure(self, device):
+    # Polling mode, so the sensor only answers on requests, and only CO2 values
+    device.request_line(b'K 2\r\n')
+    device.request_line(b'M 4\r\n')
+    response = re.match(r'^\.\s+(\d+)$',device.request_line(b'.\r\n'))
+    if response is not None and int(response.group(1)) > 0:
+      self.__multiplier = int(response.group(1))
 
-    if data is None:
-      return None
+  def load_serial_data(self, device):
+    response = device.request_line(b'Z\r\n')
+    value = re.match(r'^Z\s+(\d+)$',response)
+    if value is None:
+      raise terrariumSerialDeviceException('Invalid answer \'{}\''.format(response))
 
-    return data
+    return {'co2' : float(value.group(1)) * self.__multiplier}
 
 from terrariumAnalogSensor import terrariumSKUSEN0161Sensor
 from terrariumBluetoothSensor import terrariumMiFloraSensor, terrariumMiTempSensor
 from terrariumGPIOSensor import terrariumYTXXSensorDigital, terrariumDHT11Sensor, terrariumDHT22Sensor, terrariumAM2302Sensor, terrariumHCSR04Sensor
 from terrariumI2CSensor import terrariumSHT2XSensor, terrariumHTU21DSensor, terrariumSi7021Sensor, terrariumBME280Sensor, terrariumChirpSensor, terrariumVEML6075Sensor, terrariumSHT3XSensor, terrariumSHT3XDSensor, terrariumMLX90614Sensor, terrariumAM2320Sensor, terrariumAMG8833Sensor
 
+class terrariumSensorDevice(object):
+  # A physical device that is configured as one or more logical sensors, like a BME280 for temperature, humidity and pressure.
+  # The device is read once per update and all values are handed to its logical sensors
+  def __init__(self, device_key, sensors = None):
+    self.__device_key = device_key
+    self.__sensors = [] if sensors is None else sensors
+
+  def get_key(self):
+    return self.__device_key
+
+  def get_sensors(self):
+    return self.__sensors
+
+  def add_sensor(self, sensor):
+    self.__sensors.append(sensor)
+
+  def is_update_due(self, now = None):
+    return any(sensor.is_update_due(now) for sensor in self.__sensors)
+
+  def update(self, force = False):
+    # Returns True when the device is read and its sensors are updated
+    if len(self.__sensors) == 0 or not (force or self.is_update_due()):
+      return False
+
+    starttime = time()
+    data = self.__sensors[0].get_device_data(force,self.__sensors)
+    for sensor in self.__sensors:
+      sensor.process_data(data,starttime)
+
+    if len(self.__sensors) > 1:
+      logger.debug('Updated {} sensors of {} device at location {} with a single read in {:.5f} seconds'.format(len(self.__sensors),
+                                                                                                                self.__sensors[0].get_type(),
+                                                                                                                self.__sensors[0].get_address(),
+                                                                                                                time()-starttime))
+
+    return True
+
+  @staticmethod
+  def prefetch(devices):
+    # Read all devices that support batch reading together. The following device updates will use the cached data
+    batches = OrderedDict()
+    for device in devices:
+      if len(device.get_sensors()) == 0:
+        continue
+
+      sensor = device.get_sensors()[0]
+      if sensor.load_data_batch is not None and device.is_update_due() and not sensor.has_device_data():
+        if sensor.load_data_batch not in batches:
+          batches[sensor.load_data_batch] = []
+
+        batches[sensor.load_data_batch].append(device)
+
+    for load_data_batch, devices in batches.items():
+      if len(devices) < 2:
+        continue
+
+      sensors = [device.get_sensors()[0] for device in devices]
+      starttime = time()
+      try:
+        data = load_data_batch(sensors)
+      except (Exception, Timeout) as ex:
+        logger.exception('Error batch reading {} sensor devices: {}'.format(len(sensors),ex))
+        continue
+
+      readtime = time()-starttime
+      terrariumSensorSource.METRIC_READ_DURATION.observe(readtime,sensors[0].get_type())
+      for device in devices:
+        for sensor in device.get_sensors():
+          sensor.add_read_duration(readtime)
+
+        sensor = device.get_sensors()[0]
+        if data.get(sensor.get_sensor_cache_key()):
+          sensor.set_device_data(data[sensor.get_sensor_cache_key()])
+
+      logger.debug('Batch read {} sensor devices in {:.5f} seconds'.format(len(sensors),time()-starttime))
+
+  @staticmethod
+  def group(sensors):
+    devices = OrderedDict()
+    for sensor in sensors:
+      if sensor.get_sensor_cache_key() not in devices:
+        devices[sensor.get_sensor_cache_key()] = terrariumSensorDevice(sensor.get_sensor_cache_key())
+
+      devices[sensor.get_sensor_cache_key()].add_sensor(sensor)
+
+    return list(devices.values())
+
 # terrariumSensor
 class terrariumSensorTypeException(TypeError):
   '''There is a problem with loading a hardware sensor. Invalid hardware type.'''
@@ -521,8 +1142,11 @@ class terrariumSensorTypeException(TypeError):
 class terrariumSensor(object):
   UPDATE_TIMEOUT = 29
   ERROR_TIMEOUT = 10 * 60 # 10 minutes
+  # Max seconds for scanning all hardware buses together
+  SCAN_TIMEOUT = 30
 
   SENSORS = [terrariumRemoteSensor,
+             terrariumPushSensor,
              terrariumScriptSensor,
              terrarium1WSensor,
              terrariumOWFSSensor,
@@ -586,10 +1210,33 @@ class terrariumSensor(object):
     return data
 
   @staticmethod
-  def scan_sensors(callback=None):
+  def __scan_hardware(sensor_device, callback, sensors):
+    try:
+      for sensor in sensor_device.scan_sensors(callback):
+        sensors.append(sensor)
+
+    except Exception as ex:
+      logger.warning('Error scanning for {} sensors. Error message: {}'.format(sensor_device.TYPE,ex))
+
+  @staticmethod
+  def scan_sensors(callback=None, timeout=None):
+    # All hardware types are scanned at the same time. Sensors that are not found before the deadline are skipped
+    starttime = time()
+    timeout = terrariumSensor.SCAN_TIMEOUT if timeout is None else timeout
+    sensors = []
+    scanners = []
     for sensor_device in terrariumSensor.SENSORS:
-      try:
-        for sensor in sensor_device.scan_sensors(callback):
-          yield sensor
-      except AttributeError as ex:
+      if not hasattr(sensor_device,'scan_sensors'):
         logger.debug('Device \'{}\' does not support hardware scanning'.format(sensor_device.TYPE))
+        continue
+
+      scanners.append((sensor_device,spawn(terrariumSensor.__scan_hardware,sensor_device,callback,sensors)))
+
+    joinall([scanner for sensor_device, scanner in scanners],timeout=timeout)
+    for sensor_device, scanner in scanners:
+      if not scanner.ready():
+        logger.warning('Scanning for {} sensors did not finish within {} seconds'.format(sensor_device.TYPE,timeout))
+        scanner.kill(block=False)
+
+    logger.debug('Found {} sensors in {:.5f} seconds'.format(len(sensors),time()-starttime))
+    return sensors
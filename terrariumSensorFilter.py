@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+import terrariumLogging
+logger = terrariumLogging.logging.getLogger(__name__)
+
+class terrariumRingBuffer(object):
+  # Fixed size buffer. Adding a value overwrites the oldest value when the buffer is full
+  __slots__ = ('__values', '__index', '__count')
+
+  def __init__(self, size):
+    self.__values = [0.0] * max(1,int(size))
+    self.__index = 0
+    self.__count = 0
+
+  def append(self, value):
+    self.__values[self.__index] = value
+    self.__index = (self.__index + 1) % len(self.__values)
+    self.__count = min(self.__count + 1, len(self.__values))
+
+  def values(self):
+    return self.__values[:self.__count]
+
+  def clear(self):
+    self.__index = 0
+    self.__count = 0
+
+  def __len__(self):
+    return self.__count
+
+  @staticmethod
+  def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2 == 1:
+      return values[middle]
+
+    return (values[middle - 1] + values[middle]) / 2.0
+
+class terrariumSensorFilterSource(object):
+  TYPE = None
+  DEFAULTS = []
+  __slots__ = ('_parameters',)
+
+  def __init__(self, parameters):
+    self._parameters = [float(parameters[counter]) if counter < len(parameters) else default for counter, default in enumerate(self.DEFAULTS)]
+
+  def get_type(self):
+    return self.TYPE
+
+  def get_config(self):
+    return '{}:{}'.format(self.get_type(),','.join('{:g}'.format(parameter) for parameter in self._parameters))
+
+  def filter(self, value):
+    return value
+
+  def reset(self):
+    pass
+
+class terrariumSensorFilterMedian(terrariumSensorFilterSource):
+  # Median of the last N measurements. Removes single spikes
+  TYPE = 'median'
+  DEFAULTS = [5]
+  __slots__ = ('__buffer',)
+
+  def __init__(self, parameters):
+    super(terrariumSensorFilterMedian,self).__init__(parameters)
+    self.__buffer = terrariumRingBuffer(self._parameters[0])
+
+  def filter(self, value):
+    self.__buffer.append(value)
+    return terrariumRingBuffer.median(self.__buffer.values())
+
+  def reset(self):
+    self.__buffer.clear()
+
+class terrariumSensorFilterEWMA(terrariumSensorFilterSource):
+  # Exponentially weighted moving average. Alpha between 0 and 1, lower is smoother
+  TYPE = 'ewma'
+  DEFAULTS = [0.3]
+  __slots__ = ('__average',)
+
+  def __init__(self, parameters):
+    super(terrariumSensorFilterEWMA,self).__init__(parameters)
+    self._parameters[0] = min(1.0,max(0.0,self._parameters[0]))
+    self.__average = None
+
+  def filter(self, value):
+    if self.__average is None:
+      self.__average = value
+    else:
+      self.__average += self._parameters[0] * (value - self.__average)
+
+    return self.__average
+
+  def reset(self):
+    self.__average = None
+
+class terrariumSensorFilterHampel(terrariumSensorFilterSource):
+  # Replace a measurement with the window median when it is more than X scaled median absolute deviations away from it
+  TYPE = 'hampel'
+  DEFAULTS = [7, 3.0]
+  # Scale factor to estimate the standard deviation from the median absolute deviation
+  MAD_SCALE = 1.4826
+  __slots__ = ('__buffer',)
+
+  def __init__(self, parameters):
+    super(terrariumSensorFilterHampel,self).__init__(parameters)
+    self.__buffer = terrariumRingBuffer(self._parameters[0])
+
+  def filter(self, value):
+    self.__buffer.append(value)
+    values = self.__buffer.values()
+    if len(values) < 3:
+      return value
+
+    median = terrariumRingBuffer.median(values)
+    deviation = terrariumSensorFilterHampel.MAD_SCALE * terrariumRingBuffer.median([abs(item - median) for item in values])
+    if abs(value - median) > self._parameters[1] * deviation:
+      logger.debug('Hampel filter replaced outlier {} with median {}'.format(value,median))
+      return median
+
+    return value
+
+  def reset(self):
+    self.__buffer.clear()
+
+class terrariumSensorFilterKalman(terrariumSensorFilterSource):
+  # One dimensional Kalman filter for a slowly changing value. Parameters are the process noise and the measurement noise
+  TYPE = 'kalman'
+  DEFAULTS = [0.01, 0.5]
+  __slots__ = ('__estimate', '__error')
+
+  def __init__(self, parameters):
+    super(terrariumSensorFilterKalman,self).__init__(parameters)
+    self.__estimate = None
+    self.__error = 1.0
+
+  def filter(self, value):
+    if self.__estimate is None:
+      self.__estimate = value
+      self.__error = self._parameters[1]
+      return value
+
+    self.__error += self._parameters[0]
+    gain = self.__error / (self.__error + self._parameters[1])
+    self.__estimate += gain * (value - self.__estimate)
+    self.__error *= (1.0 - gain)
+    return self.__estimate
+
+  def reset(self):
+    self.__estimate = None
+    self.__error = 1.0
+
+class terrariumSensorFilterException(ValueError):
+  '''Unknown sensor filter or invalid filter parameters'''
+
+# Factory class
+class terrariumSensorFilter(object):
+  FILTERS = [terrariumSensorFilterMedian,
+             terrariumSensorFilterEWMA,
+             terrariumSensorFilterHampel,
+             terrariumSensorFilterKalman]
+
+  def __new__(self, config):
+    # Config format: <type>[:<parameter>,<parameter>], like 'median:5' or 'hampel:7,3'. Empty or 'none' disables filtering
+    if config is None or config.strip().lower() in ['','none']:
+      return None
+
+    config = config.strip().lower().split(':',1)
+    parameters = [] if len(config) == 1 or '' == config[1].strip() else config[1].split(',')
+
+    for sensor_filter in terrariumSensorFilter.FILTERS:
+      if config[0] == sensor_filter.TYPE:
+        try:
+          return sensor_filter(parameters)
+        except ValueError as ex:
+          raise terrariumSensorFilterException('Invalid parameters {} for sensor filter {}'.format(parameters,config[0]))
+
+    raise terrariumSensorFilterException('Sensor filter \'{}\' is unknown'.format(config[0]))
+
+  @staticmethod
+  def valid_filters():
+    return [sensor_filter.TYPE for sensor_filter in terrariumSensorFilter.FILTERS]
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import terrariumLogging
+logger = terrariumLogging.logging.getLogger(__name__)
+
+try:
+  import thread as _thread
+except ImportError as ex:
+  import _thread
+
+import socket
+
+# Line protocol over TCP for push sensors, for small devices where HTTP is too much work. Every line is answered with
+# 'ok' or 'error <message>'. The first line authenticates the device, the following lines are readings as topic and payload like MQTT:
+#   auth <device id> <token>
+#   <device id>/<sensor type> <value>
+
+class terrariumSensorPushServer(object):
+  MAX_LINE_LENGTH = 256
+  # Close connections without any data for X seconds
+  CONNECTION_TIMEOUT = 10 * 60
+
+  def __init__(self, callback, port, host = ''):
+    # The callback gets the device id, token and readings, and returns None when the device or token is unknown
+    self.__callback = callback
+    self.__port = int(port)
+    self.__host = host
+    self.__socket = None
+    self.__running = False
+
+  def start(self):
+    self.__socket = socket.socket(socket.AF_INET6 if ':' in self.__host else socket.AF_INET, socket.SOCK_STREAM)
+    self.__socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    self.__socket.bind((self.__host,self.__port))
+    self.__socket.listen(16)
+
+    self.__running = True
+    _thread.start_new_thread(self.__accept_loop, ())
+    logger.info('Sensor push server is listening at port {}'.format(self.__port))
+
+  def stop(self):
+    self.__running = False
+    try:
+      self.__socket.close()
+    except Exception as ex:
+      pass
+
+    logger.info('Stopped sensor push server')
+
+  def is_running(self):
+    return self.__running
+
+  def __accept_loop(self):
+    while self.__running:
+      try:
+        connection, address = self.__socket.accept()
+      except Exception as ex:
+        if self.__running:
+          logger.exception('Sensor push server accept error: {}'.format(ex))
+        continue
+
+      _thread.start_new_thread(self.__handle_connection, (connection,address))
+
+  @staticmethod
+  def _send(connection, message):
+    connection.sendall((message + '\n').encode('utf-8'))
+
+  def __handle_line(self, line, device):
+    # Returns the authenticated device id
+    line = line.split()
+    if len(line) == 3 and 'auth' == line[0].lower():
+      if self.__callback(line[1],line[2],{}) is None:
+        raise ValueError('unknown device or invalid token')
+
+      return (line[1],line[2])
+
+    if device is None:
+      raise ValueError('not authenticated')
+
+    if len(line) != 2 or '/' not in line[0]:
+      raise ValueError('invalid reading, use <device id>/<sensor type> <value>')
+
+    topic = line[0].split('/')
+    if topic[0] != device[0]:
+      raise ValueError('not authenticated for device {}'.format(topic[0]))
+
+    if self.__callback(device[0],device[1],{topic[-1] : line[1]}) is None:
+      raise ValueError('unknown device or invalid token')
+
+    return device
+
+  def __handle_connection(self, connection, address):
+    connection.settimeout(terrariumSensorPushServer.CONNECTION_TIMEOUT)
+    reader = connection.makefile('rb')
+    device = None
+    try:
+      while self.__running:
+        line = reader.readline(terrariumSensorPushServer.MAX_LINE_LENGTH)
+        if not line:
+          break
+
+        line = line.decode('utf-8',errors='ignore').strip()
+        if '' == line:
+          continue
+
+        try:
+          device = self.__handle_line(line,device)
+          terrariumSensorPushServer._send(connection,'ok')
+        except ValueError as ex:
+          # Only log the command and the device id or topic, never the token
+          logger.warning('Sensor push server refused \'{}\' from {}: {}'.format(' '.join(line.split()[:2]),address[0],ex))
+          terrariumSensorPushServer._send(connection,'error {}'.format(ex))
+
+    except Exception as ex:
+      logger.debug('Sensor push connection from {} closed: {}'.format(address[0],ex))
+
+    finally:
+      reader.close()
+      connection.close()
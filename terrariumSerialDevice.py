@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import terrariumLogging
+logger = terrariumLogging.logging.getLogger(__name__)
+
+import threading
+import serial
+
+from terrariumUtils import terrariumSingleton
+
+class terrariumSerialDeviceException(IOError):
+  '''The serial device did not answer in time or the answer is invalid'''
+
+class terrariumSerialDevice(object):
+  # One open serial port per device. The port is opened once and stays open. All transactions should hold the lock,
+  # so requests and answers of different sensors on the same device do not interleave
+  def __init__(self, port, baudrate = 9600, timeout = 1):
+    self.__port = port
+    self.__baudrate = int(baudrate)
+    self.__timeout = timeout
+    self.__handle = None
+    self.__configured = False
+    self.lock = threading.RLock()
+
+  def __enter__(self):
+    self.lock.acquire()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.lock.release()
+
+  def get_port(self):
+    return self.__port
+
+  def get_handle(self):
+    if self.__handle is None:
+      logger.debug('Open serial port {} at {} baud'.format(self.__port,self.__baudrate))
+      self.__handle = serial.Serial(self.__port,baudrate = self.__baudrate,timeout = self.__timeout)
+      # A new connection needs to be configured again
+      self.__configured = False
+
+    return self.__handle
+
+  def is_configured(self):
+    return self.__configured
+
+  def set_configured(self):
+    self.__configured = True
+
+  def write(self, command):
+    handle = self.get_handle()
+    handle.reset_input_buffer()
+    handle.write(command)
+
+  def read_frame(self, length, start = None):
+    # Read a fixed length binary frame. When a start byte is given, bytes before the start byte are skipped
+    handle = self.get_handle()
+    response = bytearray(handle.read(1 if start is not None else length))
+    if start is not None:
+      while len(response) == 1 and response[0] != start:
+        response = bytearray(handle.read(1))
+
+      response += bytearray(handle.read(length - 1))
+
+    if len(response) != length:
+      raise terrariumSerialDeviceException('Got {} of {} bytes from serial port {} within {} seconds'.format(len(response),length,self.__port,self.__timeout))
+
+    return response
+
+  def read_line(self, terminator = b'\r\n'):
+    response = self.get_handle().read_until(terminator)
+    if not response.endswith(terminator):
+      raise terrariumSerialDeviceException('No complete answer from serial port {} within {} seconds'.format(self.__port,self.__timeout))
+
+    return response[:-len(terminator)].decode('ascii',errors='ignore').strip()
+
+  def request_frame(self, command, length, start = None):
+    with self.lock:
+      self.write(command)
+      return self.read_frame(length,start)
+
+  def request_line(self, command, terminator = b'\r\n'):
+    with self.lock:
+      self.write(command)
+      return self.read_line(terminator)
+
+  def reset(self):
+    # Reopen and reconfigure the port on the next transaction, after a failed read
+    logger.debug('Reset serial port {}'.format(self.__port))
+    self.close()
+
+  def close(self):
+    with self.lock:
+      if self.__handle is not None:
+        try:
+          self.__handle.close()
+        except Exception as ex:
+          logger.warning('Error closing serial port {}. Error message: {}'.format(self.__port,ex))
+
+      self.__handle = None
+      self.__configured = False
+
+class terrariumSerialDeviceManager(terrariumSingleton):
+  def __init__(self):
+    self.__devices = {}
+    self.__lock = threading.Lock()
+    logger.debug('Initialized serial device manager')
+
+  def get_device(self, port, baudrate = 9600, timeout = 1):
+    with self.__lock:
+      if port not in self.__devices:
+        self.__devices[port] = terrariumSerialDevice(port,baudrate,timeout)
+
+      return self.__devices[port]
+
+  def close(self):
+    with self.__lock:
+      devices = list(self.__devices.values())
+
+    for device in devices:
+      device.close()
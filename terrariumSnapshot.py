@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import terrariumLogging
+logger = terrariumLogging.logging.getLogger(__name__)
+
+import os
+import json
+import time
+
+class terrariumSnapshot(object):
+  SNAPSHOT_FILE = 'snapshot.json'
+  # Write a new snapshot every Xth second
+  SNAPSHOT_INTERVAL = 5 * 60
+
+  def __init__(self, filename = None):
+    self.__filename = terrariumSnapshot.SNAPSHOT_FILE if filename is None else filename
+    self.__last_save = 0
+
+  def load(self):
+    starttime = time.time()
+    data = {}
+
+    if not os.path.isfile(self.__filename):
+      logger.info('No warm start snapshot found at {}'.format(self.__filename))
+      return data
+
+    try:
+      with open(self.__filename,'r') as snapshot_file:
+        data = json.load(snapshot_file)
+
+      logger.info('Loaded warm start snapshot from {} which is {:.0f} seconds old in {:.5f} seconds'.format(self.__filename,
+                                                                                                             starttime - data.get('timestamp',0),
+                                                                                                             time.time()-starttime))
+    except Exception as ex:
+      logger.warning('Unable to load warm start snapshot from {}: {}'.format(self.__filename,ex))
+      data = {}
+
+    return data
+
+  def is_due(self):
+    return time.time() - self.__last_save >= terrariumSnapshot.SNAPSHOT_INTERVAL
+
+  def save(self, data):
+    starttime = time.time()
+    data['timestamp'] = int(starttime)
+    # Write to a temporary file first and rename it afterwards. A crash or power failure leaves the old snapshot intact
+    tmp_filename = '{}.{}.tmp'.format(self.__filename,os.getpid())
+    try:
+      with open(tmp_filename,'w') as snapshot_file:
+        json.dump(data,snapshot_file)
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+
+      os.rename(tmp_filename,self.__filename)
+      self.__last_save = starttime
+      logger.debug('Saved warm start snapshot to {} in {:.5f} seconds'.format(self.__filename,time.time()-starttime))
+      return True
+
+    except Exception as ex:
+      logger.warning('Unable to save warm start snapshot to {}: {}'.format(self.__filename,ex))
+      try:
+        os.unlink(tmp_filename)
+      except OSError:
+        pass
+
+    return False
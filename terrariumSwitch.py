@@ -37,9 +37,15 @@ except ImportError as ex:
   pass
 
 from terrariumUtils import terrariumUtils, terrariumTimer, terrariumCache
+from terrariumMetrics import terrariumMetrics
 
 class terrariumPowerSwitchSource(object):
   TYPE = None
+  # Switches that are polled over HTTP can be updated in parallel with other switches
+  CONCURRENT_UPDATE = False
+
+  METRIC_COMMAND_DURATION = terrariumMetrics().histogram('terrariumpi_switch_command_duration_seconds','Duration of power switch hardware commands in seconds',['hardwaretype'])
+  METRIC_COMMAND_ERRORS = terrariumMetrics().counter('terrariumpi_switch_command_errors_total','Number of failed power switch hardware commands',['hardwaretype'])
 
   def __init__(self, switchid, address, name = '', prev_state = None, callback = None):
     logger.info('Initialising \'{}\' power switch object'.format(self.get_type()))
@@ -170,9 +176,11 @@ class terrariumPowerSwitchSource(object):
 
     if self.get_state() is not state or terrariumUtils.is_true(force):
       old_state = self.get_state()
+      commandtime = time()
 
       try:
         self.set_hardware_state(state,force)
+        terrariumPowerSwitchSource.METRIC_COMMAND_DURATION.observe(time()-commandtime,self.get_type())
         self.state = state
         logger.info('Changed power switch \'{}\' of type \'{}\' at address \'{}\' from state \'{}\' to state \'{}\' (Forced:{})'.format(self.get_name(),
                                                                                                                                 self.get_type(),
@@ -184,6 +192,7 @@ class terrariumPowerSwitchSource(object):
 
       except Exception as ex:
         print(ex)
+        terrariumPowerSwitchSource.METRIC_COMMAND_ERRORS.inc(1,self.get_type())
         logger.error('Failed changing power switch \'{}\' of type \'{}\' at address \'{}\' from state \'{}\' to state \'{}\' (Forced:{})'.format(self.get_name(),
                                                                                                                                          self.get_type(),
                                                                                                                                          self.get_address(),
@@ -498,6 +507,7 @@ class terrariumPowerSwitchEnergenieRF(terrariumPowerSwitchSource):
 
 class terrariumPowerSwitchSonoff(terrariumPowerSwitchSource):
   TYPE = 'sonoff'
+  CONCURRENT_UPDATE = True
   VALID_SOURCE = '^http:\/\/((?P<user>[^:]+):(?P<passwd>[^@]+)@)?(?P<host>[^#\/]+)(\/)?$'
 
   def load_hardware(self):
@@ -701,31 +711,22 @@ class terrariumPowerSwitchDenkoviV2(terrariumPowerSwitchSource):
       # Ignore for now
       logger.error('Error loading hardware for switch type {}, with error: {}'.format(self.get_type(),err))
 
-  def get_hardware_state(self):
-    #data = None
-    #print('Get hardware state cache data')
-    data = self.__cache.get_data(self.__get_cache_key())
-    #print(data)
-    #print('IS running: {}' .format(self.__cache.is_running(self.__get_cache_key())))
-
-    if data is None and not self.__cache.is_running(self.__get_cache_key()):
-      self.__cache.set_running(self.__get_cache_key())
-
-      cmd = ['/usr/bin/sudo','/usr/bin/java','-jar','DenkoviRelayCommandLineTool/DenkoviRelayCommandLineTool.jar',self.__device,self._get_board_type(),'all','status']
-      logger.debug('Running get hardware state command {}'.format(cmd))
-      #print('Running cmd: {}'.format(cmd))
-
-      try:
-        data = subprocess.check_output(cmd).strip().decode('utf-8')
+  def __load_hardware_state(self):
+    data = None
+    cmd = ['/usr/bin/sudo','/usr/bin/java','-jar','DenkoviRelayCommandLineTool/DenkoviRelayCommandLineTool.jar',self.__device,self._get_board_type(),'all','status']
+    logger.debug('Running get hardware state command {}'.format(cmd))
 
-        #print('Got data: *{}*'.format(data))
-        self.__cache.set_data(self.__get_cache_key(),data)
-      except Exception as err:
-        # Ignore for now
-        logger.error('Error getting hardware state for switch type {}, with error: {}'.format(self.get_type(),err))
+    try:
+      data = subprocess.check_output(cmd).strip().decode('utf-8')
+    except Exception as err:
+      # Ignore for now
+      logger.error('Error getting hardware state for switch type {}, with error: {}'.format(self.get_type(),err))
 
+    return data
 
-      self.__cache.clear_running(self.__get_cache_key())
+  def get_hardware_state(self):
+    # All relays on the same board share one status call
+    data = self.__cache.get_or_load(self.__get_cache_key(),self.__load_hardware_state)
 
     if data is None:
       return terrariumPowerSwitch.OFF
@@ -1061,6 +1062,7 @@ class terrariumPowerDimmerPCA9685(terrariumPowerDimmerSource):
 
 class terrariumPowerSwitchRemote(terrariumPowerSwitchSource):
   TYPE = 'remote'
+  CONCURRENT_UPDATE = True
 
   def set_hardware_state(self, state, force = False):
     pass
@@ -4,6 +4,7 @@ logger = terrariumLogging.logging.getLogger(__name__)
 
 from terrariumWeather import terrariumWeather
 from terrariumSensor import terrariumSensor
+from terrariumSensorFilter import terrariumSensorFilter
 from terrariumSwitch import terrariumPowerSwitch
 from terrariumDoor import terrariumDoor
 from terrariumWebcam import terrariumWebcam
@@ -43,6 +44,7 @@ class terrariumTranslations(object):
     self.translations['sensor_field_max_moist'] = _('Holds the sensor highest moisture value measured in full water. %s') % ('<a href="https://github.com/ageir/chirp-rpi#calibration" target="_blank" title="' + _('More calibration information') + '"><i>' + _('More calibration information') + '</i></a>')
     self.translations['sensor_field_temperature_offset'] = _('Holds the temperature offset value.')
     self.translations['sensor_field_max_diff'] = _('Holds the maximum number that a sensor may change in value up or down.')
+    self.translations['sensor_field_filter'] = _('Holds the filter for noisy sensor values as %s, like %s. Supported filters are: %s. Leave empty for no filter.') % ('<strong>type:parameters</strong>','<strong>median:5</strong>','<strong>' + '</strong>, <strong>'.join(terrariumSensorFilter.valid_filters()) + '</strong>')
     # End sensors
 
     # Switches
@@ -3,12 +3,25 @@ import terrariumLogging
 logger = terrariumLogging.logging.getLogger(__name__)
 
 import re
+import json as jsonlib
 import datetime
+import threading
 import requests
 import subprocess
 
 from math import log
 from time import time
+from collections import OrderedDict
+from requests.adapters import HTTPAdapter
+try:
+  from urllib.parse import urlparse
+except ImportError:
+  from urlparse import urlparse
+
+try:
+  import numpy
+except Exception:
+  pass # Only needed for faster bulk unit conversions
 
 # works in Python 2 & 3
 class _Singleton(type):
@@ -105,35 +118,317 @@ class terrariumTimer(object):
             'timer_on_duration': self.__on_duration,
             'timer_off_duration': self.__off_duration}
 
-class terrariumCache(terrariumSingleton):
-  def __init__(self):
-    self.__cache = {}
+class terrariumTTLCache(object):
+  MAX_ENTRIES = 1024
+  DEFAULT_TIMEOUT = 30
+  # Remove expired entries at most every Xth second
+  PURGE_INTERVAL = 60
+
+  def __init__(self, name = 'cache', max_entries = None, load_timeout = 60):
+    self.__name = name
+    self.__max_entries = terrariumTTLCache.MAX_ENTRIES if max_entries is None else max_entries
+    self.__load_timeout = load_timeout
+    # Ordered by last write, so the oldest entries are evicted first when the cache is full
+    self.__cache = OrderedDict()
     self.__running = {}
+    self.__lock = threading.Lock()
+    self.__last_purge = time()
+    self.__stats = {'hits' : 0, 'misses' : 0, 'coalesced' : 0, 'evictions' : 0, 'expired' : 0}
+
+  def __purge(self, now):
+    # Caller must hold the lock
+    if now - self.__last_purge >= terrariumTTLCache.PURGE_INTERVAL:
+      for hash_key in [hash_key for hash_key in self.__cache if self.__cache[hash_key]['expire'] <= now]:
+        del(self.__cache[hash_key])
+        self.__stats['expired'] += 1
+
+      self.__last_purge = now
+
+    while len(self.__cache) > self.__max_entries:
+      self.__cache.popitem(last=False)
+      self.__stats['evictions'] += 1
+
+  def __get(self, hash_key, now):
+    # Caller must hold the lock
+    entry = self.__cache.get(hash_key)
+    if entry is None:
+      return None
+
+    if entry['expire'] <= now:
+      del(self.__cache[hash_key])
+      self.__stats['expired'] += 1
+      return None
+
+    return entry
+
+  def set(self, hash_key, data, cache_timeout = None):
+    now = time()
+    with self.__lock:
+      self.__cache.pop(hash_key,None)
+      self.__cache[hash_key] = {'data' : data, 'expire' : now + (terrariumTTLCache.DEFAULT_TIMEOUT if cache_timeout is None else cache_timeout)}
+      self.__purge(now)
+      total = len(self.__cache)
+
+    logger.debug('Added new data to {} with hash: {}. Total in cache: {}'.format(self.__name,hash_key,total))
+
+  def get(self, hash_key):
+    with self.__lock:
+      entry = self.__get(hash_key,time())
+      if entry is None:
+        self.__stats['misses'] += 1
+        return None
+
+      self.__stats['hits'] += 1
+      return entry['data']
+
+  def clear(self, hash_key):
+    with self.__lock:
+      self.__cache.pop(hash_key,None)
+
+  def get_or_load(self, hash_key, loader, cache_timeout = None, force = False):
+    # Single flight: only the first caller runs the loader. Concurrent callers for the same key wait for that result
+    with self.__lock:
+      if not force:
+        entry = self.__get(hash_key,time())
+        if entry is not None:
+          self.__stats['hits'] += 1
+          return entry['data']
+
+      flight = self.__running.get(hash_key)
+      if flight is None:
+        flight = self.__running[hash_key] = {'event' : threading.Event(), 'data' : None}
+        self.__stats['misses'] += 1
+        leader = True
+      else:
+        self.__stats['coalesced'] += 1
+        leader = False
+
+    if not leader:
+      flight['event'].wait(self.__load_timeout)
+      return flight['data']
+
+    try:
+      flight['data'] = loader()
+      if flight['data'] is not None:
+        self.set(hash_key,flight['data'],cache_timeout)
+
+    finally:
+      with self.__lock:
+        del(self.__running[hash_key])
+
+      flight['event'].set()
+
+    return flight['data']
+
+  def is_running(self, hash_key):
+    return hash_key in self.__running
+
+  def set_running(self, hash_key):
+    with self.__lock:
+      if hash_key in self.__running:
+        return False
+
+      self.__running[hash_key] = {'event' : threading.Event(), 'data' : None}
+      return True
+
+  def clear_running(self, hash_key):
+    with self.__lock:
+      flight = self.__running.pop(hash_key,None)
+
+    if flight is not None:
+      flight['event'].set()
+
+  def get_stats(self):
+    with self.__lock:
+      stats = dict(self.__stats)
+      stats['entries'] = len(self.__cache)
+      stats['running'] = len(self.__running)
+
+    lookups = stats['hits'] + stats['misses'] + stats['coalesced']
+    stats['hit_ratio'] = 0.0 if lookups == 0 else float(stats['hits'] + stats['coalesced']) / float(lookups)
+    return stats
+
+class terrariumCache(terrariumTTLCache, terrariumSingleton):
+  def __init__(self):
+    super(terrariumCache,self).__init__('cache')
     logger.debug('Initialized cache')
 
   def set_data(self,hash_key,data,cache_timeout = 30):
-    self.__cache[hash_key] = { 'data' : data, 'expire' : int(time()) + cache_timeout}
-    logger.debug('Added new cache data with hash: {}. Total in cache: {}'.format(hash_key,len(self.__cache)))
+    self.set(hash_key,data,cache_timeout)
 
   def get_data(self,hash_key):
-    if hash in self.__cache and self.__cache[hash_key]['expire'] > int(time()):
-      return self.__cache[hash_key]['data']
+    return self.get(hash_key)
 
   def clear_data(self,hash_key):
-    if hash_key in self.__cache:
-      del(self.__cache[hash_key])
+    self.clear(hash_key)
+
+class terrariumHTTPResponse(object):
+  def __init__(self, status_code, content_type, content = None, encoding = None, stream = None, on_close = None):
+    self.status_code = status_code
+    self.content_type = content_type or ''
+    self.content = content
+    self.encoding = encoding
+    self.__stream = stream
+    self.__on_close = on_close
+
+  @property
+  def text(self):
+    return self.content.decode(self.encoding or 'utf-8','replace')
+
+  def json(self):
+    return jsonlib.loads(self.text)
+
+  def is_stream(self):
+    return self.__stream is not None
+
+  def iter_content(self, chunk_size = 1024):
+    return self.__stream.iter_content(chunk_size=chunk_size)
+
+  def close(self):
+    if self.__stream is not None:
+      self.__stream.close()
+      self.__stream = None
+
+    if self.__on_close is not None:
+      on_close = self.__on_close
+      self.__on_close = None
+      on_close()
+
+class terrariumHTTPClient(terrariumSingleton):
+  # Maximum parallel requests in total and per host. Small ESP devices cannot handle many connections
+  MAX_CONCURRENT = 16
+  MAX_PER_HOST = 4
+  # Open the circuit for a host after X failed requests in a row, and wait Y seconds (doubling up to Z) before trying again
+  BREAKER_THRESHOLD = 3
+  BREAKER_TIMEOUT = 30
+  BREAKER_MAX_TIMEOUT = 5 * 60
+  # Keep responses with an ETag or Last-Modified header for conditional requests
+  CONDITIONAL_CACHE_TIMEOUT = 60 * 60
+
+  def __init__(self):
+    self.__hosts = {}
+    self.__lock = threading.Lock()
+    self.__concurrent = threading.BoundedSemaphore(terrariumHTTPClient.MAX_CONCURRENT)
+    self.__conditional_cache = terrariumTTLCache('http cache',256)
+    logger.debug('Initialized HTTP client')
+
+  def __get_host(self, url):
+    url = urlparse(url)
+    key = '{}://{}'.format(url.scheme,url.netloc.split('@')[-1])
+    with self.__lock:
+      if key not in self.__hosts:
+        session = requests.Session()
+        session.mount(key,HTTPAdapter(pool_connections=1,pool_maxsize=terrariumHTTPClient.MAX_PER_HOST))
+        self.__hosts[key] = {'name' : key,
+                             'session' : session,
+                             'concurrent' : threading.BoundedSemaphore(terrariumHTTPClient.MAX_PER_HOST),
+                             'failures' : 0,
+                             'open_until' : 0,
+                             'timeout' : terrariumHTTPClient.BREAKER_TIMEOUT,
+                             'probing' : False}
+
+      return self.__hosts[key]
+
+  def __breaker_allows(self, host):
+    with self.__lock:
+      if host['open_until'] == 0:
+        return True
+
+      if time() < host['open_until'] or host['probing']:
+        return False
 
-  def is_running(self,hash_key):
-    if hash_key in self.__running:
+      # Half open: let a single request through to see if the host is back
+      host['probing'] = True
       return True
 
-    return False
+  def __breaker_result(self, host, success):
+    with self.__lock:
+      host['probing'] = False
+      if success:
+        if host['open_until'] > 0:
+          logger.info('Remote host {} is available again'.format(host['name']))
+
+        host['failures'] = 0
+        host['open_until'] = 0
+        host['timeout'] = terrariumHTTPClient.BREAKER_TIMEOUT
+        return
+
+      host['failures'] += 1
+      if host['open_until'] > 0:
+        host['timeout'] = min(host['timeout'] * 2,terrariumHTTPClient.BREAKER_MAX_TIMEOUT)
+
+      if host['failures'] >= terrariumHTTPClient.BREAKER_THRESHOLD:
+        host['open_until'] = time() + host['timeout']
+        logger.warning('Remote host {} failed {} times in a row. Skipping requests for {} seconds'.format(host['name'],host['failures'],host['timeout']))
+
+  def __release(self, host):
+    host['concurrent'].release()
+    self.__concurrent.release()
+
+  def get(self, url, timeout = 3, proxy = None, headers = None, auth = None):
+    host = self.__get_host(url)
+    if not self.__breaker_allows(host):
+      logger.debug('Skipping request to {}, remote host is not available'.format(url))
+      return None
+
+    headers = {} if headers is None else dict(headers)
+    cached = self.__conditional_cache.get(url)
+    if cached is not None:
+      if cached['etag'] is not None:
+        headers['If-None-Match'] = cached['etag']
+      if cached['last_modified'] is not None:
+        headers['If-Modified-Since'] = cached['last_modified']
+
+    response = None
+    # Streams keep their connection, so the request slots are released when the stream is closed
+    self.__concurrent.acquire()
+    host['concurrent'].acquire()
+    try:
+      raw_response = host['session'].get(url,headers=headers,timeout=timeout,auth=auth,proxies={'http' : proxy, 'https' : proxy},stream=True)
+      if raw_response.status_code == 304:
+        raw_response.close()
+        if cached is not None:
+          response = terrariumHTTPResponse(200,cached['content_type'],cached['content'],cached['encoding'])
+        else:
+          # Nothing to serve for a not modified response. Request the full content once more
+          logger.debug('Got a not modified response from {} without cached content. Retry without conditional headers'.format(url))
+          headers.pop('If-None-Match',None)
+          headers.pop('If-Modified-Since',None)
+          raw_response = host['session'].get(url,headers=headers,timeout=timeout,auth=auth,proxies={'http' : proxy, 'https' : proxy},stream=True)
+          if raw_response.status_code == 304:
+            raw_response.close()
+            raise ValueError('not modified response without cached content')
+
+      if response is None:
+        content_type = raw_response.headers.get('content-type')
+        if content_type is not None and 'multipart/x-mixed-replace' in content_type:
+          # Endless stream, the caller reads what it needs and closes it
+          response = terrariumHTTPResponse(raw_response.status_code,content_type,stream=raw_response,on_close=lambda: self.__release(host))
+
+        else:
+          response = terrariumHTTPResponse(raw_response.status_code,content_type,raw_response.content,raw_response.encoding)
+          if raw_response.status_code == 200 and (raw_response.headers.get('etag') is not None or raw_response.headers.get('last-modified') is not None):
+            self.__conditional_cache.set(url,{'etag' : raw_response.headers.get('etag'),
+                                              'last_modified' : raw_response.headers.get('last-modified'),
+                                              'content_type' : content_type,
+                                              'content' : response.content,
+                                              'encoding' : response.encoding},terrariumHTTPClient.CONDITIONAL_CACHE_TIMEOUT)
+
+    except Exception as ex:
+      logger.warning('Error getting remote data from {}: {}'.format(url,ex))
+
+    finally:
+      if response is None or not response.is_stream():
+        self.__release(host)
+
+    self.__breaker_result(host,response is not None and response.status_code < 500)
+    return response
 
-  def set_running(self,hash_key):
-    self.__running[hash_key] = True
+  def get_stats(self):
+    with self.__lock:
+      hosts = dict((host['name'],{'failures' : host['failures'], 'available' : host['open_until'] == 0}) for host in self.__hosts.values())
 
-  def clear_running(self,hash_key):
-    del(self.__running[hash_key])
+    return {'hosts' : hosts, 'cache' : self.__conditional_cache.get_stats()}
 
 class terrariumUtils():
 
@@ -166,40 +461,92 @@ class terrariumUtils():
     return float(value) / 4.54609
 
   @staticmethod
-  def conver_to_value(current,indicator):
-    if not terrariumUtils.is_float(current):
-      return None
-
+  def get_value_converter(indicator):
+    # Function that converts a value in the internal unit to the unit of the indicator
     indicator = indicator.lower()
     if 'f' == indicator:
-      current = terrariumUtils.to_fahrenheit(current)
+      return terrariumUtils.to_fahrenheit
     elif 'k' == indicator:
-      current = terrariumUtils.to_kelvin(current)
+      return terrariumUtils.to_kelvin
     elif 'inch' == indicator:
-      current = terrariumUtils.to_inches(current)
+      return terrariumUtils.to_inches
     elif 'usgall' == indicator:
-      current = terrariumUtils.to_us_gallons(current)
+      return terrariumUtils.to_us_gallons
     elif 'ukgall' == indicator:
-      current = terrariumUtils.to_uk_gallons(current)
+      return terrariumUtils.to_uk_gallons
+
+    return float
+
+  @staticmethod
+  def conver_to_value(current,indicator):
+    if not terrariumUtils.is_float(current):
+      return None
+
+    return float(terrariumUtils.get_value_converter(indicator)(current))
+
+  # Scale and offset of every unit compared to the internal unit of the same kind (C, cm and L): unit = scale * internal + offset
+  UNIT_CONVERSIONS = {'c'      : (1.0, 0.0),
+                      'f'      : (9.0 / 5.0, 32.0),
+                      'k'      : (1.0, 273.15),
+                      'cm'     : (1.0, 0.0),
+                      'inch'   : (39.370078740157 / 100.0, 0.0),
+                      'l'      : (1.0, 0.0),
+                      'usgall' : (1.0 / 3.7854118, 0.0),
+                      'ukgall' : (1.0 / 4.54609, 0.0)}
+
+  @staticmethod
+  def get_unit_conversion(indicator_from, indicator_to):
+    # All supported conversions are linear, so a conversion is a single scale and offset. Unknown units are not converted
+    indicator_from = indicator_from.lower() if indicator_from is not None else None
+    indicator_to = indicator_to.lower() if indicator_to is not None else None
+    if indicator_from == indicator_to or indicator_from not in terrariumUtils.UNIT_CONVERSIONS or indicator_to not in terrariumUtils.UNIT_CONVERSIONS:
+      return (1.0, 0.0)
 
-    return float(current)
+    scale_from, offset_from = terrariumUtils.UNIT_CONVERSIONS[indicator_from]
+    scale_to, offset_to = terrariumUtils.UNIT_CONVERSIONS[indicator_to]
+    return (scale_to / scale_from, offset_to - offset_from * scale_to / scale_from)
 
   @staticmethod
   def convert_from_to(current, indicator_from, indicator_to):
-    indicator_from = indicator_from.lower()
-    indicator_to = indicator_to.lower()
+    if not terrariumUtils.is_float(current):
+      return current
+
+    scale, offset = terrariumUtils.get_unit_conversion(indicator_from, indicator_to)
+    return scale * float(current) + offset
+
+  @staticmethod
+  def convert_values_from_to(values, indicator_from, indicator_to):
+    # Convert a list of values in one go. Values that are not a number will be None
+    scale, offset = terrariumUtils.get_unit_conversion(indicator_from, indicator_to)
+    if 1.0 == scale and 0.0 == offset:
+      return list(values)
+
+    try:
+      # None values become NaN
+      converted = numpy.array(values,dtype=numpy.float64) * scale + offset
+      invalid = numpy.isnan(converted)
+      if not invalid.any():
+        return converted.tolist()
+
+      converted = converted.astype(object)
+      converted[invalid] = None
+      return converted.tolist()
+
+    except NameError:
+      pass # No numpy
+    except (ValueError, TypeError):
+      pass # Not all values are numbers
 
-    if 'c' == indicator_from:
-      pass # Nothing to do
-    elif 'f' == indicator_from:
-      current = terrariumUtils.to_celsius(current)
+    return [scale * float(value) + offset if terrariumUtils.is_float(value) else None for value in values]
 
-    if 'c' == indicator_to:
-      pass # Nothing to do
-    if 'f' == indicator_to:
-      current = terrariumUtils.to_fahrenheit(current)
+  @staticmethod
+  def convert_points_from_to(points, indicator_from, indicator_to):
+    # Convert graph points [timestamp, value] in one go. The timestamps are untouched
+    if len(points) == 0:
+      return points
 
-    return current
+    values = terrariumUtils.convert_values_from_to([point[1] for point in points], indicator_from, indicator_to)
+    return [[point[0], value] for point, value in zip(points, values)]
 
   @staticmethod
   def is_float(value):
@@ -316,45 +663,50 @@ class terrariumUtils():
 
     return time
 
+  @staticmethod
+  def get_json_path(data, path):
+    json_path = path.split('/') if path is not None and '' != path else []
+    for item in json_path:
+      # Dirty hack to process array data....
+      try:
+        item = int(item)
+      except Exception as ex:
+        item = str(item)
+
+      data = data[item]
+
+    return data
+
   @staticmethod
   def get_remote_data(url, timeout = 3, proxy = None, json = False):
     data = None
     try:
       url_data = terrariumUtils.parse_url(url)
-      proxies = {'http' : proxy, 'https' : proxy}
       headers = {}
       if json:
         headers['Accept'] = 'application/json'
 
-      if url_data['username'] is None:
-        response = requests.get(url,headers=headers,timeout=timeout,proxies=proxies,stream=True)
-      else:
-        response = requests.get(url,auth=(url_data['username'],url_data['password']),headers=headers,timeout=timeout,proxies=proxies,stream=True)
+      auth = None if url_data['username'] is None else (url_data['username'],url_data['password'])
+      response = terrariumHTTPClient().get(url,timeout,proxy,headers,auth)
 
-      if response.status_code == 200:
-        if 'multipart/x-mixed-replace' in response.headers['content-type']:
+      if response is not None and response.status_code == 200:
+        if 'multipart/x-mixed-replace' in response.content_type:
           # Motion JPEG stream....
           # https://stackoverflow.com/a/36675148
           frame = bytes()
-          for chunk in response.iter_content(chunk_size=1024):
-            frame += chunk
-            a = frame.find(b'\xff\xd8')
-            b = frame.find(b'\xff\xd9')
-            if a != -1 and b != -1:
-              return frame[a:b+2]
-
-        elif 'application/json' in response.headers['content-type']:
-          data = response.json()
-          json_path = url_data['fragment'].split('/') if 'fragment' in url_data and url_data['fragment'] is not None else []
-          for item in json_path:
-            # Dirty hack to process array data....
-            try:
-              item = int(item)
-            except Exception as ex:
-              item = str(item)
-
-            data = data[item]
-        elif 'text' in response.headers['content-type']:
+          try:
+            for chunk in response.iter_content(chunk_size=1024):
+              frame += chunk
+              a = frame.find(b'\xff\xd8')
+              b = frame.find(b'\xff\xd9')
+              if a != -1 and b != -1:
+                return frame[a:b+2]
+          finally:
+            response.close()
+
+        elif 'application/json' in response.content_type:
+          data = terrariumUtils.get_json_path(response.json(),url_data['fragment'] if 'fragment' in url_data else None)
+        elif 'text' in response.content_type:
           data = response.text
         else:
           data = response.content
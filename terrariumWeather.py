@@ -19,7 +19,7 @@ class terrariumWeatherSource(object):
   # Weather data expects temperature in celcius degrees and windspeed in meters per second
   UPDATE_TIMEOUT = 4 * 60 * 60
 
-  def __init__(self, source, temperature_indicator, windspeed_indicator, callback = None):
+  def __init__(self, source, temperature_indicator, windspeed_indicator, callback = None, state = None):
     logger.info('Initialising \'{}\' weather object'.format(self.get_type()))
     self.source   = None
     # Callback functions to engine settings
@@ -36,7 +36,12 @@ class terrariumWeatherSource(object):
     self.hour_forecast = {}
     self.week_forecast = {}
 
-    self.set_source(source,True)
+    # Skip the online update when there is recent weather data from a previous run
+    refresh = True
+    if state is not None:
+      refresh = not self.set_state(state,source)
+
+    self.set_source(source,refresh)
 
   def __update_weather_icons(self):
     for forecast in self.hour_forecast:
@@ -181,6 +186,34 @@ class terrariumWeatherSource(object):
   def get_config(self):
     return {'location' : self.get_source()}
 
+  def get_state(self):
+    return {'source' : self.get_source(),
+            'last_update' : self.get_last_update(),
+            'location' : self.location,
+            'credits' : self.credits,
+            'sun' : self.sun,
+            'hour_forecast' : self.hour_forecast,
+            'week_forecast' : self.week_forecast}
+
+  def set_state(self,state,source):
+    if state.get('source') != source.replace('http://','https://') or int(time.time()) - state.get('last_update',0) >= terrariumWeatherSource.UPDATE_TIMEOUT:
+      return False
+
+    try:
+      self.location = state['location']
+      self.credits = state['credits']
+      self.sun = state['sun']
+      # JSON turns the timestamp keys into strings
+      self.hour_forecast = dict((int(period),forecast) for period,forecast in state['hour_forecast'].items())
+      self.week_forecast = dict((int(period),forecast) for period,forecast in state['week_forecast'].items())
+      self.__last_update = int(state['last_update'])
+    except KeyError as ex:
+      logger.warning('Invalid previous weather state. Missing field {}'.format(ex))
+      return False
+
+    logger.info('Restored {} weather data from {}'.format(self.get_type(),datetime.fromtimestamp(self.get_last_update())))
+    return True
+
   def get_type(self):
     return terrariumWeatherSource.TYPE
 
@@ -423,10 +456,10 @@ class terrariumWeather(object):
              terrariumWeatherWunderground,
              terrariumWeatherOpenWeathermap]
 
-  def __new__(self,source, temperature_indicator, windspeed_indicator, callback = None):
+  def __new__(self,source, temperature_indicator, windspeed_indicator, callback = None, state = None):
     for weather_source in terrariumWeather.SOURCES:
       if re.search(weather_source.VALID_SOURCE, source, re.IGNORECASE):
-        return weather_source(source, temperature_indicator, windspeed_indicator, callback)
+        return weather_source(source, temperature_indicator, windspeed_indicator, callback, state)
 
     raise terrariumWeatherSourceException()
 
@@ -9,7 +9,6 @@ except ImportError as ex:
 
 import time
 import cv2
-import math
 import datetime
 import os
 import glob
@@ -18,6 +17,7 @@ import sys
 import subprocess
 import sys
 import shlex
+import json
 
 from picamera import PiCamera, PiCameraError
 from io import BytesIO
@@ -25,6 +25,7 @@ from PIL import Image, ImageDraw, ImageFont
 from hashlib import md5
 from shutil import copyfile
 from gevent import sleep
+from gevent.queue import Queue
 try:
   from subprocess import DEVNULL # py3k
 except ImportError:
@@ -32,6 +33,56 @@ except ImportError:
   DEVNULL = open(os.devnull, 'wb')
 
 from terrariumUtils import terrariumUtils
+from terrariumWebcamWorker import tile_image
+
+class terrariumWebcamWorkerPool(object):
+  # Pool of external Python processes for the CPU heavy image tiling. Workers are started when needed
+  WORKER_SCRIPT = 'terrariumWebcamWorker.py'
+
+  def __init__(self, size):
+    self.__size = max(1,int(size))
+    self.__workers = Queue()
+    for counter in range(self.__size):
+      self.__workers.put(None)
+
+    logger.info('Initialized webcam worker pool with {} processes'.format(self.__size))
+
+  def __start_worker(self):
+    return subprocess.Popen([sys.executable,terrariumWebcamWorkerPool.WORKER_SCRIPT],stdin=subprocess.PIPE,stdout=subprocess.PIPE,universal_newlines=True)
+
+  def run(self, job):
+    # Blocks (cooperatively) until a worker is available
+    worker = self.__workers.get()
+    try:
+      if worker is None or worker.poll() is not None:
+        worker = self.__start_worker()
+
+      worker.stdin.write(json.dumps(job) + '\n')
+      worker.stdin.flush()
+      result = json.loads(worker.stdout.readline())
+      if 'error' in result:
+        logger.warning('Webcam worker failed processing {}: {}'.format(job['raw_image'],result['error']))
+        return None
+
+      return result['max_zoom']
+
+    except Exception as ex:
+      logger.exception('Webcam worker crashed processing {}: {}'.format(job['raw_image'],ex))
+      if worker is not None:
+        worker.kill()
+      worker = None
+
+    finally:
+      self.__workers.put(worker)
+
+    return None
+
+  def stop(self):
+    while not self.__workers.empty():
+      worker = self.__workers.get()
+      if worker is not None and worker.poll() is None:
+        worker.stdin.close()
+        worker.wait()
 
 class terrariumWebcamSource(object):
   TYPE = None
@@ -49,6 +100,8 @@ class terrariumWebcamSource(object):
   ONLINE = 'online'
   UPDATE_TIMEOUT = 60
   VALID_ROTATIONS = ['0','90','180','270','h','v']
+  # Optional pool of worker processes for tiling. See terrariumWebcam.set_worker_pool
+  WORKER_POOL = None
 
   def __init__(self, webcam_id, location, name = '', rotation = '0', width = 640, height = 480, awb = 'auto', archive = False, archive_light = 'ignore', archive_door = 'ignore', environment = None):
     # Variables per webcam
@@ -98,73 +151,25 @@ class terrariumWebcamSource(object):
 
     self.update()
 
-  def __set_timestamp(self,image):
-    # Get the image dimensions
-    source_width, source_height = image.size
-    # Select font
-    font = ImageFont.truetype('fonts/DejaVuSans.ttf',terrariumWebcamSource.FONT_SIZE)
-    # Draw on image
-    draw = ImageDraw.Draw(image)
-    # Create black box on the bottom of the image
-    draw.rectangle([0,source_height-(terrariumWebcamSource.FONT_SIZE+2),source_width,source_height],fill='black')
-    # Draw the current time stamp on the image
-    draw.text((1, source_height-(terrariumWebcamSource.FONT_SIZE+1)), self.name + ' @ ' + (datetime.datetime.now()).strftime('%d/%m/%Y %H:%M:%S') ,(255,255,255),font=font)
-
   def __tile_image(self):
     starttime = time.time()
-    # Original width
-    source_width, source_height = self.raw_image.size
+    job = {'store_location' : terrariumWebcamSource.STORE_LOCATION,
+           'webcam_id' : self.get_id(),
+           'name' : self.name,
+           'tile_size' : terrariumWebcamSource.TILE_SIZE,
+           'jpeg_quality' : terrariumWebcamSource.JPEG_QUALITY,
+           'font_size' : terrariumWebcamSource.FONT_SIZE}
+
+    if terrariumWebcamSource.WORKER_POOL is not None:
+      # The worker process loads the raw image from disk, which is already stored at this point
+      job['raw_image'] = self.get_raw_image()
+      max_zoom = terrariumWebcamSource.WORKER_POOL.run(job)
+    else:
+      job['raw_image'] = self.raw_image
+      max_zoom = tile_image(**job)
 
-    # Calc new square canvas size
-    longest_side = float(source_width if source_width > source_height else source_height)
-    max_size = float(math.pow(2,math.ceil(math.log(longest_side,2))))
-
-    # Set canvas dimensions
-    canvas_width = canvas_height = max_size
-    resize_factor = max_size / longest_side
-    # Set raw image new dimensions
-    source_width *= resize_factor
-    source_height *= resize_factor
-
-    # Calculate the max zoom factor
-    zoom_factor = int(math.log(max_size/terrariumWebcamSource.TILE_SIZE,2))
-    self.__max_zoom = zoom_factor
-    logger.debug('Tiling image with source resolution %s, from %sx%s with resize factor %s in %s steps' %
-                  (self.resolution, source_width,source_height,resize_factor, zoom_factor))
-
-    # as long as there is a new layer, continue
-    while zoom_factor >= 0:
-      # Create black canvas on zoom factor dimensions
-      logger.debug('Creating new black canvas with dimensions %sx%s' % (canvas_width,canvas_height))
-      canvas = Image.new("RGB", ((int(round(canvas_width)),int(round(canvas_height)))), "black")
-      # Scale the raw image to the zoomfactor dimensions
-      logger.debug('Scale raw image to new canvas size (%sx%s)' % (canvas_width,canvas_height))
-      source = self.raw_image.resize((int(round(source_width)),int(round(source_height))))
-      # Set the timestamp on resized image
-      self.__set_timestamp(source)
-
-      # Calculate the center in the canvas for pasting raw image
-      paste_center_position = (int(round((canvas_width - source_width) / 2)),int(round((canvas_height - source_height) / 2)))
-      logger.debug('Pasting resized image to center of canvas at position %s' % (paste_center_position,))
-      canvas.paste(source,paste_center_position)
-
-      # Loop over the canvas to create the tiles
-      logger.debug('Creating the lose tiles with dimensions %sx%s' % (canvas_width, canvas_height,))
-      for row in range(0,int(math.ceil(canvas_height/terrariumWebcamSource.TILE_SIZE))):
-        for column in range(0,int(math.ceil(canvas_width/terrariumWebcamSource.TILE_SIZE))):
-          crop_size = ( int(row*terrariumWebcamSource.TILE_SIZE), int(column*terrariumWebcamSource.TILE_SIZE) ,int((row+1)*terrariumWebcamSource.TILE_SIZE), int((column+1)*terrariumWebcamSource.TILE_SIZE))
-          logger.debug('Cropping image from position %s' % (crop_size,))
-          tile = canvas.crop(crop_size)
-          logger.debug('Saving cropped image to %s' % (terrariumWebcamSource.TILE_LOCATION + self.__id + '_tile_' + str(zoom_factor) + '_' + str(row) + '_' + str(column) + '.jpg',))
-          tile.save(terrariumWebcamSource.STORE_LOCATION + self.get_id() + '/' + self.__id + '_tile_' + str(zoom_factor) + '_' + str(row) + '_' + str(column) + '.jpg','jpeg',quality=terrariumWebcamSource.JPEG_QUALITY)
-          logger.debug('Done saving %s' % (terrariumWebcamSource.TILE_LOCATION + self.__id + '_tile_' + str(zoom_factor) + '_' + str(row) + '_' + str(column) + '.jpg',))
-
-      # Scale down by 50%
-      canvas_width /= 2.0
-      canvas_height /= 2.0
-      source_width /= 2.0
-      source_height /= 2.0
-      zoom_factor -= 1
+    if max_zoom is not None:
+      self.__max_zoom = max_zoom
 
     logger.debug('Done tiling webcam image \'%s\' in %.5f seconds' % (self.get_name(),time.time()-starttime))
 
@@ -701,6 +706,13 @@ class terrariumWebcam(object):
 
     raise terrariumWebcamSourceException()
 
+  @staticmethod
+  def set_worker_pool(size):
+    if terrariumWebcamSource.WORKER_POOL is not None:
+      terrariumWebcamSource.WORKER_POOL.stop()
+
+    terrariumWebcamSource.WORKER_POOL = None if size is None or int(size) < 1 else terrariumWebcamWorkerPool(size)
+
   @staticmethod
   def valid_sources():
     data = {}
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# Webcam image processing that can run inside a separate worker process. The worker processes
+# do not load terrariumLogging, as that would start an extra notification system with display and traffic lights
+import logging
+logger = logging.getLogger(__name__)
+
+import sys
+import json
+import math
+import time
+import datetime
+
+from PIL import Image, ImageDraw, ImageFont
+
+def set_timestamp(image, name, font_size):
+  # Get the image dimensions
+  source_width, source_height = image.size
+  # Select font
+  font = ImageFont.truetype('fonts/DejaVuSans.ttf',font_size)
+  # Draw on image
+  draw = ImageDraw.Draw(image)
+  # Create black box on the bottom of the image
+  draw.rectangle([0,source_height-(font_size+2),source_width,source_height],fill='black')
+  # Draw the current time stamp on the image
+  draw.text((1, source_height-(font_size+1)), name + ' @ ' + (datetime.datetime.now()).strftime('%d/%m/%Y %H:%M:%S') ,(255,255,255),font=font)
+
+def tile_image(raw_image, store_location, webcam_id, name, tile_size, jpeg_quality, font_size):
+  starttime = time.time()
+  if not isinstance(raw_image,Image.Image):
+    raw_image = Image.open(raw_image)
+
+  # Original width
+  source_width, source_height = raw_image.size
+
+  # Calc new square canvas size
+  longest_side = float(source_width if source_width > source_height else source_height)
+  max_size = float(math.pow(2,math.ceil(math.log(longest_side,2))))
+
+  # Set canvas dimensions
+  canvas_width = canvas_height = max_size
+  resize_factor = max_size / longest_side
+  # Set raw image new dimensions
+  source_width *= resize_factor
+  source_height *= resize_factor
+
+  # Calculate the max zoom factor
+  zoom_factor = max_zoom = int(math.log(max_size/tile_size,2))
+  logger.debug('Tiling image from %sx%s with resize factor %s in %s steps' % (source_width,source_height,resize_factor, zoom_factor))
+
+  # as long as there is a new layer, continue
+  while zoom_factor >= 0:
+    # Create black canvas on zoom factor dimensions
+    canvas = Image.new("RGB", ((int(round(canvas_width)),int(round(canvas_height)))), "black")
+    # Scale the raw image to the zoomfactor dimensions
+    source = raw_image.resize((int(round(source_width)),int(round(source_height))))
+    # Set the timestamp on resized image
+    set_timestamp(source,name,font_size)
+
+    # Calculate the center in the canvas for pasting raw image
+    paste_center_position = (int(round((canvas_width - source_width) / 2)),int(round((canvas_height - source_height) / 2)))
+    canvas.paste(source,paste_center_position)
+
+    # Loop over the canvas to create the tiles
+    for row in range(0,int(math.ceil(canvas_height/tile_size))):
+      for column in range(0,int(math.ceil(canvas_width/tile_size))):
+        crop_size = ( int(row*tile_size), int(column*tile_size) ,int((row+1)*tile_size), int((column+1)*tile_size))
+        tile = canvas.crop(crop_size)
+        tile.save(store_location + webcam_id + '/' + webcam_id + '_tile_' + str(zoom_factor) + '_' + str(row) + '_' + str(column) + '.jpg','jpeg',quality=jpeg_quality)
+
+    # Scale down by 50%
+    canvas_width /= 2.0
+    canvas_height /= 2.0
+    source_width /= 2.0
+    source_height /= 2.0
+    zoom_factor -= 1
+
+  logger.debug('Done tiling webcam image \'%s\' in %.5f seconds' % (name,time.time()-starttime))
+  return max_zoom
+
+if __name__ == '__main__':
+  # Worker mode: one JSON job per line on stdin, one JSON result per line on stdout
+  for line in iter(sys.stdin.readline, ''):
+    try:
+      job = json.loads(line)
+      result = {'max_zoom' : tile_image(**job)}
+    except Exception as ex:
+      result = {'error' : str(ex)}
+
+    sys.stdout.write(json.dumps(result) + '\n')
+    sys.stdout.flush()
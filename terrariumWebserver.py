@@ -11,6 +11,7 @@ except ImportError as ex:
   import _thread
 import json
 import os
+import base64
 import datetime
 import hashlib
 import functools
@@ -27,6 +28,7 @@ from gevent import sleep
 from terrariumTranslations import terrariumTranslations
 from terrariumAudio import terrariumAudioPlayer
 from terrariumUtils import terrariumUtils
+from terrariumMetrics import terrariumMetrics
 
 class terrariumWebserverHeaders(object):
   name = 'webserver_headers'
@@ -55,6 +57,7 @@ class terrariumWebserver(object):
     self.__app = terrariumWebserver.app
     self.__config = self.__terrariumEngine.get_config('system')
     self.__caching_days = 30
+    self.__multi_process = terrariumUtils.is_true(self.__terrariumEngine.config.get_system().get('multi_process',False))
     terrariumWebserver.app.terrarium = self.__terrariumEngine
     # Load language
     gettext.translation('terrariumpi', 'locales/', languages=[self.__terrariumEngine.config.get_language()]).install(True)
@@ -119,6 +122,11 @@ class terrariumWebserver(object):
                      callback=self.__static_file,
                      apply=self.__authenticate(False))
 
+    self.__app.route('/metrics',
+                     method="GET",
+                     callback=self.__metrics,
+                     apply=self.__authenticate(False))
+
     self.__app.route('/api/<path:re:config.*>',
                      method=['GET'],
                      callback=self.__get_api_call,
@@ -130,6 +138,12 @@ class terrariumWebserver(object):
                      callback=self.__get_api_call,
                      apply=self.__authenticate(False))
 
+    # Push sensors authenticate with their device token
+    self.__app.route('/api/sensors/push',
+                     method=['POST'],
+                     callback=self.__push_sensor_data
+                    )
+
     self.__app.route('/api/reboot',
                      method=['POST'],
                      callback=self.__reboot,
@@ -196,6 +210,46 @@ class terrariumWebserver(object):
                      apply=auth_basic(self.__logout_authenticate,_('TerrariumPI') + ' ' + _('Authentication'),_('Authenticate to make any changes'))
                     )
 
+  def __metrics(self):
+    # Rendered in the webserver process, so scraping never waits on the engine. In multi process mode the engine process
+    # saves a snapshot of its metrics
+    response.headers['Content-Type'] = terrariumMetrics.CONTENT_TYPE
+    response.headers['Cache-Control'] = 'no-cache'
+    if self.__multi_process:
+      return terrariumMetrics.load_snapshot()
+
+    return terrariumMetrics().render()
+
+  def __push_sensor_data(self):
+    # Body is a single or a list of {"device" : "<device id>", "token" : "<token>", "readings" : {"<sensor type>" : <value>}}
+    # The token can also be send once in the header X-Auth-Token
+    postdata = request.json
+    if isinstance(postdata,dict):
+      postdata = [postdata]
+
+    if not isinstance(postdata,list) or len(postdata) == 0:
+      abort(400,'No sensor readings')
+
+    result = {'ok' : True, 'sensors' : [], 'errors' : []}
+    for item in postdata:
+      if not isinstance(item,dict) or not isinstance(item.get('readings'),dict):
+        result['errors'].append('Invalid readings {}'.format(item))
+        continue
+
+      updated = self.__terrariumEngine.push_sensor_data(item.get('device'),item.get('token',request.get_header('X-Auth-Token')),item['readings'])
+      if updated is None:
+        result['errors'].append('Unknown device \'{}\' or invalid token'.format(item.get('device')))
+        continue
+
+      result['sensors'] += updated
+
+    if len(result['errors']) > 0:
+      result['ok'] = False
+      if len(result['errors']) == len(postdata):
+        response.status = 403
+
+    return result
+
   def __reboot(self):
     terrariumUtils.get_script_data('sudo reboot')
 
@@ -363,7 +417,24 @@ class terrariumWebserver(object):
       result = self.__terrariumEngine.get_calendar(parameters,**{'start':request.query.get('start'),'end':request.query.get('end')})
 
     elif 'sensors' == action:
-      result = self.__terrariumEngine.get_sensors(parameters)
+      if len(parameters) >= 2 and parameters[1] in ['frame','frames']:
+        # /api/sensors/<id>/frame[/png|binary] or /api/sensors/<id>/frames[/png|binary] for the history
+        result = self.__terrariumEngine.get_sensor_frames(parameters[0],'frames' == parameters[1],parameters[2] if len(parameters) > 2 else 'json')
+        if result is None:
+          abort(404,'No frames available for sensor {}'.format(parameters[0]))
+
+        if 'data' in result:
+          response.headers['Content-Type'] = result['content_type']
+          return base64.b64decode(result['data'])
+
+      elif len(parameters) >= 2 and 'health' == parameters[1]:
+        # /api/sensors/<id>/health
+        result = self.__terrariumEngine.get_sensor_health(parameters[0])
+        if result is None:
+          abort(404,'Sensor {} does not exist'.format(parameters[0]))
+
+      else:
+        result = self.__terrariumEngine.get_sensors(parameters)
 
     elif 'webcams' == action:
       result = self.__terrariumEngine.get_webcams(parameters)
@@ -399,6 +470,9 @@ class terrariumWebserver(object):
     elif 'system' == action:
       result = self.__terrariumEngine.get_system_stats()
 
+    elif 'startup' == action:
+      result = self.__terrariumEngine.get_startup_status()
+
     elif 'config' == action:
       # TODO: New way of data processing.... fix other config options
       result = self.__terrariumEngine.get_config(parameters[0] if len(parameters) == 1 else None)
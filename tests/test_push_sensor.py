@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import unittest
+
+# Run from the TerrariumPI folder: python -m unittest discover tests
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from terrariumSensor import terrariumSensor
+
+class terrariumPushSensorTest(unittest.TestCase):
+  TOKEN = 's3cr3t-push-token'
+
+  def setUp(self):
+    self.sensor = terrariumSensor(None,'push','temperature','greenhouse,' + terrariumPushSensorTest.TOKEN,'Greenhouse',lambda sensor_type: 'C')
+
+  def test_get_data_without_token(self):
+    data = self.sensor.get_data()
+    self.assertEqual(data['address'],'greenhouse')
+    for field, value in data.items():
+      self.assertNotIn(terrariumPushSensorTest.TOKEN,str(value),'Token found in field {}'.format(field))
+
+  def test_valid_token(self):
+    self.assertEqual(self.sensor.get_device_id(),'greenhouse')
+    self.assertTrue(self.sensor.is_valid_token(terrariumPushSensorTest.TOKEN))
+    self.assertFalse(self.sensor.is_valid_token('wrong'))
+    self.assertFalse(self.sensor.is_valid_token(None))
+
+  def test_address_without_token_keeps_token(self):
+    # The settings form only knows the device id
+    self.sensor.set_address('greenhouse')
+    self.assertTrue(self.sensor.is_valid_token(terrariumPushSensorTest.TOKEN))
+
+  def test_no_token(self):
+    sensor = terrariumSensor(None,'push','temperature','greenhouse','Greenhouse',lambda sensor_type: 'C')
+    self.assertIsNone(sensor.get_token())
+    self.assertFalse(sensor.is_valid_token(''))
+
+if __name__ == '__main__':
+  unittest.main()
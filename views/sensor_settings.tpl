@@ -45,6 +45,9 @@
               <li>
                 <strong>{{_('Current')}}</strong>: {{translations.get_translation('sensor_field_current')}}
               </li>
+              <li>
+                <strong>{{_('Filter')}}</strong>: {{!translations.get_translation('sensor_field_filter')}}
+              </li>
             </ul>
           </div>
         </div>
@@ -116,6 +119,7 @@
                                 <option value="ytxx-digital">{{_('YTXX-digital')}}</option>
                                 <option value="remote">{{_('Remote')}}</option>
                                 <option value="script">{{_('Custom script')}}</option>
+                                <option value="push">{{_('Push')}}</option>
                                 <option value="hc-sr04">{{_('HC-SR04')}}</option>
                                 <option value="sku-sen0161">{{_('pH SKU-SEN0161')}}</option>
                                 <option value="veml6075">{{_('VEML6075')}}</option>
@@ -185,6 +189,12 @@
                             <input class="form-control" name="sensor_[nr]_current" placeholder="{{_('Current')}}" readonly="readonly" type="text" data-toggle="tooltip" data-placement="bottom" title="" data-original-title="{{translations.get_translation('sensor_field_current')}}">
                           </div>
                         </div>
+                        <div class="row">
+                          <div class="col-md-4 col-sm-4 col-xs-12 form-group">
+                            <label for="sensor_[nr]_filter">{{_('Filter')}}</label>
+                            <input class="form-control" name="sensor_[nr]_filter" placeholder="{{_('Filter')}}" type="text" pattern="[a-zA-Z]+(:[0-9\.,]*)?" data-toggle="tooltip" data-placement="bottom" title="" data-original-title="{{!translations.get_translation('sensor_field_filter')}}">
+                          </div>
+                        </div>
                         <div class="row chirp_calibration" style="display:none;">
                           <div class="col-md-4 col-sm-4 col-xs-4 form-group">
                             <label for="sensor_[nr]_min_moist">{{_('Min moist value')}}</label>